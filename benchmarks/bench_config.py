@@ -0,0 +1,75 @@
+"""bench_config.py - compares the flat_config loader against the vendored ConfigObj parser:
+import time, and reading and writing the sample scanner configuration and a synthetic
+configuration of many sections.
+
+Usage:  python -m benchmarks.bench_config [number of sections]
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import io
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import time
+from models import flat_config
+from models.configobj import ConfigObj
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLECONFIG = os.path.join(ROOT, 'tests', 'support_files', 'sample_config.cfg')
+
+def make_config(num_sections):
+    """Writes a temporary configuration file of num_sections sections of commented values,
+    returns the name of the file.  Caller responsible for deleting the file."""
+    fd, fname = tempfile.mkstemp(suffix=".cfg")
+    with os.fdopen(fd, "wb") as fid:
+        for section in range(num_sections):
+            fid.write("# Settings for device {0}\n[Device{0}]\n".format(section).encode('utf-8'))
+            for key in range(10):
+                fid.write("setting{0} = {1}# Setting {0} of device {2}\n".format(key, key * 1.5, section).encode('utf-8'))
+            fid.write(b"\n")
+    return fname
+
+def time_calls(fn, repeats):
+    """Returns the mean time in seconds of repeats calls to fn()"""
+    start = time.time()
+    for i in range(repeats):
+        fn()
+    return (time.time() - start) / repeats
+
+def time_import(module):
+    """Returns the time in seconds to import the specified module in a new interpreter, less
+    the time to start the interpreter"""
+    def run(statement):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", statement], cwd=ROOT)
+        return time.time() - start
+    baseline = min(run("pass") for i in range(5))
+    return min(run("import {0}".format(module)) for i in range(5)) - baseline
+
+def compare(config_fname, repeats):
+    """Prints the times to read and write the configuration file with each parser"""
+    print("Configuration:  {0} ({1:.1f} kB)".format(config_fname, os.path.getsize(config_fname) / 1e3))
+    for name, parse in [("ConfigObj", ConfigObj), ("flat_config", flat_config.FlatConfig)]:
+        read_time = time_calls(lambda: parse(config_fname), repeats)
+        cfg = parse(config_fname)
+        write_time = time_calls(lambda: cfg.write(io.BytesIO()), repeats)
+        print("{0}:  read {1:.2f}ms, write {2:.2f}ms".format(name, read_time * 1e3, write_time * 1e3))
+
+def main(num_sections=1000):
+    print("Import:  configobj {0:.1f}ms, flat_config {1:.1f}ms".format(time_import("models.configobj") * 1e3,
+                                                                   time_import("models.flat_config") * 1e3))
+    compare(SAMPLECONFIG, 1000)
+    config_fname = make_config(num_sections)
+    try:
+        compare(config_fname, 10)
+    finally:
+        os.remove(config_fname)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,65 @@
+"""bench_scan_reader.py - compares the scan_reader module against np.genfromtxt
+on a copy of the sample scan scaled up to millions of rows.
+
+Usage:  python -m benchmarks.bench_scan_reader [number of rows]
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+import sys
+import tempfile
+import time
+import numpy as np
+from models import scan_reader
+
+SAMPLEINPUTDATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'tests', 'support_files', 'sample_data.csv')
+
+def make_scan(num_rows):
+    """Writes a temporary scan file of (at least) num_rows rows by repeating the sample scan,
+    returns the name of the file.  Caller responsible for deleting the file."""
+    header = []
+    body = []
+    with open(SAMPLEINPUTDATA, "rb") as fid:
+        for line in fid:
+            if line.startswith(b"#"):
+                header.append(line)
+            else:
+                body.append(line)
+    body = b"".join(body)
+    if not body.endswith(b"\n"):
+        body += b"\n"
+    repeats = int(np.ceil(float(num_rows) / body.count(b"\n")))
+    fd, fname = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(fd, "wb") as fid:
+        fid.write(b"".join(header))
+        for i in range(repeats):
+            fid.write(body)
+    return fname
+
+def time_call(fn, *args):
+    """Returns the time in seconds to call fn(*args) and its return value"""
+    start = time.time()
+    result = fn(*args)
+    return time.time() - start, result
+
+def main(num_rows=2000000):
+    data_file = make_scan(num_rows)
+    try:
+        print("Scan file:  {0} ({1:.1f} MB)".format(data_file, os.path.getsize(data_file) / 1e6))
+        fast_time, fast = time_call(scan_reader.read_scan, data_file)
+        print("scan_reader.read_scan:  {0:.2f}s ({1} rows)".format(fast_time, fast[0].size))
+        slow_time, slow = time_call(lambda f: np.genfromtxt(f, delimiter=",", unpack=True), data_file)
+        print("np.genfromtxt:  {0:.2f}s ({1} rows)".format(slow_time, slow[0].size))
+        identical = all(np.array_equal(a, b) for a, b in zip(fast, slow))
+        print("Speedup:  {0:.1f}x, identical values:  {1}".format(slow_time / fast_time, identical))
+    finally:
+        os.remove(data_file)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -4,19 +4,61 @@
 Chris R. Coughlin (TRI/Austin, Inc.)
 """
 
-from flask import Flask, flash, g, jsonify, render_template, request, session, url_for, redirect
+from flask import Flask, Response, flash, g, jsonify, render_template, request, send_file, send_from_directory, session, url_for, redirect
+import base64
+import ctypes
 import datetime
+import errno
 from functools import wraps
 import json
 import os.path
 import os
+import shutil
 import tempfile
-from zipfile import ZipFile
-from models import gocator_model
+import threading
+import time
+import uuid
+from models import scan_reader
+from models.device_manager import DeviceManager
+from models.plot_cache import PlotCache
+from models.render_jobs import RenderJobs, compress_cataloged, render_profile, render_tiles
+from models.retention import RetentionPolicy, RetentionSweeper
+from models.scan_catalog import ScanCatalog
+from models.scan_registry import ScanRegistry
+from models.tiles import TEMP_PREFIX, current_version
+from models.zip_cache import ZipCache
+from models.zip_stream import ZipStream
 
 app = Flask(__name__)
 app.config.from_object('config')
-model = gocator_model.GocatorModel()
+devices = DeviceManager(app.config.get('DEVICES'))
+plot_cache = None
+if app.config.get('PLOTCACHE_MAXBYTES', 0) > 0:
+    plot_cache = PlotCache(app.config['OUTPUTIMAGEPATH'], app.config['PLOTCACHE_MAXBYTES'])
+for device_model in devices:
+    device_model.plot_cache = plot_cache
+    device_model.log_max_bytes = app.config.get('LOG_MAX_BYTES', device_model.log_max_bytes)
+    device_model.log_backups = app.config.get('LOG_BACKUPS', device_model.log_backups)
+    device_model.persistent_profiler = app.config.get('PROFILER_PERSISTENT', False)
+    if device_model.persistent_profiler:
+        device_model.start_profiler(wait=False)
+# Model of the default device, used by the URLs that don't name a device
+model = devices.default
+render_jobs = RenderJobs(app.config.get('RENDER_WORKERS', 1))
+scans = ScanRegistry()
+zip_cache = ZipCache(os.path.join(app.config['OUTPUTDATAPATH'], ".zipcache"))
+catalog = ScanCatalog(app.config.get('CATALOG_PATH', os.path.join(app.config['OUTPUTDATAPATH'], "catalog.sqlite")))
+catalog.reconcile(app.config['OUTPUTDATAPATH'])
+retention = RetentionPolicy(app.config.get('RETENTION_MAX_BYTES'), app.config.get('RETENTION_MAX_AGE'),
+                            app.config.get('RETENTION_MAX_COUNT'))
+# Serializes retention sweeps (the sweeper thread and any direct calls)
+sweep_lock = threading.Lock()
+# Number of recent scans used to estimate the size of the next scan
+RECENT_SCANS = 10
+# Size of the blocks of compressed scans decompressed for downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Most bytes of a log returned by a single request
+MAX_LOG_CHUNK = 1024 * 1024
 
 def temp_fname(fldr, ext):
     """Wrapper for generating a NamedTemporaryFile in the specified folder with the
@@ -33,13 +75,116 @@ def temp_image_fname():
     return temp_fname(fldr=app.config['OUTPUTIMAGEPATH'], ext=".png")
 
 def list_data_files():
-    """Returns a list of the CSV files currently on the controller"""
-    return [fname for fname in os.listdir(app.config['OUTPUTDATAPATH']) if fname.endswith("csv")]
+    """Returns a list of the CSV files currently on the controller, newest first"""
+    return catalog.names()
 
 def list_plot_files():
     """Returns a list of the bitmap plot files currently on the controller"""
     return [fname for fname in os.listdir(app.config['OUTPUTIMAGEPATH']) if fname.endswith("png")]
 
+def list_sidecar_files():
+    """Returns a list of the binary copies and metadata of the data files currently on the controller"""
+    return [fname for fname in os.listdir(app.config['OUTPUTDATAPATH'])
+            if fname.endswith((scan_reader.SIDECAR_EXTENSION, scan_reader.METADATA_EXTENSION))]
+
+def list_tile_folders():
+    """Returns a list of the tile pyramid folders currently on the controller, excluding the
+    temporary folders of pyramids still being built"""
+    return [fname for fname in os.listdir(app.config['OUTPUTIMAGEPATH'])
+            if os.path.isdir(os.path.join(app.config['OUTPUTIMAGEPATH'], fname)) and not fname.startswith(TEMP_PREFIX)]
+
+def is_tile_path(fname):
+    """Returns True if the specified path (relative to the image folder) is a tile pyramid's .dzi
+    descriptor or one of its tiles, which never change once published"""
+    fname = fname.replace(os.sep, '/')
+    return fname.endswith(".dzi") or "_files/" in fname
+
+def static_url(fname):
+    """Returns the URL of the specified file in the static folder"""
+    return url_for('static', filename=os.path.relpath(fname, app.static_folder).replace(os.sep, '/'))
+
+def free_space(folder):
+    """Returns the number of bytes available in the file system of the specified folder"""
+    if os.name == 'nt':
+        free_bytes = ctypes.c_ulonglong(0)
+        if not ctypes.windll.kernel32.GetDiskFreeSpaceExW(ctypes.c_wchar_p(folder), ctypes.byref(free_bytes),
+                                                          None, None):
+            raise ctypes.WinError()
+        return free_bytes.value
+    stats = os.statvfs(folder)
+    return stats.f_bavail * stats.f_frsize
+
+def expected_scan_size():
+    """Returns the disk space in bytes a new scan is expected to need:  the largest of the recent
+    scans and its binary copy, plus config.py's SCAN_RESERVE_BYTES"""
+    largest = max([0] + [entry['size'] + entry['point_count'] * scan_reader.SIDECAR_BYTES_PER_POINT
+                         for entry in catalog.query(limit=RECENT_SCANS)])
+    return largest + app.config.get('SCAN_RESERVE_BYTES', 0)
+
+def scan_files(name, entry=None):
+    """Returns the files of the named scan (with the specified catalog entry, if known) and those
+    derived from it:  its binary copy, metadata and plot, and the folder of its tile pyramid.  Plots
+    shared through the plot cache aren't included, they're left to the cache."""
+    data_path = entry['path'] if entry is not None else os.path.join(app.config['OUTPUTDATAPATH'], name)
+    fnames = [data_path, scan_reader.sidecar_fname(data_path), scan_reader.metadata_fname(data_path)]
+    if entry is not None and entry['plot_path'] is not None:
+        fnames.append(entry['plot_path'])
+    tile_folder = os.path.join(app.config['OUTPUTIMAGEPATH'], os.path.basename(scan_reader.scan_root(name)))
+    return fnames, tile_folder
+
+def folder_size(folder):
+    """Returns the total size in bytes of the files in the specified folder and its subfolders"""
+    total_bytes = 0
+    for subfolder, subfolders, fnames in os.walk(folder):
+        for fname in fnames:
+            try:
+                total_bytes += os.path.getsize(os.path.join(subfolder, fname))
+            except OSError: # removed in the meantime
+                pass
+    return total_bytes
+
+def remove_file(fname):
+    """Removes the specified file, if it still exists"""
+    try:
+        os.remove(fname)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+def remove_scan(name):
+    """Removes the named scan and everything derived from it:  its binary copy, metadata, plot,
+    tile pyramid, cached ZIP member and catalog entry.  Files that have already gone are skipped."""
+    entry = catalog.get(name)
+    catalog.remove(name)
+    fnames, tile_folder = scan_files(name, entry)
+    for fname in fnames:
+        remove_file(fname)
+    try:
+        shutil.rmtree(tile_folder)
+    except OSError:
+        if os.path.isdir(tile_folder):
+            raise
+    zip_cache.remove(fnames[0])
+
+def sweep_scans():
+    """Removes the scans the retention policy no longer allows, returns their names.  Only one sweep
+    runs at a time.  Sizes come from the catalog, which is updated as the files derived from a scan
+    are written, so sweeping doesn't read the data folders."""
+    if not retention.enabled:
+        return []
+    with sweep_lock:
+        # Scans still being recorded, or read by plot, tile or compression jobs
+        protected = render_jobs.pending_subjects()
+        protected.update(os.path.basename(record.data_path) for record in scans.active_scans() if record.data_path)
+        evicted = retention.select(catalog.list(), protected=protected)
+        for name in evicted:
+            remove_scan(name)
+        return evicted
+
+sweeper = RetentionSweeper(sweep_scans, app.config.get('RETENTION_SWEEP_INTERVAL', 600))
+if retention.enabled:
+    sweeper.start()
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -49,13 +194,30 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/')
-def index():
+def with_device(f):
+    """Passes the model of the device named by the URL's device_id (the default device if none)
+    to the view in place of the device_id.  Responds with 404 if the device is unknown."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        device_model = devices.get(kwargs.pop('device_id', None))
+        if device_model is None:
+            response = jsonify({"error":"Unknown device"})
+            response.status_code = 404
+            return response
+        return f(device_model, *args, **kwargs)
+    return decorated_function
+
+@app.route('/', defaults={'device_id':None})
+@app.route('/devices/<device_id>/')
+@with_device
+def index(model):
     """Main entry page for the Hole Quality Scanner"""
-    return render_template('index.html')
+    return render_template('index.html', device_id=model.device_id)
 
-@app.route('/trigger_config', methods=['GET', 'POST'])
-def trigger_config():
+@app.route('/trigger_config', methods=['GET', 'POST'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/trigger_config', methods=['GET', 'POST'])
+@with_device
+def trigger_config(model):
     """GET/POST current Gocator 20x0 trigger config (JSON)"""
     if request.method == 'GET':
         return jsonify(model.get_configured_trigger())
@@ -75,16 +237,20 @@ def trigger_config():
         flash("Configuration successful", "success")
     else:
         flash("Configuration failed", "error")
-    return url_for('index')
+    return url_for('index', device_id=model.device_id)
 
-@app.route('/trigger', methods=['GET'])
+@app.route('/trigger', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/trigger', methods=['GET'])
 @login_required
-def trigger():
+@with_device
+def trigger(model):
     """View/edit current trigger config"""
-    return render_template('trigger.html')
+    return render_template('trigger.html', device_id=model.device_id)
 
-@app.route('/encoder_config', methods=['GET', 'POST'])
-def encoder_config():
+@app.route('/encoder_config', methods=['GET', 'POST'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/encoder_config', methods=['GET', 'POST'])
+@with_device
+def encoder_config(model):
     """GET/POST current Gocator 20x0 encoder config (JSON)"""
     if request.method == 'GET':
         return jsonify(model.get_configured_encoder())
@@ -99,27 +265,60 @@ def encoder_config():
         flash("Configuration successful", "success")
     else:
         flash("Configuration failed", "failed")
-    return url_for('index')
+    return url_for('index', device_id=model.device_id)
 
-@app.route('/encoder', methods=['GET'])
+@app.route('/encoder', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/encoder', methods=['GET'])
 @login_required
-def encoder():
+@with_device
+def encoder(model):
     """View/edit current encoder config"""
-    return render_template('encoder.html')
+    return render_template('encoder.html', device_id=model.device_id)
+
+def read_log(model, log, args):
+    """Returns a JSON-friendly dict of a chunk of the specified device's scanner log according to the
+    specified query arguments:  backup, before, lines and bytes (see GocatorModel.read_scanner_log).
+    Raises ValueError if an argument is invalid."""
+    before = args.get('before')
+    max_bytes = min(int(args.get('bytes', app.config.get('LOG_TAIL_BYTES', 64 * 1024))), MAX_LOG_CHUNK)
+    max_lines = args.get('lines', app.config.get('LOG_TAIL_LINES', 500))
+    if max_bytes < 1:
+        raise ValueError("bytes must be positive")
+    chunk = model.read_scanner_log(log, int(args.get('backup', 0)), int(before) if before else None,
+                                   int(max_lines) if max_lines else None, max_bytes)
+    chunk['text'] = chunk['text'].decode('utf-8', 'replace')
+    return chunk
+
+@app.route('/logs', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/logs', methods=['GET'])
+@with_device
+def logs(model):
+    """Displays the ends of the current output and error logs, older lines are loaded from /api/logs"""
+    output_log, error_log = read_log(model, 'output', {}), read_log(model, 'error', {})
+    return render_template('logs.html', output_log=output_log, error_log=error_log, device_id=model.device_id)
 
-@app.route('/logs', methods=['GET'])
-def logs():
-    """Displays current output and error logs"""
-    output_log, error_log = model.get_scanner_logs()
-    return render_template('logs.html', output_log=output_log, error_log=error_log)
+@app.route('/api/logs', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/api/logs', methods=['GET'])
+@with_device
+def api_logs(model):
+    """Returns JSON of a chunk of the output or error log (the 'log' query argument), see read_log
+    for the other query arguments.  Pass the 'older' backup and offset to fetch the preceding chunk."""
+    try:
+        return jsonify(read_log(model, request.args.get('log', 'output'), request.args))
+    except ValueError as err:
+        response = jsonify({"error":str(err)})
+        response.status_code = 400
+        return response
 
-@app.route('/clearlogs', methods=['GET'])
+@app.route('/clearlogs', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/clearlogs', methods=['GET'])
 @login_required
-def clearlogs():
+@with_device
+def clearlogs(model):
     """Erases the current output and error logs"""
     model.clear_scanner_logs()
     flash("Logs cleared")
-    return redirect(url_for('index'))
+    return redirect(url_for('index', device_id=model.device_id))
 
 @app.route('/help', methods=['GET'])
 def help():
@@ -131,43 +330,333 @@ def tri():
     """Displays basic info about TRI"""
     return render_template('tri.html')
 
-@app.route('/scan', methods=['POST'])
-def scan():
+def client_id():
+    """Returns the id of the current client's session, used to identify the owner of a scan"""
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return session['client_id']
+
+def scan_key(model):
+    """Returns the session key of the id of the client's scan on the specified device"""
+    if model.device_id is None:
+        return 'scan_id'
+    return 'scan_id_{0}'.format(model.device_id)
+
+@app.route('/scan', methods=['POST'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/scan', methods=['POST'])
+@with_device
+def scan(model):
     """Initiate profiling"""
-    session['get_plot'] = request.form.get('get_plot', 'false').lower() 
-    session['get_data'] = request.form.get('get_data', 'true').lower() 
+    settings = {'get_plot':request.form.get('get_plot', 'false').lower(),
+                'get_data':request.form.get('get_data', 'true').lower()}
     scan_comments = request.form.get('scan_comments', None)
-    session['data_path'] = temp_data_fname()
-    session['image_path'] = temp_image_fname()
-    response = {"scanning":model.start_scanner(session['data_path'], scan_comments)}
+    available, needed = free_space(app.config['OUTPUTDATAPATH']), expected_scan_size()
+    if available < needed:
+        return jsonify({"scanning":False,
+                        "error":"Insufficient disk space:  {0:.1f} MB free, {1:.1f} MB needed".format(
+                            available / 1048576., needed / 1048576.)})
+    record = scans.begin(client_id(), mode='scan', device_id=model.device_id, data_path=temp_data_fname(),
+                         image_path=temp_image_fname(), comments=scan_comments, settings=settings)
+    if record is None:
+        return jsonify({"scanning":False, "error":"Scanner in use"})
+    session[scan_key(model)] = record.scan_id
+    try:
+        preview_file = None
+        if app.config.get('PREVIEW_INTERVAL', 0) > 0:
+            preview_file = os.path.join(app.config['OUTPUTIMAGEPATH'], "preview_{0}.png".format(record.scan_id))
+        scanning = model.start_scanner(record.data_path, scan_comments, preview_file=preview_file,
+                                       preview_interval=app.config.get('PREVIEW_INTERVAL'))
+    except Exception as err:
+        scans.update(record.scan_id, state='failed', error=str(err))
+        raise
+    scans.update(record.scan_id, state='scanning' if scanning else 'failed')
+    response = {"scanning":scanning, "scan":record.scan_id}
     return jsonify(response)
 
-@app.route('/stopscan', methods=['POST'])
-def stopscan():
-    """Stops profiling.  Returns JSON data with URLs for the raw data and a PNG plot of same."""
+@app.route('/stopscan', methods=['POST'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/stopscan', methods=['POST'])
+@with_device
+def stopscan(model):
+    """Stops profiling.  Returns JSON data with the URL for the raw data and, if a plot was requested,
+    the id and status URL of the job producing the plot."""
+    record = scans.claim(session.get(scan_key(model)), client_id(), force=session.get('logged_in', False))
+    if record is None:
+        return jsonify({"scanning":False, "error":"No scan in progress"})
     try:
         model.stop_scanner()
-        if session['get_plot'] == 'true':
-            model.profile(session['data_path'], session['image_path'])
+        data_path = scan_reader.stored_fname(record.data_path)
+        if not os.path.exists(data_path):
+            scans.update(record.scan_id, state='failed', error="No profile data recorded")
+            return jsonify({"scanning":False, "error":"No profile data recorded"})
+        metadata = scan_reader.read_metadata(data_path)
+        if metadata is not None:
+            num_points = metadata['num_points']
+        else:
+            num_points = scan_reader.count_points(data_path)
+        scans.update(record.scan_id, state='stopped', num_points=num_points, data_path=data_path)
+        catalog_scan(record)
         response = {"scanning":False,
-                    "image":url_for('static', filename='data/img/{0}'.format(os.path.basename(session['image_path']))),
-                    "data":url_for('static', filename='data/{0}'.format(os.path.basename(session['data_path'])))}
-    except IOError: # no data recorded
+                    "scan":record.scan_id,
+                    "data":url_for('download_scan', scan_name=os.path.basename(record.data_path)),
+                    "metadata":metadata}
+        if record.settings.get('get_plot') == 'true':
+            job_id = submit_profile(record.data_path, record.image_path, model.device_id)
+            record.jobs['plot'] = job_id
+            scan_name = os.path.basename(record.data_path)
+            render_jobs.on_done(job_id, lambda plot_path: catalog_plot(scan_name, plot_path))
+            response['job'] = job_id
+            response['job_url'] = url_for('job_status', job_id=job_id)
+        if app.config.get('BUILD_TILES', False):
+            scan_name = os.path.basename(scan_reader.scan_root(record.data_path))
+            job_id = submit_tiles(record.data_path, model.device_id)
+            record.jobs['tiles'] = job_id
+            response['tiles_job'] = job_id
+            response['tiles_job_url'] = url_for('job_status', job_id=job_id)
+            response['tiles_viewer'] = url_for('view_tiles', scan_name=scan_name)
+        if app.config.get('SCAN_COMPRESSION') is not None:
+            # Compressed once the plot and tiles have been read from the uncompressed scan
+            job_id = submit_compression(record.data_path, app.config['SCAN_COMPRESSION'], after=record.jobs.values())
+            record.jobs['compression'] = job_id
+            response['compression_job'] = job_id
+            response['compression_job_url'] = url_for('job_status', job_id=job_id)
+        # Evicts old scans in the background rather than holding up the response, once the jobs
+        # reading this scan have been queued so that it's protected
+        sweeper.wake()
+    except Exception as err: # e.g. unable to catalog the scan - free the scanner for the next scan
+        scans.update(record.scan_id, state='failed', error=str(err))
         response = {"scanning":False,
-                    "error":"No profile data recorded"}
-    finally:    
-        return jsonify(response)
+                    "scan":record.scan_id,
+                    "error":str(err) or err.__class__.__name__}
+    return jsonify(response)
+
+def catalog_scan(record):
+    """Adds the specified finished scan to the catalog, with a snapshot of its device's configuration"""
+    device_model = devices.get(record.device_id)
+    config_snapshot = json.dumps({'device':record.device_id,
+                                  'trigger':device_model.get_configured_trigger(),
+                                  'encoder':device_model.get_configured_encoder()})
+    catalog.add(record.data_path, created=record.started, point_count=record.num_points,
+                comment=record.comments, config_snapshot=config_snapshot)
+
+def catalog_plot(name, plot_path):
+    """Records the plot of the named scan in the catalog:  the key of a plot in the plot cache, which
+    may be evicted from the cache and is regenerated when next requested (see scan_plot), otherwise the
+    scan's own plot file, whose size counts against the scan's"""
+    plot_key = plot_cache.key_of(plot_path) if plot_cache is not None else None
+    if plot_key is not None:
+        catalog.update(name, plot_key=plot_key, plot_path=None)
+    elif catalog.update(name, plot_key=None, plot_path=plot_path):
+        catalog.add_derived(name, os.path.getsize(plot_path))
+
+@app.route('/scans/<scan_id>', methods=['GET'])
+def scan_status(scan_id):
+    """Returns JSON status of the specified scan"""
+    record = scans.get(scan_id)
+    if record is None:
+        response = jsonify({"error":"Unknown scan"})
+        response.status_code = 404
+        return response
+    status = record.as_dict()
+    status['owned'] = record.owner == client_id()
+    return jsonify(status)
+
+def device_status(model):
+    """Returns a JSON-friendly dict of whether the specified device is in use, and if so by which scan"""
+    record = scans.active(model.device_id)
+    status = {"device":model.device_id, "busy":record is not None}
+    if record is not None:
+        status['scan'] = record.scan_id
+        status['mode'] = record.mode
+        status['owned'] = record.owner == client_id()
+    return status
+
+@app.route('/scanner', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/scanner', methods=['GET'])
+@with_device
+def scanner_status(model):
+    """Returns JSON status of the scanner:  whether it's in use, and if so by which scan"""
+    return jsonify(device_status(model))
 
-@app.route('/target', methods=['POST'])
-def target():
+@app.route('/api/devices', methods=['GET'])
+def api_devices():
+    """Returns JSON status of all the devices:  their profilers (see GocatorModel.profiler_status)
+    and whether they're in use, plus the id of the default device"""
+    statuses = []
+    for device_model in devices:
+        status = device_model.profiler_status()
+        status.update(device_status(device_model))
+        statuses.append(status)
+    return jsonify({"devices":statuses, "default":devices.default.device_id})
+
+def event_id(request_headers, request_args):
+    """Returns the number of the last profiler output line the client has seen, from either the
+    Last-Event-ID header of a reconnecting EventSource or the 'since' query argument"""
+    try:
+        return int(request_headers.get('Last-Event-ID') or request_args.get('since') or 0)
+    except ValueError:
+        return 0
+
+def scan_event(since=0, device_id=None):
+    """Returns a Server-Sent Event of the progress of the specified device's current scan (default
+    device if None), with the profiler's output lines after line number since.  Returns (event,
+    number of the last line sent, True if a scan is still running)."""
+    device_model = devices.get(device_id)
+    record = scans.active(device_model.device_id)
+    progress = device_model.scan_progress(since)
+    scanning = record is not None and record.mode == 'scan' and progress['running']
+    progress['scan'] = record.scan_id if record is not None else None
+    if progress['preview'] is not None:
+        # No request context on the event loop, so can't use url_for
+        progress['preview'] = "{0}/{1}?v={2}".format(app.static_url_path,
+                                                     os.path.relpath(progress['preview'], app.static_folder).replace(os.sep, '/'),
+                                                     progress['preview_version'])
+    if progress['lines']:
+        since = progress['lines'][-1][0]
+    event = "id: {0}\nevent: {1}\ndata: {2}\n\n".format(since, "progress" if scanning else "done",
+                                                       json.dumps(progress))
+    return event, since, scanning
+
+@app.route('/scan/stream', methods=['GET'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/scan/stream', methods=['GET'])
+@with_device
+def scan_stream(model):
+    """Streams the progress of the current scan as Server-Sent Events until the scan stops.
+    hqs.py serves this URL from its event loop instead, since WSGI servers tie up a thread per viewer."""
+    def generate(since):
+        while True:
+            event, since, scanning = scan_event(since, model.device_id)
+            yield event
+            if not scanning:
+                break
+            time.sleep(app.config.get('SCAN_STREAM_INTERVAL', 0.5))
+    response = Response(generate(event_id(request.headers, request.args)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def submit_profile(data_path, image_path, device_id=None):
+    """Queues a job to plot the specified data file scanned by the specified device (default
+    device if None), returns the job's id"""
+    cache_folder = cache_max_bytes = None
+    if plot_cache is not None:
+        cache_folder = plot_cache.folder
+        cache_max_bytes = plot_cache.max_bytes
+    job_id = render_jobs.submit(render_profile, devices.get(device_id).config_fname, data_path, image_path,
+                                cache_folder=cache_folder, cache_max_bytes=cache_max_bytes,
+                                mode=app.config.get('PLOT_MODE', 'heightmap'),
+                                decimation=app.config.get('PLOT_DECIMATION', 'minmax'),
+                                point_budget=app.config.get('PLOT_POINT_BUDGET', 200000))
+    render_jobs.tag(job_id, os.path.basename(data_path))
+    return job_id
+
+def submit_compression(data_path, compression, after=()):
+    """Queues a job to replace the specified scan with a compressed copy once the specified jobs have
+    finished, and to catalog the copy in place of the scan.  Returns the job's id.  If compression fails
+    (e.g. disk full) the job fails and the uncompressed scan is kept.  If the scan is removed in the
+    meantime (e.g. evicted) the copy is discarded and the job's result is None."""
+    job_id = render_jobs.submit_after(list(after), compress_cataloged, catalog.db_fname, data_path, compression)
+    scan_name = os.path.basename(data_path)
+    render_jobs.tag(job_id, scan_name)
+    render_jobs.on_done(job_id, lambda compressed_path: catalog_compressed(scan_name, compressed_path))
+    return job_id
+
+def catalog_compressed(name, compressed_path):
+    """Replaces the named scan's catalog entry with one for its compressed copy (if it was kept)"""
+    if compressed_path is None: # scan removed while being compressed
+        return
+    entry = catalog.get(name)
+    if entry is None: # removed since being compressed, the copy mustn't outlive it
+        remove_file(compressed_path)
+        return
+    catalog.remove(name)
+    catalog.add(compressed_path, created=entry['created'], point_count=entry['point_count'], comment=entry['comment'],
+                plot_path=entry['plot_path'], config_snapshot=entry['config_snapshot'], pinned=bool(entry['pinned']),
+                derived_size=entry['derived_size'], plot_key=entry['plot_key'])
+
+def submit_tiles(data_path, device_id=None):
+    """Queues a job to build a tile pyramid of the specified data file scanned by the specified
+    device (default device if None), returns the job's id.  The pyramid's size is added to the
+    scan's catalog entry once it's built."""
+    scan_name = os.path.basename(scan_reader.scan_root(data_path))
+    job_id = render_jobs.submit(render_tiles, devices.get(device_id).config_fname, data_path,
+                                os.path.join(app.config['OUTPUTIMAGEPATH'], scan_name))
+    data_name = os.path.basename(data_path)
+    render_jobs.tag(job_id, data_name)
+    render_jobs.on_done(job_id, lambda dzi_file: catalog.add_derived(
+        data_name, os.path.getsize(dzi_file) + folder_size(os.path.splitext(dzi_file)[0] + "_files")))
+    return job_id
+
+@app.route('/tiles/<scan_name>/<path:filename>', methods=['GET'])
+def tiles(scan_name, filename):
+    """Serves a scan's tile pyramid.  Pyramids are never modified once built (rebuilding one publishes
+    a new version under a different URL), so their tiles and descriptors can be cached indefinitely.
+    Anything else is revalidated."""
+    response = send_from_directory(os.path.join(app.config['OUTPUTIMAGEPATH'], scan_name), filename)
+    if is_tile_path(filename):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else: # e.g. a plot, which may be replaced
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/view/<scan_name>', methods=['GET'])
+def view_tiles(scan_name):
+    """Displays the current version of a scan's tile pyramid in a pan and zoom viewer, which fetches
+    only the visible tiles"""
+    version = current_version(os.path.join(app.config['OUTPUTIMAGEPATH'], scan_name))
+    if version is None:
+        response = jsonify({"error":"No zoomable image of this scan"})
+        response.status_code = 404
+        return response
+    return render_template('viewer.html', scan_name=scan_name,
+                           dzi_url=url_for('tiles', scan_name=scan_name, filename="{0}/{1}.dzi".format(version, scan_name)))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Returns JSON status of a plotting job ('queued', 'running', 'done' or 'failed'),
+    with the URL of the plot (or tile pyramid descriptor, or compressed scan) once done."""
+    status = render_jobs.status(job_id)
+    if status is None:
+        response = jsonify({"error":"Unknown job"})
+        response.status_code = 404
+        return response
+    result = status.pop('result', None)
+    if result is not None:
+        status['image'] = static_url(result)
+    status['job'] = job_id
+    return jsonify(status)
+
+@app.route('/target', methods=['POST'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/target', methods=['POST'])
+@with_device
+def target(model):
     """Start the laser, allow user to align before taking actual measurements"""
-    response = {"running":model.start_target()}
+    record = scans.begin(client_id(), mode='target', device_id=model.device_id)
+    if record is None:
+        return jsonify({"running":False, "error":"Scanner in use"})
+    session[scan_key(model)] = record.scan_id
+    try:
+        running = model.start_target()
+    except Exception as err:
+        scans.update(record.scan_id, state='failed', error=str(err))
+        raise
+    scans.update(record.scan_id, state='scanning' if running else 'failed')
+    response = {"running":running}
     return jsonify(response)
 
-@app.route('/stoptarget', methods=['POST'])
-def stoptarget():
+@app.route('/stoptarget', methods=['POST'], defaults={'device_id':None})
+@app.route('/devices/<device_id>/stoptarget', methods=['POST'])
+@with_device
+def stoptarget(model):
     """Turns the laser off after targeting"""
-    model.stop_scanner()
+    record = scans.claim(session.get(scan_key(model)), client_id(), force=session.get('logged_in', False))
+    if record is None:
+        return jsonify({"running":False, "error":"Laser not activated"})
+    try:
+        model.stop_scanner()
+    except Exception as err: # free the scanner for the next scan
+        scans.update(record.scan_id, state='failed', error=str(err))
+        return jsonify({"running":False, "error":str(err) or err.__class__.__name__})
+    scans.update(record.scan_id, state='stopped')
     response = {"running":False}
     return jsonify(response)
 
@@ -191,42 +680,204 @@ def logout():
     flash("Logout successful", "success")
     return redirect(url_for('index'))
 
+def scan_entry(entry):
+    """Returns a JSON-friendly dict of the specified catalog entry"""
+    scan = {'name':entry['name'],
+            'url':url_for('download_scan', scan_name=entry['name']),
+            'date':str(datetime.datetime.fromtimestamp(entry['created'])),
+            'plot':None}
+    for field in ('created', 'modified', 'size', 'point_count', 'comment'):
+        scan[field] = entry[field]
+    scan['pinned'] = bool(entry['pinned'])
+    if entry['plot_path'] is not None:
+        scan['plot'] = static_url(entry['plot_path'])
+    elif entry['plot_key'] is not None:
+        scan['plot'] = url_for('scan_plot', scan_name=entry['name'])
+    metadata = scan_reader.read_metadata(entry['path'])
+    for field in ('valid_fraction', 'bounds', 'duration'):
+        scan[field] = metadata.get(field) if metadata is not None else None
+    return scan
+
+def encode_cursor(sort, descending, entry):
+    """Returns an opaque cursor that continues a listing of scans after the specified catalog entry"""
+    return base64.urlsafe_b64encode(json.dumps([sort, descending, entry[sort], entry['name']]).encode('utf-8'))
+
+def decode_cursor(cursor, sort, descending):
+    """Returns the (sort column value, name) a cursor continues from.  Raises ValueError if the cursor
+    is invalid or from a listing in a different order."""
+    try:
+        cursor_sort, cursor_descending, value, name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or cursor_descending != descending:
+        raise ValueError("Cursor is from a listing in a different order")
+    return value, name
+
+def parse_time(value, end_of_day=False):
+    """Returns the timestamp of a date and time, either seconds since the epoch or an ISO 8601 date
+    (YYYY-MM-DD) or date and time (YYYY-MM-DDTHH:MM[:SS]) in local time.  A date is the start of
+    the day, or the end of the day if end_of_day is True.  Returns None if empty."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        day = datetime.datetime.strptime(value, '%Y-%m-%d')
+        if end_of_day:
+            day += datetime.timedelta(days=1)
+        return time.mktime(day.timetuple())
+    except ValueError:
+        pass
+    for time_format in ('%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return time.mktime(datetime.datetime.strptime(value, time_format).timetuple())
+        except ValueError:
+            pass
+    raise ValueError("Unable to read date '{0}'".format(value))
+
+def query_scans(args):
+    """Returns a page of catalog entries and the cursor of the next page (None if this is the last page)
+    according to the specified query arguments:  sort ('created', 'modified', 'size' or 'point_count'),
+    order ('desc' or 'asc'), limit, cursor, from and to (inclusive) dates, and comment text.
+    Raises ValueError if an argument is invalid."""
+    sort = args.get('sort', 'created')
+    descending = args.get('order', 'desc').lower() != 'asc'
+    max_page = app.config.get('SCANS_MAX_PAGE_SIZE', 500)
+    limit = min(max(int(args.get('limit', app.config.get('SCANS_PAGE_SIZE', 50))), 1), max_page)
+    after = decode_cursor(args['cursor'], sort, descending) if args.get('cursor') else None
+    # Ask for one more than the page to find out if there's another page
+    entries = catalog.query(sort, descending, limit + 1, after, parse_time(args.get('from')),
+                            parse_time(args.get('to'), end_of_day=True), args.get('comment'))
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(sort, descending, entries[-1])
+    return entries, next_cursor
+
+@app.route('/api/scans', methods=['GET'])
+def api_scans():
+    """Returns JSON of a page of the stored scans, see query_scans for the query arguments"""
+    try:
+        entries, next_cursor = query_scans(request.args)
+    except ValueError as err:
+        response = jsonify({"error":str(err)})
+        response.status_code = 400
+        return response
+    return jsonify({"scans":[scan_entry(entry) for entry in entries], "next_cursor":next_cursor})
+
+@app.route('/api/scans/<scan_name>/pin', methods=['POST', 'DELETE'])
+@login_required
+def pin_scan(scan_name):
+    """Pins (POST) or unpins (DELETE) the named scan so that it's kept by the retention policy"""
+    if not catalog.pin(scan_name, request.method == 'POST'):
+        response = jsonify({"error":"Unknown scan"})
+        response.status_code = 404
+        return response
+    return jsonify({"name":scan_name, "pinned":request.method == 'POST'})
+
 @app.route('/data', methods=['GET'])
 def data():
-    """Generates list of stored scans"""
-    data_files = list_data_files()
-    table_data = []
-    for data_file in data_files:
-        file_path = os.path.join(app.config["OUTPUTDATAPATH"], data_file)
-        mod_date = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-        table_data.append((data_file, mod_date))
-    return render_template('data.html', datafiles=table_data)
+    """Generates list of stored scans:  the first page, subsequent pages are loaded from /api/scans"""
+    entries, next_cursor = query_scans({})
+    return render_template('data.html', scans=[scan_entry(entry) for entry in entries], next_cursor=next_cursor)
+
+@app.route('/data/<scan_name>', methods=['GET'])
+def download_scan(scan_name):
+    """Sends the named scan as CSV.  Compressed scans are sent as stored with Content-Encoding: gzip
+    to clients that accept it, and decompressed as they're sent to clients that don't.  Scans compressed
+    after they were stored can still be downloaded by their uncompressed name."""
+    entry = catalog.get(scan_name) or catalog.get(scan_name + scan_reader.COMPRESSED_EXTENSION)
+    if entry is None:
+        response = jsonify({"error":"Unknown scan"})
+        response.status_code = 404
+        return response
+    data_path = entry['path']
+    if not scan_reader.is_compressed(data_path):
+        response = send_file(data_path, mimetype='text/csv', conditional=True)
+    else:
+        if request.accept_encodings['gzip']:
+            response = send_file(data_path, mimetype='text/csv', conditional=True)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            def generate():
+                with scan_reader.open_scan(data_path) as fid:
+                    for chunk in iter(lambda: fid.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        yield chunk
+            response = Response(generate(), mimetype='text/csv')
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Content-Disposition'] = 'inline; filename={0}'.format(
+        os.path.basename(scan_reader.uncompressed_fname(data_path)))
+    return response
+
+@app.route('/plots/<scan_name>', methods=['GET'])
+def scan_plot(scan_name):
+    """Redirects to the named scan's plot.  A plot evicted from the plot cache is rendered again
+    (waiting at most config.py's PLOT_TIMEOUT seconds)."""
+    entry = catalog.get(scan_name)
+    if entry is None or (entry['plot_path'] is None and entry['plot_key'] is None):
+        response = jsonify({"error":"Unknown plot"})
+        response.status_code = 404
+        return response
+    if entry['plot_path'] is not None:
+        return redirect(static_url(entry['plot_path']))
+    plot_path = plot_cache.get(entry['plot_key'], 'png') if plot_cache is not None else None
+    if plot_path is None:
+        device_id = json.loads(entry['config_snapshot'] or '{}').get('device')
+        if devices.get(device_id) is None: # device since removed from config.py
+            device_id = None
+        job_id = submit_profile(entry['path'], temp_image_fname(), device_id)
+        render_jobs.on_done(job_id, lambda plot_path: catalog_plot(scan_name, plot_path))
+        try:
+            plot_path = render_jobs.result(job_id, app.config.get('PLOT_TIMEOUT', 60))
+        except Exception as err: # e.g. timed out, the job carries on
+            response = jsonify({"error":str(err) or err.__class__.__name__,
+                                "job":job_id,
+                                "job_url":url_for('job_status', job_id=job_id)})
+            response.status_code = 503
+            return response
+    return redirect(static_url(plot_path))
 
 @app.route('/dnld_data', methods=['POST'])
 def download_data():
-    """Creates ZIP archive of all the data"""
-    data_files = list_data_files()
-    zip_fname = os.path.join(app.config['OUTPUTDATAPATH'], "scans.zip")
-    with ZipFile(zip_fname, 'w') as output_zip:
-        for data_file in data_files:
-            file_path = os.path.join(app.config["OUTPUTDATAPATH"], data_file)
-            output_zip.write(file_path, arcname=os.path.basename(file_path))
-        response = {'url':os.path.relpath(zip_fname, app.config['BASEPATH'])}
-        return jsonify(response)
-    response = {'error':"Unable to create ZIP archive"}
+    """Returns the URL of the ZIP archive of all the data"""
+    response = {'url':url_for('download_zip')}
     return jsonify(response)
 
+@app.route('/scans.zip', methods=['GET'])
+def download_zip():
+    """Streams a ZIP archive of all the data (except scans in progress), generated as it's sent.
+    Scans compressed for previous downloads are reused from the ZIP cache, and scans stored
+    compressed are added as they are."""
+    in_progress = set(record.data_path for record in scans.active_scans())
+    files = [(os.path.join(app.config['OUTPUTDATAPATH'], data_file), scan_reader.uncompressed_fname(data_file))
+             for data_file in list_data_files()]
+    zip_cache.prune([file_path for file_path, arcname in files])
+    files = [(file_path, arcname) for file_path, arcname in files if file_path not in in_progress]
+    response = Response(ZipStream(cache=zip_cache).stream(files), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=scans.zip'
+    return response
+
 @app.route('/cleardata', methods=['GET'])
 @login_required
 def cleardata():
     """Erases the data files"""
-    data_files = list_data_files()
-    plot_files = list_plot_files()
+    # Include any files that were added to the data folder by hand
+    catalog.reconcile(app.config['OUTPUTDATAPATH'])
+    data_files = list_data_files() + list_sidecar_files()
     try:
+        if plot_cache is not None:
+            plot_cache.clear()
+        zip_cache.clear()
+        plot_files = list_plot_files()
         for fname in data_files:
             os.remove(os.path.join(app.config['OUTPUTDATAPATH'], fname))
+        catalog.clear()
         for fname in plot_files:
             os.remove(os.path.join(app.config['OUTPUTIMAGEPATH'], fname))
+        for fname in list_tile_folders():
+            shutil.rmtree(os.path.join(app.config['OUTPUTIMAGEPATH'], fname))
         flash("Data Erased", "success")
     except OSError as err: #Couldn't remove files
         flash("Unable to remove data files: {0}".format(err), "failed")
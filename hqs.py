@@ -4,11 +4,154 @@
 Chris R. Coughlin (TRI/Austin, Inc.)
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from tornado import gen
+from tornado.concurrent import chain_future, is_future
+from tornado.iostream import StreamClosedError
+from tornado.web import Application, RequestHandler, StaticFileHandler
 from tornado.wsgi import WSGIContainer
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop
-from gocator_ui import app
+from gocator_ui import app, devices, event_id, is_tile_path, scan_event
+
+class WSGIHandler(RequestHandler):
+    """Runs a WSGI application on a bounded pool of worker threads, so that a slow request only
+    ties up its own worker rather than the IOLoop.  The response body is streamed back through the
+    IOLoop as the application produces it; the worker waits for each chunk to be flushed before
+    producing the next, so memory use is bounded."""
+
+    SUPPORTED_METHODS = ('GET', 'HEAD', 'POST', 'DELETE', 'PATCH', 'PUT', 'OPTIONS')
+
+    def initialize(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+        self.io_loop = IOLoop.current()
+        self.response_started = False
+
+    @gen.coroutine
+    def handle(self, *args):
+        environ = WSGIContainer.environ(self.request)
+        try:
+            yield self.executor.submit(self.run_wsgi, environ)
+        except StreamClosedError: # client went away
+            return
+        if not self._finished:
+            self.finish()
+
+    get = head = post = delete = patch = put = options = handle
+
+    def run_wsgi(self, environ):
+        """Calls the WSGI application (on a worker thread) and streams its response"""
+        response = []
+        def start_response(status, response_headers, exc_info=None):
+            response[:] = [status, response_headers]
+            return write
+        def write(chunk):
+            if not self.response_started:
+                self.on_loop(self.start_response, *response)
+            if chunk:
+                self.on_loop(self.write_chunk, chunk)
+        body = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in body:
+                write(chunk)
+            if not self.response_started:
+                self.on_loop(self.start_response, *response)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def on_loop(self, fn, *args):
+        """Calls fn(*args) on the IOLoop from a worker thread, waits for and returns its result
+        (or the result of the Future it returns)"""
+        future = Future()
+        def call():
+            try:
+                result = fn(*args)
+            except Exception as err:
+                future.set_exception(err)
+                return
+            if is_future(result):
+                chain_future(result, future)
+            else:
+                future.set_result(result)
+        self.io_loop.add_callback(call)
+        return future.result()
+
+    def start_response(self, status, response_headers):
+        """Sets the response's status and headers (on the IOLoop)"""
+        code, reason = status.split(' ', 1)
+        self.set_status(int(code), reason)
+        for name in set(name for name, value in response_headers):
+            self.clear_header(name)
+        for name, value in response_headers:
+            self.add_header(name, value)
+        self.response_started = True
+
+    def write_chunk(self, chunk):
+        """Writes a chunk of the response body (on the IOLoop), returns a Future that completes
+        once the chunk has been flushed to the client"""
+        self.write(chunk)
+        return self.flush()
+
+class ScanStreamHandler(RequestHandler):
+    """Streams the progress of a device's current scan (default device if none is named) as
+    Server-Sent Events.  Runs on the IOLoop rather than through the WSGI container, so each
+    viewer costs a socket instead of a thread."""
+
+    @gen.coroutine
+    def get(self, device_id=None):
+        if devices.get(device_id) is None:
+            self.set_status(404)
+            self.finish({"error":"Unknown device"})
+            return
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+        self.set_header('X-Accel-Buffering', 'no')
+        since = event_id(self.request.headers, {'since':self.get_argument('since', None)})
+        while True:
+            event, since, scanning = scan_event(since, device_id)
+            self.write(event)
+            try:
+                yield self.flush()
+            except StreamClosedError: # viewer went away
+                return
+            if not scanning:
+                break
+            yield gen.sleep(app.config.get('SCAN_STREAM_INTERVAL', 0.5))
+
+class TileHandler(StaticFileHandler):
+    """Serves tile pyramids, whose tiles and descriptors are never modified once built so can be
+    cached indefinitely.  Other files in the image folder (plots, previews) are revalidated."""
+
+    def get_cache_time(self, path, modified, mime_type):
+        return 0
+
+    def set_extra_headers(self, path):
+        if is_tile_path(path):
+            self.set_header('Cache-Control', 'public, max-age=31536000, immutable')
+        else:
+            self.set_header('Cache-Control', 'no-cache')
+
+def make_app(workers=None):
+    """Returns the Tornado application:  static files, tiles and the scan progress stream are
+    served by the IOLoop, everything else by the Flask app on a pool of worker threads
+    (default config.py's SERVER_WORKERS)"""
+    if workers is None:
+        workers = app.config.get('SERVER_WORKERS', 8)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    return Application([
+        (r"/scan/stream", ScanStreamHandler),
+        (r"/devices/([^/]+)/scan/stream", ScanStreamHandler),
+        (r"{0}/(.*)".format(app.static_url_path), StaticFileHandler, dict(path=app.static_folder)),
+        (r"/tiles/(.*)", TileHandler, dict(path=app.config['OUTPUTIMAGEPATH'])),
+        (r".*", WSGIHandler, dict(wsgi_app=app, executor=executor))])
+
+def main():
+    http_server = HTTPServer(make_app())
+    http_server.listen(app.config.get('SERVER_PORT', 5000))
+    IOLoop.current().start()
 
-http_server = HTTPServer(WSGIContainer(app))
-http_server.listen(5000)
-IOLoop.instance().start()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
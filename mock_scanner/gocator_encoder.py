@@ -3,10 +3,15 @@
 Chris R. Coughlin (TRI/Austin, Inc.)
 """
 
+import os.path
+import shutil
 import time
 import random
 import sys
 
+# Scan data written to the output file of each mock scan
+MOCK_SCAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "one_hole_scan.csv")
+
 # Dummy text to populate stdout
 lorem_text = ['Lorem ipsum dolor sit amet, consectetuer adipiscing elit',
               'Aenean commodo ligula eget dolor',
@@ -36,13 +41,55 @@ lorem_text = ['Lorem ipsum dolor sit amet, consectetuer adipiscing elit',
               'Duis leo']
 
 
-if __name__ == "__main__":
-    random.seed()
+def log(stream, message):
+    """Writes a timestamped message to the specified stream"""
+    stream.write("{0} -- {1}\n".format(time.strftime("%a%b%Y_%H%M"), message))
+    stream.flush()
+
+def acknowledge(mode):
+    """Tells the supervisor that the profiler is now in the specified mode"""
+    sys.stdout.write("ok {0}\n".format(mode))
+    sys.stdout.flush()
+
+def serve():
+    """Persistent mode (-i):  stays connected and reads tab-separated commands from standard input,
+    one per line - idle, target, scan<tab>output file[<tab>comments] or quit - acknowledging each
+    with 'ok <mode>' on standard output"""
+    log(sys.stdout, "Connected to sensor")
+    acknowledge('idle')
     while True:
-        user_input = raw_input()
-        if 'q'in user_input:
-            sys.stderr.write(("{0} -- {1}\n".format(time.strftime("%a%b%Y_%H%M"), random.choice(lorem_text))))
-            sys.stderr.write("{0} -- {1}\n".format(time.strftime("%a%b%Y_%H%M"), "Operation halted by user"))
+        line = sys.stdin.readline()
+        if not line:
             break
-        print("{0} -- {1}".format(time.strftime("%a%b%Y_%H%M"), random.choice(lorem_text)))
-        time.sleep(1)
\ No newline at end of file
+        fields = line.rstrip("\r\n").split("\t")
+        command = fields[0]
+        if command == 'quit':
+            log(sys.stderr, "Operation halted by user")
+            break
+        elif command == 'scan' and len(fields) > 1:
+            with open(fields[1], "wb") as fid:
+                if len(fields) > 2 and fields[2]:
+                    fid.write("# {0}\n".format(fields[2]).encode('utf-8'))
+                with open(MOCK_SCAN, "rb") as scan_fid:
+                    shutil.copyfileobj(scan_fid, fid)
+            log(sys.stdout, random.choice(lorem_text))
+            acknowledge('scan')
+        elif command in ('idle', 'target'):
+            log(sys.stdout, random.choice(lorem_text))
+            acknowledge(command)
+        else:
+            log(sys.stderr, "Unknown command {0!r}".format(command))
+
+if __name__ == "__main__":
+    random.seed()
+    if "-i" in sys.argv[1:]:
+        serve()
+    else:
+        while True:
+            user_input = raw_input()
+            if 'q'in user_input:
+                sys.stderr.write(("{0} -- {1}\n".format(time.strftime("%a%b%Y_%H%M"), random.choice(lorem_text))))
+                sys.stderr.write("{0} -- {1}\n".format(time.strftime("%a%b%Y_%H%M"), "Operation halted by user"))
+                break
+            print("{0} -- {1}".format(time.strftime("%a%b%Y_%H%M"), random.choice(lorem_text)))
+            time.sleep(1)
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""config_cache.py - caches parsed scanner configuration files so that reading the
+configuration doesn't re-parse the file unless it has changed
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+import stat
+import tempfile
+import threading
+
+from flat_config import load_config
+
+class ConfigCache(object):
+    """Parsed configuration files (see flat_config.load_config) keyed by path.  A file is only parsed again once its
+    modification time, size or inode changes.  Updates are serialized by a lock and written to
+    a temporary file that replaces the original, so readers never see a partial file."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.configs = {} # path -> ((mtime, size, inode), parsed configuration)
+
+    def read(self, config_fname):
+        """Returns the parsed configuration file.  The configuration is shared between callers and must
+        not be modified, use update() instead.  Raises IOError if the file doesn't exist or
+        SyntaxError if it can't be parsed."""
+        signature = self.signature(config_fname)
+        with self.lock:
+            cached = self.configs.get(config_fname)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            cfg = load_config(config_fname)
+            self.configs[config_fname] = (signature, cfg)
+            return cfg
+
+    def update(self, config_fname, update_fn):
+        """Calls update_fn(cfg) with a fresh copy of the configuration file (empty if it doesn't
+        exist) and saves the modified configuration, returns the updated configuration.  Raises
+        IOError or OSError if the file couldn't be written, or SyntaxError if it couldn't be parsed."""
+        with self.lock:
+            cfg = load_config(config_fname)
+            update_fn(cfg)
+            folder = os.path.dirname(os.path.abspath(config_fname))
+            fd, temp_fname = tempfile.mkstemp(dir=folder, prefix=".{0}".format(os.path.basename(config_fname)),
+                                              suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fid:
+                    cfg.write(fid)
+                    fid.flush()
+                    os.fsync(fid.fileno())
+                mode = 0o644
+                if os.path.exists(config_fname):
+                    mode = stat.S_IMODE(os.stat(config_fname).st_mode)
+                os.chmod(temp_fname, mode)
+                if os.name == 'nt' and os.path.exists(config_fname): # rename doesn't replace files on Windows
+                    os.remove(config_fname)
+                os.rename(temp_fname, config_fname)
+            finally:
+                if os.path.exists(temp_fname):
+                    os.remove(temp_fname)
+            # Parsed again so that readers see exactly what was written (e.g. strings rather than numbers)
+            cfg = load_config(config_fname)
+            self.configs[config_fname] = (self.signature(config_fname), cfg)
+            return cfg
+
+    def clear(self):
+        """Forgets all the parsed configuration files"""
+        with self.lock:
+            self.configs.clear()
+
+    def signature(self, config_fname):
+        """Returns the (modification time, size, inode) of the configuration file, raises IOError
+        if it doesn't exist"""
+        try:
+            stats = os.stat(config_fname)
+        except OSError as err:
+            raise IOError(err.errno, err.strerror, config_fname)
+        return stats.st_mtime, stats.st_size, stats.st_ino
@@ -0,0 +1,67 @@
+"""decimate.py - reduces scan point clouds to a point budget for preview plots
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import numpy as np
+
+from heightmap import Heightmap
+
+# Default maximum number of points returned
+POINT_BUDGET = 200000
+DECIMATION_MODES = ('stride', 'voxel', 'minmax')
+
+def decimate(blocks, budget=POINT_BUDGET, mode='minmax', x_step=None, y_step=None):
+    """Reduces the points in blocks (an iterable of X, Y, Z arrays, e.g. from scan_reader.iter_scan)
+    to at most budget points in a single pass.  Returns the decimated X, Y, Z arrays.
+    Mode is one of
+        'stride' - every Nth point, N chosen (and increased as required) to fit the budget
+        'voxel' - mean Z of the points in each cell of a regular X/Y grid
+        'minmax' - minimum and maximum Z in each grid cell, which preserves edges such as holes
+    Grid cell sizes start at x_step and y_step (estimated from the data if not specified) and
+    are doubled as required to fit the budget."""
+    if mode == 'stride':
+        return _decimate_stride(blocks, budget)
+    elif mode == 'voxel':
+        heightmap = Heightmap(x_step, y_step, max_cells=budget)
+        for x, y, z in blocks:
+            heightmap.add(x, y, z)
+        return heightmap.points()
+    elif mode == 'minmax':
+        heightmap = Heightmap(x_step, y_step, max_cells=max(1, budget // 2), track_extrema=True)
+        for x, y, z in blocks:
+            heightmap.add(x, y, z)
+        xmin, ymin, zmin = heightmap.points('min')
+        xmax, ymax, zmax = heightmap.points('max')
+        # Cells with a single distinct Z only need one point
+        distinct = zmax > zmin
+        return (np.concatenate((xmin, xmax[distinct])), np.concatenate((ymin, ymax[distinct])),
+                np.concatenate((zmin, zmax[distinct])))
+    raise ValueError("Unknown decimation mode '{0}', must be one of {1}".format(mode, DECIMATION_MODES))
+
+def _decimate_stride(blocks, budget):
+    """Keeps every Nth point of blocks, doubling N whenever more than budget points are kept"""
+    stride = 1
+    offset = 0 # index of the first point of the current block
+    kept = [] # (x, y, z) of the kept points of each block
+    num_kept = 0
+    for x, y, z in blocks:
+        first = (-offset) % stride # first index in this block that's a multiple of the stride
+        kept.append((x[first::stride], y[first::stride], z[first::stride]))
+        num_kept += kept[-1][0].size
+        offset += x.size
+        while num_kept > budget:
+            # Every other kept point is a multiple of the doubled stride
+            stride *= 2
+            trimmed = []
+            num_kept = 0
+            start = 0 # index of the first kept point of the block, counting in units of the old stride
+            for kx, ky, kz in kept:
+                first = start % 2
+                trimmed.append((kx[first::2], ky[first::2], kz[first::2]))
+                num_kept += trimmed[-1][0].size
+                start += kx.size
+            kept = trimmed
+    if not kept:
+        return np.empty(0), np.empty(0), np.empty(0)
+    return tuple(np.concatenate([block[idx] for block in kept]) for idx in range(3))
@@ -0,0 +1,60 @@
+"""device_manager.py - one GocatorModel per Gocator device, so that several heads on one
+controller can be configured and scan at the same time
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from collections import OrderedDict
+import os.path
+import re
+
+from gocator_model import GocatorModel
+
+# Device ids are used in URLs and log filenames
+DEVICE_ID = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+def device_logs(device_id, folder=GocatorModel.STATICPATH):
+    """Returns the output and error log files of the specified device's profiler"""
+    return {'output':os.path.join(folder, "profiler_output_{0}.log".format(device_id)),
+            'error':os.path.join(folder, "profiler_errors_{0}.log".format(device_id))}
+
+class DeviceManager(object):
+    """GocatorModels of the Gocator devices keyed by device id, each with its own profiler
+    configuration file, profiler process and logs.  The models don't share any state, so
+    scans on different devices run in parallel.  Created from a list of (device id,
+    configuration file) pairs, the first of which is the default device; with no devices
+    there's a single device with id None, using the default configuration file and logs."""
+
+    def __init__(self, devices=None):
+        self.models = OrderedDict() # device id -> GocatorModel
+        for device_id, config_fname in devices or []:
+            device_id = str(device_id)
+            if not DEVICE_ID.match(device_id):
+                raise ValueError("Invalid device id '{0}', must be letters, digits, - or _".format(device_id))
+            if device_id in self.models:
+                raise ValueError("Device '{0}' listed more than once".format(device_id))
+            self.models[device_id] = GocatorModel(config_fname, device_id=device_id, logs=device_logs(device_id))
+        if not self.models:
+            self.models[None] = GocatorModel()
+
+    def __iter__(self):
+        """Iterates over the devices' models"""
+        return iter(list(self.models.values()))
+
+    def __len__(self):
+        return len(self.models)
+
+    @property
+    def default(self):
+        """Returns the model of the default device"""
+        return next(iter(self.models.values()))
+
+    def ids(self):
+        """Returns a list of the device ids"""
+        return list(self.models.keys())
+
+    def get(self, device_id=None):
+        """Returns the model of the specified device (default device if None), or None if unknown"""
+        if device_id is None:
+            return self.default
+        return self.models.get(device_id)
@@ -0,0 +1,215 @@
+"""flat_config.py - fast loader for the flat subset of the ConfigObj format used by the
+scanner configuration:  [Section] headers, key = value lines and # comments.  Files using
+anything more (nested sections, lists, multiline values, interpolation) or loaded for
+validation are read with the full ConfigObj parser instead.
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from collections import OrderedDict
+import os.path
+import re
+
+_SECTION = re.compile(r'^\s*\[\s*([^\[\]"\'#]+?)\s*\]\s*(?:#.*)?$')
+_KEY_VALUE = re.compile(r'^(\s*([^\s\[\]=#"\'][^=]*?)\s*=\s*)(.*?)$')
+_QUOTED_VALUE = re.compile(r'^("([^"]*)"|\'([^\']*)\')(\s*(?:#.*)?)$')
+_UNQUOTED_KEY_VALUE = re.compile(r'^(\s*([^\s\[\]=#"\'][^=]*?)\s*=\s*)([^#"\',]*?)(\s*(?:#.*)?)$')
+# Values ConfigObj would interpolate
+_INTERPOLATION = re.compile(r'\$|%\(')
+# Values that have to be quoted
+_NEEDS_QUOTES = re.compile(r'[#,"\']|^\s|\s$|^$')
+
+_BOOLS = {'true':True, 'yes':True, 'on':True, '1':True,
+          'false':False, 'no':False, 'off':False, '0':False}
+
+class UnsupportedConfig(ValueError):
+    """Raised if a configuration file uses features outside the flat subset"""
+    pass
+
+def load_config(config_fname, configspec=None):
+    """Returns the configuration file parsed as a FlatConfig, or as a ConfigObj if it's to be
+    validated against a configspec or it uses more than the flat subset.  ConfigObj is only
+    imported if it's needed."""
+    if configspec is None:
+        try:
+            return FlatConfig(config_fname)
+        except UnsupportedConfig:
+            pass
+    from configobj import ConfigObj
+    return ConfigObj(config_fname, configspec=configspec)
+
+def format_value(value):
+    """Returns the text of the specified value as written to a configuration file, quoted if
+    necessary.  Raises TypeError for lists or sections."""
+    if isinstance(value, (list, tuple, dict)):
+        raise TypeError("Only single values can be written to a flat configuration")
+    if not isinstance(value, str):
+        value = value.encode('utf-8') if isinstance(value, type(u"")) else str(value)
+    if _NEEDS_QUOTES.search(value):
+        if '"' not in value:
+            return '"{0}"'.format(value)
+        if "'" not in value:
+            return "'{0}'".format(value)
+        raise ValueError("Unable to quote {0!r}".format(value))
+    return value
+
+class FlatSection(OrderedDict):
+    """Section of a flat configuration:  an ordered dict of its values, with ConfigObj's conversions"""
+
+    def as_bool(self, key):
+        """Returns the value as a boolean:  true, yes, on or 1 vs. false, no, off or 0 (any case)"""
+        value = self[key]
+        if value is True or value is False:
+            return value
+        try:
+            return _BOOLS[value.lower()]
+        except (AttributeError, KeyError):
+            raise ValueError("Value {0!r} is neither True nor False".format(value))
+
+    def as_int(self, key):
+        """Returns the value as an integer"""
+        return int(self[key])
+
+    def as_float(self, key):
+        """Returns the value as a float"""
+        return float(self[key])
+
+class FlatConfig(FlatSection):
+    """Flat configuration file:  an ordered dict of the top level values and the sections
+    (FlatSections).  The lines of the file are kept, so writing the configuration reproduces
+    the file exactly - comments, spacing and all - apart from changed values.  New values are
+    added after the last value of their section, new sections at the end of the file.  Raises
+    UnsupportedConfig if the file uses features outside the flat subset."""
+
+    def __init__(self, filename=None):
+        super(FlatConfig, self).__init__()
+        self.filename = filename
+        # Comment lines, and (section name or None, key or None for a section header, text before the
+        # value, original value text, text after the value) for section headers and values
+        self.lines = []
+        self.originals = {} # (section name or None, key) -> value as read
+        self.newline = "\n"
+        if filename is not None and os.path.exists(filename):
+            with open(filename, "rb") as fid:
+                text = fid.read()
+            if text.startswith(b"\xef\xbb\xbf"):
+                raise UnsupportedConfig("Byte order mark")
+            self.parse(text if isinstance(text, str) else text.decode('utf-8'))
+
+    def __setitem__(self, key, value):
+        if isinstance(value, dict) and not isinstance(value, FlatSection):
+            value = FlatSection(value)
+        super(FlatConfig, self).__setitem__(key, value)
+
+    def parse(self, text):
+        """Reads the specified configuration text"""
+        lines = text.splitlines(True)
+        if lines and lines[0].endswith("\r\n"):
+            self.newline = "\r\n"
+        section = None
+        for line in lines:
+            content = line.rstrip("\r\n")
+            newline = line[len(content):]
+            stripped = content.lstrip()
+            if not stripped or stripped[0] == "#":
+                self.lines.append(line)
+                continue
+            if stripped[0] == "[":
+                match = _SECTION.match(content)
+                if match is None:
+                    raise UnsupportedConfig("Unable to read section {0!r}".format(content))
+                section = match.group(1)
+                if section in self:
+                    raise UnsupportedConfig("Duplicate section {0}".format(section))
+                self[section] = FlatSection()
+                self.lines.append((section, None, line, None, None))
+                continue
+            # Most lines are unquoted values, read with a single match
+            match = _UNQUOTED_KEY_VALUE.match(content)
+            if match is not None:
+                prefix, key, raw, suffix = match.groups()
+                value = raw
+            else:
+                match = _KEY_VALUE.match(content)
+                value_match = _QUOTED_VALUE.match(match.group(3)) if match is not None else None
+                if value_match is None:
+                    raise UnsupportedConfig("Unable to read line {0!r}".format(content))
+                prefix, key = match.group(1, 2)
+                raw, double_quoted, single_quoted, suffix = value_match.groups()
+                value = double_quoted if double_quoted is not None else single_quoted
+            if _INTERPOLATION.search(value):
+                raise UnsupportedConfig("Interpolated value {0!r}".format(value))
+            values = self[section] if section is not None else self
+            if key in values:
+                raise UnsupportedConfig("Duplicate key {0}".format(key))
+            values[key] = value
+            self.originals[(section, key)] = value
+            self.lines.append((section, key, prefix, raw, suffix + newline))
+
+    def write(self, outfile=None):
+        """Writes the configuration to the specified file object, or to the configuration's file"""
+        output = "".join(self.output_lines())
+        if not isinstance(output, bytes):
+            output = output.encode('utf-8')
+        if outfile is not None:
+            outfile.write(output)
+        else:
+            with open(self.filename, "wb") as fid:
+                fid.write(output)
+
+    def output_lines(self):
+        """Returns the lines of the configuration file"""
+        # Each section's new values are added after the last line of the section's values (or its header)
+        insert_after = {}
+        for index, line in enumerate(self.lines):
+            if isinstance(line, tuple):
+                insert_after[line[0]] = index
+        written = set()
+        output = []
+        if None not in insert_after:
+            self.add_lines(output, self.new_lines(None, written))
+        for index, line in enumerate(self.lines):
+            if not isinstance(line, tuple):
+                output.append(line)
+                continue
+            section, key, prefix, raw, suffix = line
+            values = self.section_values(section)
+            if values is not None:
+                if key is None:
+                    output.append(prefix)
+                elif key in values:
+                    written.add((section, key))
+                    if values[key] == self.originals[(section, key)]:
+                        output.append(prefix + raw + suffix)
+                    else:
+                        output.append(prefix + format_value(values[key]) + suffix)
+            if insert_after[section] == index:
+                self.add_lines(output, self.new_lines(section, written))
+        for section, values in self.items():
+            if isinstance(values, dict) and section not in insert_after:
+                self.add_lines(output, ["[{0}]{1}".format(section, self.newline)] + self.new_lines(section, written))
+        return output
+
+    def add_lines(self, output, lines):
+        """Appends the specified new lines to the output, ending the preceding line if the file didn't"""
+        if lines and output and not output[-1].endswith(("\r", "\n")):
+            output[-1] += self.newline
+        output.extend(lines)
+
+    def new_lines(self, section, written):
+        """Returns the lines of the values of the specified section that haven't been written"""
+        values = self.section_values(section)
+        lines = []
+        for key, value in (values.items() if values is not None else []):
+            if (section, key) not in written and not (section is None and isinstance(value, dict)):
+                written.add((section, key))
+                lines.append("{0} = {1}{2}".format(key, format_value(value), self.newline))
+        return lines
+
+    def section_values(self, section):
+        """Returns the values of the specified section (None for the top level), or None if the
+        section has been removed"""
+        if section is None:
+            return self
+        values = self.get(section)
+        return values if isinstance(values, dict) else None
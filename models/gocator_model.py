@@ -7,12 +7,25 @@ import os.path
 import datetime
 import subprocess
 import sys
+import threading
+import time
 
-from configobj import ConfigObj
+from config_cache import ConfigCache
+from decimate import POINT_BUDGET, decimate
+from heightmap import Heightmap
+from log_reader import TAIL_BYTES, backup_fname, read_tail
+from profiler_supervisor import IDLE, ProfilerSupervisor, stop_process
+from scan_reader import (BLOCK_SIZE, VALID_Z_THRESHOLD, iter_scan, merge_bounds, new_statistics, read_metadata,
+                         scan_root, write_metadata, write_sidecar)
+from scan_preview import ScanPreview
+from scan_tail import ScanTail
+from stream_pump import StreamPump
+from tiles import build_pyramid
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.cm as cm
+from matplotlib.colors import Normalize
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.figure import Figure
 
@@ -44,17 +57,56 @@ class GocatorModel(object):
     SCANPATH = os.path.join(STATICPATH, "scans")
     STDOUTPATH = os.path.join(STATICPATH, "profiler_output.log")
     STDERRPATH = os.path.join(STATICPATH, "profiler_errors.log")
+    LOGS = {'output':STDOUTPATH, 'error':STDERRPATH}
+    # Size in bytes at which the scanner logs are rotated, and the number of rotated logs kept
+    LOG_MAX_BYTES = 1024 * 1024
+    LOG_BACKUPS = 3
+    # Seconds to wait for the scanner to quit before terminating it
+    STOP_TIMEOUT = 5
+    PLOT_MODES = ('heightmap', 'scatter')
+    # Parsed configuration files, shared by all the models in the process
+    CONFIG_CACHE = ConfigCache()
+    PLOT_DPI = 100
+    # Most cells of a tile pyramid's full-resolution level - about 32 MB of float32 sums and
+    # int32 counts while the heightmap is accumulated
+    TILE_MAX_CELLS = 4 * 1024 * 1024
+    # Seconds between updates of the preview of a scan in progress
+    PREVIEW_INTERVAL = 2
+    # Seconds between reads of the data written to the output file of a scan in progress
+    PROGRESS_INTERVAL = 0.5
 
-    def __init__(self, config_file=None):
+    def __init__(self, config_file=None, device_id=None, logs=None):
         if config_file is not None:
             self.config_fname = config_file
         else:
             self.config_fname = GocatorModel.ENCODERCONFIGPATH
+        self.device_id = device_id # id of the Gocator device, None if it's the only device
+        self.logs = dict(logs or GocatorModel.LOGS) # 'output' and 'error' -> profiler log file
+        self.config_cache = GocatorModel.CONFIG_CACHE
         self.scanner_proc = None # subprocess used to run Gocator scanner
+        self.stdout_pump = None # StreamPump draining the scanner's stdout
+        self.stderr_pump = None # StreamPump draining the scanner's stderr
+        self.output_file = None # current scan's output file
+        self.scan_comments = None # current scan's comments
+        self.scan_tail = None # ScanTail following the current scan's output file (progress thread only)
+        self.started = None # time the scanner was started
+        self.preview = None # ScanPreview of the current scan (progress thread only)
+        self.progress_thread = None # thread following the current scan's output file
+        self.progress_stop = None # Event signalling the progress thread to quit
+        self.progress_lock = threading.Lock() # guards progress_snapshot
+        self.progress_snapshot = GocatorModel.empty_progress() # last progress read by the progress thread
+        self.plot_cache = None # optional PlotCache of rendered plots
+        self.log_max_bytes = GocatorModel.LOG_MAX_BYTES # size at which logs are rotated (None to never rotate)
+        self.log_backups = GocatorModel.LOG_BACKUPS # number of rotated logs kept
+        self.persistent_profiler = False # keep one profiler process running rather than one per scan?
+        self.supervisor = None # ProfilerSupervisor of the persistent profiler
+        self.first_line = 0 # number of the profiler's last stdout line before the current scan
 
     @property
     def scanner_running(self):
-        """Returns True if the scanner subprocess is running"""
+        """Returns True if the scanner subprocess is running (targeting or scanning if persistent)"""
+        if self.supervisor is not None:
+            return self.supervisor.running and self.supervisor.mode != IDLE
         if self.scanner_proc is not None and self.scanner_proc.poll() is None:
             return True
         return False
@@ -76,7 +128,7 @@ class GocatorModel(object):
         # TODO - add logging to ConfigObj exceptions
         trigger_dict = self.get_sane_trigger()
         try:
-            cfg = ConfigObj(self.config_fname)
+            cfg = self.config_cache.read(self.config_fname)
             if "Trigger" in cfg:
                 trigger_config = cfg["Trigger"]
                 if 'type' in trigger_config:
@@ -103,8 +155,7 @@ class GocatorModel(object):
     def set_configured_trigger(self, new_trigger_config):
         """Saves the trigger configuration.  Returns True if successful."""
         # TODO - add logging to ConfigObj exceptions
-        try:
-            cfg = ConfigObj(self.config_fname)
+        def update(cfg):
             if 'Trigger' not in cfg:
                 cfg['Trigger'] = {}
             trigger_config = cfg['Trigger']
@@ -116,11 +167,13 @@ class GocatorModel(object):
                 trigger_config['travel_threshold'] = new_trigger_config['travel_threshold']
             if 'travel_direction' in new_trigger_config:
                 trigger_config['travel_direction'] = new_trigger_config['travel_direction']
-            cfg.write()
+        try:
+            self.config_cache.update(self.config_fname, update)
+            self.reload_profiler()
             return True
         except SyntaxError: # Problem parsing config file
             return False
-        except IOError: # config file doesn't exist
+        except (IOError, OSError): # unable to write config file
             return False
 
     def get_configured_encoder(self):
@@ -128,7 +181,7 @@ class GocatorModel(object):
         # TODO - add logging to ConfigObj exceptions
         lme = self.get_sane_encoder()
         try:
-            cfg = ConfigObj(self.config_fname)
+            cfg = self.config_cache.read(self.config_fname)
             if 'Encoder' in cfg:
                 encoder_config = cfg['Encoder']
                 if 'resolution' in encoder_config:
@@ -144,8 +197,7 @@ class GocatorModel(object):
 
     def set_configured_encoder(self, new_encoder_config):
         """Saves the encoder configuration.  Returns True if successful."""
-        try:
-            cfg = ConfigObj(self.config_fname)
+        def update(cfg):
             if 'Encoder' not in cfg:
                 cfg['Encoder'] = {}
             encoder_config = cfg['Encoder']
@@ -153,95 +205,402 @@ class GocatorModel(object):
                 encoder_config['model'] = new_encoder_config['encoder_model']
             if 'encoder_resolution' in new_encoder_config:
                 encoder_config['resolution'] = new_encoder_config['encoder_resolution']
-            cfg.write()
+        try:
+            self.config_cache.update(self.config_fname, update)
+            self.reload_profiler()
             return True
         except SyntaxError: # Problem parsing config file
             return False
-        except IOError: # config file doesn't exist
+        except (IOError, OSError): # unable to write config file
             return False
 
-    def start_scanner(self, output_file, scan_comments=None):
+    def start_scanner(self, output_file, scan_comments=None, preview_file=None, preview_interval=None):
         """Starts the Gocator profiler, saves data to specified output file.
         If scan_comments is provided, it will be added to the scan output's header.
+        If preview_file is provided, a low resolution image of the scan so far is written to it
+        every preview_interval seconds (default GocatorModel.PREVIEW_INTERVAL) while scanning.
         Returns True if the scanning process was successfully started."""
-        config_arg = "-c{0}".format(GocatorModel.ENCODERCONFIGPATH)
+        config_arg = "-c{0}".format(self.config_fname)
         output_arg = "-o{0}".format(output_file)
         process_list = [GocatorModel.SCANNERPATH, config_arg, output_arg]
         if scan_comments:
             message_arg = "-m{0}".format(scan_comments)
             process_list.append(message_arg)
+        if self.persistent_profiler:
+            self.start_profiler()
+            self.first_line = self.supervisor.stdout_pump.num_lines
+            self.started = time.time()
+            self.supervisor.scan(output_file, scan_comments)
+        else:
+            self.launch(process_list)
+        self.output_file = output_file
+        self.scan_comments = scan_comments
+        self.scan_tail = ScanTail(output_file)
+        if preview_file is not None:
+            self.preview = ScanPreview(preview_file, y_step=self.get_configured_encoder()['encoder_resolution'])
+        self.start_progress(GocatorModel.PROGRESS_INTERVAL, preview_interval or GocatorModel.PREVIEW_INTERVAL)
+        return self.scanner_running
+
+    @staticmethod
+    def empty_progress():
+        """Returns a dict of the progress of a scan that hasn't written anything yet"""
+        return {'bytes':0, 'rows':0, 'preview':None, 'preview_version':0}
+
+    def start_progress(self, interval, preview_interval):
+        """Starts a background thread that reads the data written to the current scan's output file
+        every interval seconds, and updates the scan preview (if any) every preview_interval seconds"""
+        with self.progress_lock:
+            self.progress_snapshot = GocatorModel.empty_progress()
+        self.progress_stop = threading.Event()
+        self.progress_thread = threading.Thread(target=self.update_progress,
+                                                args=(self.progress_stop, interval, preview_interval))
+        self.progress_thread.daemon = True
+        self.progress_thread.start()
+
+    def update_progress(self, stop_event, interval, preview_interval):
+        """Progress thread target - reads the current scan's progress every interval seconds until
+        stop_event is set.  The data is parsed and the preview rendered without holding
+        progress_lock, so scan_progress is never kept waiting."""
+        last_render = 0
+        while not stop_event.wait(interval):
+            render = time.time() - last_render >= preview_interval
+            if render:
+                last_render = time.time()
+            self.read_scan_progress(render)
+
+    def read_scan_progress(self, render=True):
+        """Reads the data newly written to the current scan's output file, adding it to the
+        preview if any and writing the preview image if render, then publishes the progress
+        for scan_progress.  Only called from the progress thread."""
+        if self.scan_tail is None:
+            return
+        new_data = self.scan_tail.poll()
+        if self.preview is not None:
+            self.preview.add_text(new_data)
+            if render:
+                try:
+                    self.preview.render()
+                except (IOError, OSError): # unable to write image, try again next time
+                    pass
+        snapshot = {'bytes':self.scan_tail.num_bytes,
+                    'rows':self.scan_tail.num_rows,
+                    'preview':None,
+                    'preview_version':0}
+        if self.preview is not None and self.preview.version > 0:
+            snapshot['preview'] = self.preview.image_file
+            snapshot['preview_version'] = self.preview.version
+        with self.progress_lock:
+            self.progress_snapshot = snapshot
+
+    def launch(self, process_list):
+        """Starts the specified profiler process, with background threads that continuously
+        drain its stdout and stderr to the log files"""
         self.scanner_proc = subprocess.Popen(process_list,
                                         stdin=subprocess.PIPE, 
                                         stdout=subprocess.PIPE,
                                         stderr=subprocess.PIPE)
-        return self.scanner_running
+        self.started = time.time()
+        self.first_line = 0
+        self.stdout_pump = StreamPump(self.scanner_proc.stdout, self.logs['output'],
+                                      max_log_bytes=self.log_max_bytes, log_backups=self.log_backups)
+        self.stderr_pump = StreamPump(self.scanner_proc.stderr, self.logs['error'],
+                                      max_log_bytes=self.log_max_bytes, log_backups=self.log_backups)
+        self.stdout_pump.start()
+        self.stderr_pump.start()
+
+    def stop_scanner(self, timeout=None):
+        """Stops the Gocator profiler, waiting up to timeout seconds for it to quit before
+        terminating it (default GocatorModel.STOP_TIMEOUT), or returns the persistent profiler
+        to idle.  Its stdout and stderr are written to the log files as they arrive.  The scan's
+        binary sidecar and metadata are then written."""
+        if timeout is None:
+            timeout = GocatorModel.STOP_TIMEOUT
+        stopped = time.time()
+        if self.supervisor is not None or self.scanner_proc is not None:
+            if self.supervisor is not None:
+                self.supervisor.idle()
+            else:
+                if self.scanner_running:
+                    # Generate some standard output from the mock encoder application
+                    # TODO - remove on deployment
+                    try:
+                        self.scanner_proc.stdin.write(b"q\r\n") # Mock scanner quits when it encounters a 'q' in standard input
+                        self.scanner_proc.stdin.close()
+                    except IOError: # process quit in the meantime
+                        pass
+                    stop_process(self.scanner_proc, timeout)
+                for pump in (self.stdout_pump, self.stderr_pump):
+                    if pump is not None:
+                        pump.join(timeout)
+                self.scanner_proc = None
+            self.stop_progress()
+            if self.output_file is not None:
+                self.convert_scan(self.output_file, comments=self.scan_comments, started=self.started,
+                                  duration=stopped - self.started)
+                self.output_file = None
+                self.scan_comments = None
+
+    def stop_progress(self):
+        """Stops following the current scan's output file and removes the preview image"""
+        if self.progress_thread is not None:
+            self.progress_stop.set()
+            self.progress_thread.join()
+            self.progress_thread = None
+        if self.preview is not None:
+            try:
+                if os.path.exists(self.preview.image_file):
+                    os.remove(self.preview.image_file)
+            except OSError: # couldn't remove file
+                pass
+            self.preview = None
+        self.scan_tail = None
+        with self.progress_lock:
+            self.progress_snapshot = GocatorModel.empty_progress()
 
-    def stop_scanner(self):
-        """Stops the Gocator profiler, writes its stdout and stderr to log files"""
-        if self.scanner_running:
-            # Generate some standard output from the mock encoder application
-            # TODO - remove on deployment
-            self.scanner_proc.stdin.write("q\r\n") # Mock scanner quits when it encounters a 'q' in standard input
-            stdout = self.scanner_proc.stdout.read()
-            stderr = self.scanner_proc.stderr.read()
-            with open(GocatorModel.STDOUTPATH, "ab") as stdout_fid:
-                stdout_fid.write(stdout)
-            with open(GocatorModel.STDERRPATH, "ab") as stderr_fid:
-                stderr_fid.write(stderr)
-            self.scanner_proc = None
+    def scan_progress(self, since=0):
+        """Returns a dict of the current scan's progress:  whether the scanner is running, the seconds
+        since it was started, the bytes and rows written to the output file so far, and the
+        [line number, line] of the profiler's standard output lines numbered after since.
+        If the scan is being previewed, also returns the name of the preview image (None until the
+        first image is written) and the number of times it's been written.
+        The output file is read by the progress thread, this only returns its latest snapshot
+        so it's cheap enough to call from an event loop."""
+        with self.progress_lock:
+            progress = dict(self.progress_snapshot)
+        progress.update({'running':self.scanner_running,
+                         'elapsed':None,
+                         'lines':[]})
+        if self.started is not None and (self.scanner_proc is not None or self.supervisor is not None):
+            progress['elapsed'] = time.time() - self.started
+        pump = self.supervisor.stdout_pump if self.supervisor is not None else self.stdout_pump
+        if pump is not None:
+            progress['lines'] = [[line_number, line.decode('utf-8', 'replace').rstrip()]
+                                 for line_number, line in pump.recent(max(since, self.first_line))]
+        return progress
+
+    def convert_scan(self, data_file, **metadata):
+        """Writes a binary sidecar of the specified scan file for fast subsequent reads, and
+        the scan's metadata (statistics computed during the conversion plus any specified
+        metadata e.g. comments).  Returns the name of the sidecar, or None if the scan couldn't
+        be converted.  The scan can be compressed afterwards (see scan_reader.compress_scan)
+        without invalidating either."""
+        try:
+            stats = new_statistics()
+            sidecar_file = write_sidecar(data_file, stats=stats)
+        except IOError: # no data recorded
+            return None
+        except ValueError: # unable to parse data
+            return None
+        write_metadata(data_file, stats, **metadata)
+        return sidecar_file
 
     def start_target(self):
         """Starts the Gocator profiler in 'targeting' mode : allows user to align
         the laser prior to the actual measurement"""
-        config_arg = "-c" + GocatorModel.ENCODERCONFIGPATH
-        self.scanner_proc = subprocess.Popen([GocatorModel.SCANNERPATH, config_arg, "-t"],
-                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
+        if self.persistent_profiler:
+            self.start_profiler()
+            self.first_line = self.supervisor.stdout_pump.num_lines
+            self.started = time.time()
+            self.supervisor.target()
+        else:
+            config_arg = "-c" + self.config_fname
+            self.launch([GocatorModel.SCANNERPATH, config_arg, "-t"])
+        self.output_file = None
         return self.scanner_running
 
-    def get_scanner_logs(self):
-        """Returns the stdout, stderr log files (returns empty strings if not found)"""
-        output_log = ""
-        error_log = ""
-        if os.path.exists(GocatorModel.STDOUTPATH):
-            with open(GocatorModel.STDOUTPATH, "rb") as stdout_fid:
-                output_log = stdout_fid.read()
-            with open(GocatorModel.STDERRPATH, "rb") as stderr_fid:
-                error_log = stderr_fid.read()
-        return output_log, error_log
+    def start_profiler(self, command=None, wait=True):
+        """Starts the persistent profiler (see profiler_supervisor.ProfilerSupervisor) if it isn't
+        running:  the specified command, default the profiler in interactive mode.  If wait,
+        returns True once the profiler is ready; otherwise it's started in the background."""
+        if self.supervisor is None:
+            if command is None:
+                command = [GocatorModel.SCANNERPATH, "-c" + self.config_fname, "-i"]
+            self.supervisor = ProfilerSupervisor(command, self.logs['output'], self.logs['error'],
+                                                 max_log_bytes=self.log_max_bytes, log_backups=self.log_backups)
+        return self.supervisor.start(wait)
+
+    def stop_profiler(self):
+        """Stops the persistent profiler"""
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+
+    def reload_profiler(self):
+        """Has the persistent profiler read the configuration again, once it's idle"""
+        if self.supervisor is not None:
+            self.supervisor.reload()
+
+    def profiler_status(self):
+        """Returns a JSON-friendly dict of the state of the device's profiler:  whether it's running
+        (targeting or scanning) and whether it's persistent.  For a persistent profiler, also
+        returns whether its process is up, its mode, how many times it's been restarted and the
+        last error starting it."""
+        status = {'device':self.device_id,
+                  'running':self.scanner_running,
+                  'persistent':self.persistent_profiler}
+        if self.supervisor is not None:
+            status.update({'process_running':self.supervisor.running,
+                           'mode':self.supervisor.mode,
+                           'restarts':self.supervisor.restarts,
+                           'error':str(self.supervisor.error) if self.supervisor.error is not None else None})
+        return status
+
+    def get_scanner_logs(self, max_lines=None, max_bytes=TAIL_BYTES):
+        """Returns the ends of the stdout, stderr log files:  at most max_lines lines and max_bytes
+        bytes of each (returns empty strings if not found)"""
+        return tuple(self.read_scanner_log(log, max_lines=max_lines, max_bytes=max_bytes)['text']
+                     for log in ('output', 'error'))
+
+    def read_scanner_log(self, log='output', backup=0, before=None, max_lines=None, max_bytes=TAIL_BYTES):
+        """Returns a dict of the lines of the specified log ('output' or 'error') or one of its
+        rotated backups that end at byte offset before (see log_reader.read_tail).  'older' is
+        the backup and offset of the preceding lines, or None if these are the oldest lines."""
+        if log not in self.logs:
+            raise ValueError("Unknown log '{0}', must be one of {1}".format(log, sorted(self.logs)))
+        if not 0 <= backup <= self.log_backups:
+            raise ValueError("Log backup must be between 0 and {0}".format(self.log_backups))
+        log_fname = backup_fname(self.logs[log], backup)
+        try:
+            chunk = read_tail(log_fname, max_lines, max_bytes, before)
+        except (IOError, OSError): # no log
+            chunk = {'text':b"", 'start':0, 'end':0, 'size':0}
+        chunk.update({'log':log, 'backup':backup, 'older':None})
+        if chunk['start'] > 0:
+            chunk['older'] = {'backup':backup, 'before':chunk['start']}
+        elif backup < self.log_backups and os.path.exists(backup_fname(self.logs[log], backup + 1)):
+            chunk['older'] = {'backup':backup + 1, 'before':None}
+        return chunk
 
     def clear_scanner_logs(self):
-        """Erases the scanner's logs"""
+        """Erases the scanner's logs and their rotated backups"""
         try:
-            if os.path.exists(GocatorModel.STDOUTPATH):
-                os.remove(GocatorModel.STDOUTPATH)
-            if os.path.exists(GocatorModel.STDERRPATH):
-                os.remove(GocatorModel.STDERRPATH)
+            for log_fname in self.logs.values():
+                for backup in range(self.log_backups + 1):
+                    if os.path.exists(backup_fname(log_fname, backup)):
+                        os.remove(backup_fname(log_fname, backup))
         except OSError: # couldn't remove file
             pass
         except WindowsError: # file in use (Windows)
             pass
 
-    def profile(self, data_file, img_file):
-        """Produces a basic plot of the specified data file, saved as PNG to specified image file."""
+    def profile(self, data_file, img_file, mode='heightmap', cmap='Set1', z_cutoff=VALID_Z_THRESHOLD,
+                size=(640, 480), decimation='minmax', point_budget=POINT_BUDGET, block_size=BLOCK_SIZE):
+        """Produces a basic plot of the specified data file, saved to the specified image file
+        (format set by the file's extension).  Returns the name of the image file.
+        Mode is either 'heightmap' (mean range binned onto a regular grid, render time roughly
+        independent of the number of points) or 'scatter' (the valid points, reduced to at most
+        point_budget points with the specified decimation mode unless decimation is None).
+        Points with a range at or below z_cutoff are ignored, size is the (width, height) of
+        the image in pixels.  The data file is read and plotted in blocks of block_size points,
+        so memory use is bounded by the block size - except for an undecimated scatter plot,
+        which holds every valid point of the scan.  If the model has a plot cache, the plot is
+        returned from or saved to the cache rather than img_file."""
+        if mode not in GocatorModel.PLOT_MODES:
+            raise ValueError("Unknown plot mode '{0}', must be one of {1}".format(mode, GocatorModel.PLOT_MODES))
+        y_step = self.get_configured_encoder()['encoder_resolution']
+        file_format = os.path.splitext(img_file)[1].lstrip('.').lower()
+        if self.plot_cache is not None:
+            cache_key = self.plot_cache.key(data_file, mode=mode, cmap=cmap, z_cutoff=z_cutoff,
+                                            size=tuple(size), y_step=y_step, decimation=decimation,
+                                            point_budget=point_budget)
+            cached_file = self.plot_cache.get(cache_key, file_format)
+            if cached_file is not None:
+                return cached_file
         matplotlib.rcParams['axes.formatter.limits'] = -4, 4
         matplotlib.rcParams['font.size'] = 9
         matplotlib.rcParams['axes.titlesize'] = 9
         matplotlib.rcParams['axes.labelsize'] = 9
         matplotlib.rcParams['xtick.labelsize'] = 8
         matplotlib.rcParams['ytick.labelsize'] = 8
-        figure = Figure()
+        figure = Figure(figsize=(float(size[0]) / GocatorModel.PLOT_DPI, float(size[1]) / GocatorModel.PLOT_DPI),
+                        dpi=GocatorModel.PLOT_DPI)
         canvas = FigureCanvas(figure)
         axes = figure.gca()
-        x, y, z = np.genfromtxt(data_file, delimiter=",", unpack=True)
-        xi = x[z>-20]
-        yi = y[z>-20]
-        zi = z[z>-20]
-        scatter_plt = axes.scatter(xi, yi, c=zi, marker="+", cmap=cm.get_cmap("Set1"))
+        bounds = None
+        if z_cutoff == VALID_Z_THRESHOLD:
+            # Stored bounds are of the points above the standard threshold
+            metadata = read_metadata(data_file)
+            if metadata is not None:
+                bounds = metadata['bounds']
+        if mode == 'heightmap':
+            plt = self.plot_heightmap(axes, data_file, cmap, z_cutoff, y_step, block_size, bounds)
+        else:
+            plt = self.plot_scatter(axes, data_file, cmap, z_cutoff, decimation, point_budget, y_step, block_size,
+                                    bounds)
         axes.grid(True)
-        axes.axis([np.min(xi), np.max(xi), np.min(yi), np.max(yi)])
-        colorbar = figure.colorbar(scatter_plt)
+        colorbar = figure.colorbar(plt)
         colorbar.set_label("Range [mm]")
         axes.set_xlabel("Horizontal Position [mm]")
         axes.set_ylabel("Scan Position [mm]")
-        figure.savefig(img_file)
+        figure.savefig(img_file, dpi=GocatorModel.PLOT_DPI)
+        if self.plot_cache is not None:
+            return self.plot_cache.put(cache_key, file_format, img_file)
+        return img_file
+
+    def plot_scatter(self, axes, data_file, cmap='Set1', z_cutoff=VALID_Z_THRESHOLD, decimation='minmax',
+                     point_budget=POINT_BUDGET, y_step=None, block_size=BLOCK_SIZE, bounds=None):
+        """Scatter plots the valid points of the specified data file on the specified axes, returns
+        the (last) scatter plot.  Unless decimation is None the points are first reduced to at most
+        point_budget points with the specified decimation mode (see decimate.decimate).  Without
+        decimation the axes keep each block's points, so memory use grows with the length of the scan.
+        The axis limits and color scale are set by the [(xmin, xmax), (ymin, ymax), (zmin, zmax)]
+        bounds of the scan if known, otherwise by the bounds of the plotted points."""
+        if decimation is not None:
+            blocks = [decimate(self.valid_points(data_file, z_cutoff, block_size), point_budget,
+                               decimation, y_step=y_step)]
+        else:
+            blocks = self.valid_points(data_file, z_cutoff, block_size)
+        norm = Normalize()
+        plotted_bounds = None
+        scatter_plt = None
+        for x, y, z in blocks:
+            if x.size == 0:
+                continue
+            scatter_plt = axes.scatter(x, y, c=z, marker="+", cmap=cm.get_cmap(cmap), norm=norm)
+            plotted_bounds = merge_bounds(plotted_bounds, x, y, z)
+        if plotted_bounds is None:
+            raise ValueError("No valid profile data in {0}".format(data_file))
+        if bounds is None:
+            bounds = plotted_bounds
+        (xmin, xmax), (ymin, ymax), (zmin, zmax) = bounds
+        # Each block's scatter plot shares the same norm, scale it to the entire scan
+        norm.vmin = zmin
+        norm.vmax = zmax
+        axes.axis([xmin, xmax, ymin, ymax])
+        return scatter_plt
+
+    def plot_heightmap(self, axes, data_file, cmap='Set1', z_cutoff=VALID_Z_THRESHOLD, y_step=None,
+                       block_size=BLOCK_SIZE, bounds=None):
+        """Plots the specified data file on the specified axes as a heightmap of the valid points'
+        mean range, using y_step (e.g. the encoder resolution) as the grid's Y spacing and the
+        profile spacing as its X spacing.  The color scale is set by the scan's
+        [(xmin, xmax), (ymin, ymax), (zmin, zmax)] bounds if known.  Returns the image plot."""
+        heightmap = Heightmap(y_step=y_step)
+        for x, y, z in self.valid_points(data_file, z_cutoff, block_size):
+            heightmap.add(x, y, z)
+        if heightmap.num_points == 0:
+            raise ValueError("No valid profile data in {0}".format(data_file))
+        norm = Normalize(*bounds[2]) if bounds is not None else None
+        return axes.imshow(heightmap.image(), origin='lower', extent=heightmap.extent, aspect='auto',
+                           interpolation='nearest', cmap=cm.get_cmap(cmap), norm=norm)
+
+    def build_tiles(self, data_file, output_folder, cmap='Set1', z_cutoff=VALID_Z_THRESHOLD,
+                    max_cells=TILE_MAX_CELLS, block_size=BLOCK_SIZE):
+        """Builds a Deep Zoom tile pyramid of the heightmap of the specified data file in
+        output_folder, at up to max_cells cells of full resolution.  The heightmap is accumulated
+        in float32, plenty for coloring tiles.  Returns the name of the pyramid's .dzi descriptor file."""
+        heightmap = Heightmap(y_step=self.get_configured_encoder()['encoder_resolution'], max_cells=max_cells,
+                              dtype=np.float32)
+        for x, y, z in self.valid_points(data_file, z_cutoff, block_size):
+            heightmap.add(x, y, z)
+        if heightmap.num_points == 0:
+            raise ValueError("No valid profile data in {0}".format(data_file))
+        name = os.path.basename(scan_root(data_file))
+        return build_pyramid(heightmap.sum, heightmap.count, output_folder, name, cmap)
+
+    def valid_points(self, data_file, z_cutoff=VALID_Z_THRESHOLD, block_size=BLOCK_SIZE):
+        """Generator that yields the X, Y, Z arrays of the points in the specified data file
+        with a range above z_cutoff, in blocks of at most block_size points."""
+        for x, y, z in iter_scan(data_file, block_size):
+            valid = z > z_cutoff
+            yield x[valid], y[valid], z[valid]
@@ -0,0 +1,202 @@
+"""heightmap.py - bins Gocator scan points onto a regular X/Y grid
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import numpy as np
+
+# Default maximum number of grid cells - grid is coarsened 2x2 when exceeded
+MAX_CELLS = 1024 * 1024
+
+def estimate_steps(x, y):
+    """Estimates the X (profile spacing) and Y (scan position spacing) grid steps from
+    a block of points.  Returns (x_step, y_step), either of which may be None if it
+    couldn't be estimated."""
+    x_diffs = np.abs(np.diff(x))
+    x_diffs = x_diffs[x_diffs > 0]
+    y_diffs = np.diff(np.unique(y))
+    x_step = float(np.median(x_diffs)) if x_diffs.size else None
+    y_step = float(np.median(y_diffs)) if y_diffs.size else None
+    return x_step, y_step
+
+class Heightmap(object):
+    """Accumulates scan points into a regular grid of mean Z (and optionally minimum and
+    maximum Z).  The grid grows as points are added, and is coarsened by 2x2 binning if it
+    would exceed max_cells cells.  Z is accumulated as dtype:  float32 halves the grid's memory
+    (counts are then 32-bit too) at the cost of precision."""
+
+    def __init__(self, x_step=None, y_step=None, max_cells=MAX_CELLS, track_extrema=False, dtype=np.float64):
+        self.x_step = x_step if x_step else None
+        self.y_step = y_step if y_step else None
+        self.max_cells = max_cells
+        self.track_extrema = track_extrema
+        self.dtype = np.dtype(dtype)
+        self.count_dtype = np.dtype(np.int32 if self.dtype.itemsize <= 4 else np.int64)
+        self.x_origin = None # X position of the edge of grid column 0
+        self.y_origin = None # Y position of the edge of grid row 0
+        self.row0 = 0 # grid index of the first row
+        self.col0 = 0 # grid index of the first column
+        self.sum = None # sum of Z in each cell
+        self.count = None # number of points in each cell
+        self.zmin = None # minimum Z in each cell if tracking extrema
+        self.zmax = None # maximum Z in each cell if tracking extrema
+
+    @property
+    def shape(self):
+        """Returns the (rows, columns) shape of the grid"""
+        if self.sum is None:
+            return 0, 0
+        return self.sum.shape
+
+    @property
+    def extent(self):
+        """Returns the [xmin, xmax, ymin, ymax] extent of the grid's cell edges"""
+        rows, cols = self.shape
+        return [self.x_origin + self.col0 * self.x_step, self.x_origin + (self.col0 + cols) * self.x_step,
+                self.y_origin + self.row0 * self.y_step, self.y_origin + (self.row0 + rows) * self.y_step]
+
+    @property
+    def num_points(self):
+        """Returns the number of points added to the grid"""
+        if self.count is None:
+            return 0
+        return int(self.count.sum())
+
+    def add(self, x, y, z):
+        """Adds the specified points to the grid.  Cost is proportional to the number of
+        points added (plus the occasional grid reallocation)."""
+        if x.size == 0:
+            return
+        if self.x_step is None or self.y_step is None:
+            x_step, y_step = estimate_steps(x, y)
+            self.x_step = self.x_step or x_step
+            self.y_step = self.y_step or y_step
+            if self.x_step is None or self.y_step is None:
+                raise ValueError("Unable to determine heightmap grid spacing")
+        if self.x_origin is None:
+            # Center the cells on multiples of the steps so that positions recorded at the
+            # scanner's resolution don't straddle cell edges
+            self.x_origin = -0.5 * self.x_step
+            self.y_origin = -0.5 * self.y_step
+        rows, cols = self._indices(x, y)
+        self._include(rows.min(), rows.max(), cols.min(), cols.max())
+        # Grid may have been coarsened to make room
+        rows, cols = self._indices(x, y)
+        rows -= self.row0
+        cols -= self.col0
+        cells, inverse = np.unique(rows * self.sum.shape[1] + cols, return_inverse=True)
+        z = np.asarray(z, dtype=np.float64)
+        self.sum.flat[cells] += np.bincount(inverse, weights=z)
+        self.count.flat[cells] += np.bincount(inverse)
+        if self.track_extrema:
+            # Group the points by cell to reduce each cell's Z in one call
+            order = np.argsort(inverse, kind='mergesort')
+            starts = np.searchsorted(inverse[order], np.arange(cells.size))
+            z_by_cell = z[order]
+            self.zmin.flat[cells] = np.minimum(self.zmin.flat[cells], np.minimum.reduceat(z_by_cell, starts))
+            self.zmax.flat[cells] = np.maximum(self.zmax.flat[cells], np.maximum.reduceat(z_by_cell, starts))
+
+    def image(self):
+        """Returns the grid of mean Z, NaN in cells without points"""
+        if self.sum is None:
+            return np.empty((0, 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.sum / self.count, np.nan)
+
+    def points(self, statistic='mean'):
+        """Returns the X, Y cell centers and the 'mean', 'min' or 'max' Z (the latter two only if
+        tracking extrema) of the cells that contain points"""
+        if self.count is None:
+            return np.empty(0), np.empty(0), np.empty(0)
+        rows, cols = np.nonzero(self.count)
+        x = self.x_origin + (self.col0 + cols + 0.5) * self.x_step
+        y = self.y_origin + (self.row0 + rows + 0.5) * self.y_step
+        if statistic == 'min':
+            z = self.zmin[rows, cols]
+        elif statistic == 'max':
+            z = self.zmax[rows, cols]
+        else:
+            z = self.sum[rows, cols] / self.count[rows, cols]
+        return x, y, z
+
+    def _indices(self, x, y):
+        """Returns the (rows, columns) grid indices of the specified points"""
+        cols = np.floor((np.asarray(x) - self.x_origin) / self.x_step).astype(np.int64)
+        rows = np.floor((np.asarray(y) - self.y_origin) / self.y_step).astype(np.int64)
+        return rows, cols
+
+    def _include(self, row_min, row_max, col_min, col_max):
+        """Grows (and if necessary coarsens) the grid to include the specified
+        grid indices"""
+        if self.sum is None:
+            self.row0, self.col0 = row_min, col_min
+            self._allocate(row_max - row_min + 1, col_max - col_min + 1, 0, 0)
+        else:
+            rows, cols = self.sum.shape
+            if row_min >= self.row0 and row_max < self.row0 + rows and \
+               col_min >= self.col0 and col_max < self.col0 + cols:
+                return
+            new_row0 = min(row_min, self.row0)
+            new_col0 = min(col_min, self.col0)
+            new_rows = max(row_max + 1, self.row0 + rows) - new_row0
+            new_cols = max(col_max + 1, self.col0 + cols) - new_col0
+            # Leave room to grow in the direction(s) of growth to amortize reallocation
+            slack_rows = rows // 2 if new_rows > rows else 0
+            slack_cols = cols // 2 if new_cols > cols else 0
+            if (new_rows + slack_rows) * (new_cols + slack_cols) > self.max_cells:
+                slack_rows = slack_cols = 0
+            before_rows = slack_rows if new_row0 < self.row0 else 0
+            before_cols = slack_cols if new_col0 < self.col0 else 0
+            new_row0 -= before_rows
+            new_col0 -= before_cols
+            self._allocate(new_rows + slack_rows, new_cols + slack_cols,
+                           self.row0 - new_row0, self.col0 - new_col0)
+            self.row0, self.col0 = new_row0, new_col0
+        while self.sum.size > self.max_cells and self.sum.size > 1:
+            self._coarsen()
+
+    def _allocate(self, rows, cols, row_offset, col_offset):
+        """Reallocates the grid to the specified shape, copying the current grid
+        to the specified offset"""
+        new_sum = np.zeros((rows, cols), dtype=self.dtype)
+        new_count = np.zeros((rows, cols), dtype=self.count_dtype)
+        if self.track_extrema:
+            new_zmin = np.full((rows, cols), np.inf, dtype=self.dtype)
+            new_zmax = np.full((rows, cols), -np.inf, dtype=self.dtype)
+        if self.sum is not None:
+            old_rows, old_cols = self.sum.shape
+            old_cells = (slice(row_offset, row_offset + old_rows), slice(col_offset, col_offset + old_cols))
+            new_sum[old_cells] = self.sum
+            new_count[old_cells] = self.count
+            if self.track_extrema:
+                new_zmin[old_cells] = self.zmin
+                new_zmax[old_cells] = self.zmax
+        self.sum = new_sum
+        self.count = new_count
+        if self.track_extrema:
+            self.zmin = new_zmin
+            self.zmax = new_zmax
+
+    def _coarsen(self):
+        """Doubles the grid steps, combining each 2x2 block of cells"""
+        rows, cols = self.sum.shape
+        # Pad so the grid starts on an even index and has an even number of rows and columns
+        pad_top = self.row0 % 2
+        pad_left = self.col0 % 2
+        pad_bottom = (rows + pad_top) % 2
+        pad_right = (cols + pad_left) % 2
+        padding = ((pad_top, pad_bottom), (pad_left, pad_right))
+        grid_sum = np.pad(self.sum, padding, mode='constant')
+        grid_count = np.pad(self.count, padding, mode='constant')
+        new_shape = (grid_sum.shape[0] // 2, 2, grid_sum.shape[1] // 2, 2)
+        self.sum = grid_sum.reshape(new_shape).sum(axis=3, dtype=self.dtype).sum(axis=1, dtype=self.dtype)
+        self.count = grid_count.reshape(new_shape).sum(axis=3, dtype=self.count_dtype).sum(axis=1, dtype=self.count_dtype)
+        if self.track_extrema:
+            grid_zmin = np.pad(self.zmin, padding, mode='constant', constant_values=np.inf)
+            grid_zmax = np.pad(self.zmax, padding, mode='constant', constant_values=-np.inf)
+            self.zmin = grid_zmin.reshape(new_shape).min(axis=3).min(axis=1)
+            self.zmax = grid_zmax.reshape(new_shape).max(axis=3).max(axis=1)
+        self.row0 = (self.row0 - pad_top) // 2
+        self.col0 = (self.col0 - pad_left) // 2
+        self.x_step *= 2
+        self.y_step *= 2
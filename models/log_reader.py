@@ -0,0 +1,75 @@
+"""log_reader.py - size-based rotation of log files, and reading the end of a log without
+reading the whole file
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+
+# Size of the blocks read backwards from the end of a log
+BLOCK_SIZE = 16 * 1024
+# Default maximum number of bytes returned by read_tail
+TAIL_BYTES = 64 * 1024
+
+def backup_fname(log_fname, backup):
+    """Returns the name of the specified backup of a log (0 for the current log, 1 for the most recent backup)"""
+    if backup == 0:
+        return log_fname
+    return "{0}.{1}".format(log_fname, backup)
+
+def rotate_log(log_fname, backup_count):
+    """Renames the log to its first backup (log.1), shifting older backups up and removing the
+    oldest.  With no backups the log is removed."""
+    for backup in range(backup_count, 0, -1):
+        older_fname = backup_fname(log_fname, backup)
+        newer_fname = backup_fname(log_fname, backup - 1)
+        if os.path.exists(newer_fname):
+            if os.path.exists(older_fname):
+                os.remove(older_fname)
+            os.rename(newer_fname, older_fname)
+    if os.path.exists(log_fname):
+        os.remove(log_fname)
+
+def read_tail(log_fname, max_lines=None, max_bytes=TAIL_BYTES, before=None, block_size=BLOCK_SIZE):
+    """Returns a dict of the last lines of the specified log that end at byte offset before (default
+    the end of the log):  at most max_lines lines and max_bytes bytes of text, starting at the
+    start of a line unless a single line is longer than max_bytes.  Also returns the offsets of
+    the start and end of the text and the size of the log; pass start as before to read the
+    preceding lines.  The log is read backwards from the end, a block at a time, so only
+    about as much as is returned is read."""
+    with open(log_fname, "rb") as fid:
+        fid.seek(0, os.SEEK_END)
+        size = fid.tell()
+        end = size if before is None else max(0, min(int(before), size))
+        start = end
+        data = b""
+        while start > 0:
+            read_size = min(block_size, start)
+            start -= read_size
+            fid.seek(start)
+            data = fid.read(read_size) + data
+            # One byte beyond the limits shows whether the text starts at the start of a line
+            if max_bytes is not None and len(data) > max_bytes:
+                break
+            if max_lines is not None and data.count(b"\n") > max_lines:
+                break
+    cut = 0
+    if max_bytes is not None and len(data) > max_bytes:
+        line_end = data.find(b"\n", len(data) - max_bytes - 1)
+        if line_end == -1 or line_end == len(data) - 1: # last line is longer than max_bytes
+            cut = len(data) - max_bytes
+        else:
+            cut = line_end + 1
+    elif start > 0:
+        # Started reading part way through a line
+        cut = data.find(b"\n") + 1
+    if max_lines is not None:
+        pos = len(data) - 1 if data.endswith(b"\n") else len(data)
+        for line in range(max_lines):
+            pos = data.rfind(b"\n", 0, pos)
+            if pos == -1:
+                break
+        if pos != -1:
+            cut = max(cut, pos + 1)
+    return {'text':data[cut:], 'start':start + cut, 'end':end, 'size':size}
@@ -0,0 +1,127 @@
+"""plot_cache.py - content-addressed cache of rendered scan plots
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import os.path
+import threading
+
+# Default maximum size of the cache in bytes
+MAX_BYTES = 100 * 1024 * 1024
+# Prefix of cached plot filenames - identifies the cache's files in a shared folder
+PREFIX = "plot_"
+# Number of data file digests remembered by file_digest
+MAX_DIGESTS = 256
+
+# (path, size, modification time, inode) -> SHA-1 hex digest of the file, least-recently used first
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+
+def hash_file(fname, chunk_size=1024 * 1024):
+    """Returns the SHA-1 hex digest of the contents of the specified file"""
+    digest = hashlib.sha1()
+    with open(fname, "rb") as fid:
+        while True:
+            chunk = fid.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_digest(fname):
+    """Returns the SHA-1 hex digest of the contents of the specified file.  Digests are remembered by
+    the file's path, size, modification time and inode, so the file is only read again once it changes."""
+    stats = os.stat(fname)
+    identity = (os.path.abspath(fname), stats.st_size, stats.st_mtime, stats.st_ino)
+    with _digests_lock:
+        digest = _digests.pop(identity, None)
+        if digest is not None:
+            _digests[identity] = digest
+            return digest
+    digest = hash_file(fname)
+    with _digests_lock:
+        _digests[identity] = digest
+        while len(_digests) > MAX_DIGESTS:
+            _digests.popitem(last=False)
+    return digest
+
+class PlotCache(object):
+    """Cache of plot files keyed by a hash of the data file and the render settings.
+    Entries are evicted least-recently-used first once the cache exceeds max_bytes."""
+
+    def __init__(self, folder, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def key(self, data_file, **render_settings):
+        """Returns the cache key for the specified data file rendered with the specified settings"""
+        digest = hashlib.sha1(file_digest(data_file).encode('ascii'))
+        for setting in sorted(render_settings):
+            digest.update("{0}={1!r};".format(setting, render_settings[setting]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def fname(self, key, file_format):
+        """Returns the name of the cached plot for the specified key and file format (e.g. 'png')"""
+        return os.path.join(self.folder, "{0}{1}.{2}".format(PREFIX, key, file_format))
+
+    def key_of(self, fname):
+        """Returns the key of the specified file if it's a plot in this cache, otherwise None"""
+        folder, basename = os.path.split(os.path.abspath(fname))
+        if folder != os.path.abspath(self.folder) or not basename.startswith(PREFIX):
+            return None
+        return os.path.splitext(basename)[0][len(PREFIX):]
+
+    def get(self, key, file_format):
+        """Returns the name of the cached plot, or None if not in the cache"""
+        cached_file = self.fname(key, file_format)
+        try:
+            os.utime(cached_file, None) # Most recently used
+            return cached_file
+        except OSError: # Not in cache
+            return None
+
+    def put(self, key, file_format, plot_file):
+        """Moves the specified plot file into the cache, returns the name of the cached plot"""
+        cached_file = self.fname(key, file_format)
+        if os.path.exists(cached_file):
+            os.remove(cached_file)
+        os.rename(plot_file, cached_file)
+        self.evict()
+        return cached_file
+
+    def entries(self):
+        """Returns a list of (modification time, size, filename) of the cached plots, oldest first"""
+        entries = []
+        for fname in os.listdir(self.folder):
+            if fname.startswith(PREFIX):
+                full_fname = os.path.join(self.folder, fname)
+                try:
+                    stat = os.stat(full_fname)
+                    entries.append((stat.st_mtime, stat.st_size, full_fname))
+                except OSError: # Removed in the meantime
+                    pass
+        return sorted(entries)
+
+    def evict(self):
+        """Removes the least-recently used plots until the cache is no larger than max_bytes"""
+        entries = self.entries()
+        total_bytes = sum(size for mtime, size, fname in entries)
+        for mtime, size, fname in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(fname)
+                total_bytes -= size
+            except OSError: # Removed in the meantime
+                pass
+
+    def clear(self):
+        """Removes all the cached plots"""
+        for mtime, size, fname in self.entries():
+            try:
+                os.remove(fname)
+            except OSError: # Removed in the meantime
+                pass
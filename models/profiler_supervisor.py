@@ -0,0 +1,244 @@
+"""profiler_supervisor.py - keeps one long-lived profiler process connected to the sensor,
+switching it between idle, target and scan modes over its standard input and restarting it
+if it dies
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import subprocess
+import threading
+import time
+
+from stream_pump import LOG_BACKUPS, StreamPump
+
+IDLE = 'idle'
+TARGET = 'target'
+SCAN = 'scan'
+MODES = (IDLE, TARGET, SCAN)
+# Seconds to wait for the profiler to acknowledge a command, or to be ready after starting
+ACK_TIMEOUT = 10
+# Seconds to wait for the profiler to quit before terminating it
+STOP_TIMEOUT = 5
+# Seconds between checks that the profiler is still running
+POLL_INTERVAL = 0.5
+# Seconds to wait before restarting a profiler that died, doubled for each consecutive failure
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+
+def stop_process(proc, timeout=STOP_TIMEOUT):
+    """Waits up to timeout seconds for the process to quit, then terminates it and if necessary
+    kills it.  Returns True if the process quit."""
+    for signal_fn in (None, proc.terminate, proc.kill):
+        if signal_fn is not None:
+            try:
+                signal_fn()
+            except OSError: # process quit in the meantime
+                pass
+        deadline = time.time() + timeout
+        while proc.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if proc.poll() is not None:
+            return True
+    return False
+
+def command_line(mode, *args):
+    """Returns the line sent to the profiler to switch to the specified mode:  the mode and its
+    arguments separated by tabs (tabs and newlines in the arguments are replaced by spaces)"""
+    fields = []
+    for field in (mode,) + args:
+        if isinstance(field, bytes):
+            field = field.decode('utf-8')
+        for char in u"\t\r\n":
+            field = field.replace(char, u" ")
+        fields.append(field)
+    return (u"\t".join(fields) + u"\n").encode('utf-8')
+
+class ProfilerSupervisor(object):
+    """Runs the profiler as one long-lived process, so that it connects to the sensor and reads
+    its configuration once rather than for every scan.  The profiler reads commands from its
+    standard input, one per line - idle, target, scan<tab>output file<tab>comments or quit -
+    and acknowledges each mode with the line 'ok <mode>' on its standard output, as well as
+    'ok idle' once it's ready after starting.  Its standard output and error are drained to
+    the log files.  While started, a monitor thread restarts the profiler if it dies (with a
+    delay that grows if it keeps dying); targeting resumes after a restart but a scan doesn't."""
+
+    def __init__(self, command, stdout_log=None, stderr_log=None, max_log_bytes=None, log_backups=LOG_BACKUPS):
+        self.command = command
+        self.stdout_log = stdout_log
+        self.stderr_log = stderr_log
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+        self.ack_timeout = ACK_TIMEOUT
+        self.stop_timeout = STOP_TIMEOUT
+        self.poll_interval = POLL_INTERVAL
+        self.restart_delay = RESTART_DELAY
+        self.max_restart_delay = MAX_RESTART_DELAY
+        self.lock = threading.RLock() # serializes commands, restarts and stopping
+        self.proc = None # profiler subprocess
+        self.stdout_pump = None # StreamPump draining the profiler's stdout
+        self.stderr_pump = None # StreamPump draining the profiler's stderr
+        self.mode = IDLE # mode the profiler last acknowledged
+        self.started = None # time the profiler was started
+        self.restarts = 0 # number of times the profiler was restarted after dying
+        self.last_exit = None # exit code of the last profiler that died
+        self.error = None # last error raised starting the profiler, if any
+        self.reload_pending = False # restart once idle so the profiler reads its configuration again
+        self.stop_event = threading.Event()
+        self.monitor_thread = None
+
+    @property
+    def running(self):
+        """Returns True if the profiler process is running"""
+        proc = self.proc
+        return proc is not None and proc.poll() is None
+
+    def start(self, wait=True):
+        """Starts keeping the profiler running.  If wait, the profiler is started now and True
+        returned once it's ready; otherwise it's started in the background."""
+        with self.lock:
+            self.stop_event.clear()
+            if self.monitor_thread is None or not self.monitor_thread.is_alive():
+                self.monitor_thread = threading.Thread(target=self.monitor)
+                self.monitor_thread.daemon = True
+                self.monitor_thread.start()
+            if self.running or not wait:
+                return self.running
+            return self.launch()
+
+    def stop(self):
+        """Stops the monitor thread and the profiler"""
+        self.stop_event.set()
+        if self.monitor_thread is not None:
+            self.monitor_thread.join()
+            self.monitor_thread = None
+        with self.lock:
+            self.shutdown()
+
+    def idle(self):
+        """Stops targeting or scanning, starting the profiler if necessary.  If the profiler
+        doesn't acknowledge it's restarted, so that any scan's output file is closed.  Returns
+        True if the profiler is idle."""
+        with self.lock:
+            return self.send(IDLE) or self.restart()
+
+    def target(self):
+        """Switches to targeting mode, returns True if the profiler acknowledged"""
+        return self.send(TARGET)
+
+    def scan(self, output_file, comments=None):
+        """Starts scanning to the specified output file, with optional comments added to its
+        header.  Returns True if the profiler acknowledged."""
+        return self.send(SCAN, output_file, comments or "")
+
+    def reload(self):
+        """Has the profiler read its configuration again, by restarting it once it's idle"""
+        with self.lock:
+            self.reload_pending = self.proc is not None
+
+    def send(self, mode, *args):
+        """Switches the profiler to the specified mode, starting it if necessary (restarting it
+        first if a reload is pending).  Returns True if the profiler acknowledged."""
+        if mode not in MODES:
+            raise ValueError("Unknown profiler mode '{0}', must be one of {1}".format(mode, MODES))
+        with self.lock:
+            if self.reload_pending and mode != IDLE:
+                self.restart()
+            if not self.start():
+                return False
+            since = self.stdout_pump.num_lines
+            try:
+                self.proc.stdin.write(command_line(mode, *args))
+                self.proc.stdin.flush()
+            except (IOError, OSError): # profiler died, the monitor restarts it
+                return False
+            if not self.wait_for_ack(mode, since):
+                return False
+            self.mode = mode
+            return True
+
+    def restart(self):
+        """Stops the profiler and starts a new one, returns True once it's ready"""
+        with self.lock:
+            self.shutdown()
+            return self.launch()
+
+    def launch(self):
+        """Starts a new profiler process, returns True once it's ready.  Caller must hold lock."""
+        self.proc = subprocess.Popen(self.command,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+        self.started = time.time()
+        self.mode = IDLE
+        self.reload_pending = False
+        self.stdout_pump = StreamPump(self.proc.stdout, self.stdout_log,
+                                      max_log_bytes=self.max_log_bytes, log_backups=self.log_backups)
+        self.stderr_pump = StreamPump(self.proc.stderr, self.stderr_log,
+                                      max_log_bytes=self.max_log_bytes, log_backups=self.log_backups)
+        self.stdout_pump.start()
+        self.stderr_pump.start()
+        return self.wait_for_ack(IDLE, 0)
+
+    def shutdown(self):
+        """Asks the profiler to quit, terminating it if it doesn't.  Caller must hold lock."""
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write(command_line('quit'))
+                self.proc.stdin.close()
+            except (IOError, OSError): # process quit in the meantime
+                pass
+            stop_process(self.proc, self.stop_timeout)
+        for pump in (self.stdout_pump, self.stderr_pump):
+            if pump is not None:
+                pump.join(self.stop_timeout)
+        self.proc = None
+        self.mode = IDLE
+
+    def wait_for_ack(self, mode, since):
+        """Waits up to ack_timeout seconds for the profiler to acknowledge the specified mode in a
+        line of its standard output numbered after since, returns True if it did"""
+        ack = "ok {0}".format(mode).encode('ascii')
+        deadline = time.time() + self.ack_timeout
+        while True:
+            finished = self.proc.poll() is not None or time.time() > deadline
+            for line_number, line in self.stdout_pump.recent(since):
+                if line.strip() == ack:
+                    return True
+                since = line_number
+            if finished:
+                return False
+            time.sleep(0.05)
+
+    def monitor(self):
+        """Thread target - keeps the profiler running until stopped:  starts it if it isn't
+        running, and restarts it once idle if a reload is pending"""
+        failures = 0 # consecutive failures to keep the profiler running
+        resume_target = False
+        delay = 0
+        while not self.stop_event.wait(delay):
+            delay = self.poll_interval
+            with self.lock:
+                try:
+                    if self.proc is None:
+                        if self.launch() and resume_target:
+                            self.send(TARGET)
+                        resume_target = False
+                        self.error = None
+                    elif self.proc.poll() is not None:
+                        # Died, restarted on the next pass
+                        self.last_exit = self.proc.returncode
+                        self.restarts += 1
+                        resume_target = self.mode == TARGET
+                        if time.time() - self.started > self.max_restart_delay:
+                            failures = 0
+                        failures += 1
+                        delay = min(self.restart_delay * 2 ** (failures - 1), self.max_restart_delay)
+                        self.shutdown()
+                    elif self.reload_pending and self.mode == IDLE:
+                        self.restart()
+                except OSError as err: # e.g. profiler missing, try again later
+                    self.error = err
+                    failures += 1
+                    delay = min(self.restart_delay * 2 ** (failures - 1), self.max_restart_delay)
@@ -0,0 +1,164 @@
+"""render_jobs.py - renders scan plots in a pool of worker processes so that
+requests aren't blocked while plots are produced
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+import os.path
+import threading
+import uuid
+
+from gocator_model import GocatorModel
+from plot_cache import PlotCache
+from scan_catalog import ScanCatalog
+from scan_reader import compress_scan
+
+# Maximum number of finished jobs to remember
+MAX_FINISHED_JOBS = 100
+
+def render_profile(config_fname, data_file, img_file, cache_folder=None, cache_max_bytes=None, **settings):
+    """Worker function - plots the specified data file with a GocatorModel using the specified
+    scanner configuration and (optional) plot cache.  Returns the name of the image file."""
+    model = GocatorModel(config_fname)
+    if cache_folder is not None:
+        model.plot_cache = PlotCache(cache_folder, cache_max_bytes)
+    return model.profile(data_file, img_file, **settings)
+
+def render_tiles(config_fname, data_file, output_folder, **settings):
+    """Worker function - builds a Deep Zoom tile pyramid of the specified data file with a
+    GocatorModel using the specified scanner configuration.  Returns the name of the .dzi file."""
+    model = GocatorModel(config_fname)
+    return model.build_tiles(data_file, output_folder, **settings)
+
+def compress_cataloged(catalog_fname, data_file, compression):
+    """Worker function - replaces the specified scan file with a compressed copy, unless the scan
+    is removed from the specified catalog (e.g. evicted) in the meantime.  Returns the name of the
+    copy, or None if the scan was removed."""
+    catalog = ScanCatalog(catalog_fname)
+    try:
+        name = os.path.basename(data_file)
+        return compress_scan(data_file, compression, keep_fn=lambda: catalog.get(name) is not None)
+    finally:
+        catalog.close()
+
+class RenderJobs(object):
+    """Runs render jobs in a process pool and reports their status by job id"""
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self.executor = None # created on first use
+        self.jobs = OrderedDict() # job id -> Future, oldest first
+        self.subjects = {} # job id -> what the job works on, e.g. the name of its scan
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) in the process pool, returns the new job's id"""
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = self._submit(fn, *args, **kwargs)
+            self._prune()
+        return job_id
+
+    def submit_after(self, job_ids, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) in the process pool once the specified jobs have finished
+        (successfully or not), returns the new job's id.  The job is 'queued' until then."""
+        job_id = uuid.uuid4().hex
+        future = Future()
+        with self.lock:
+            waiting = [self.jobs[prior_id] for prior_id in job_ids if prior_id in self.jobs]
+            self.jobs[job_id] = future
+            self._prune()
+        remaining = [len(waiting)]
+        remaining_lock = threading.Lock()
+        def copy_result(job_future):
+            error = job_future.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(job_future.result())
+        def prior_done(prior_future=None):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                with self.lock:
+                    job_future = self._submit(fn, *args, **kwargs)
+            except Exception as err: # e.g. pool shut down
+                future.set_exception(err)
+                return
+            job_future.add_done_callback(copy_result)
+        if not waiting:
+            remaining[0] = 1
+            prior_done()
+        for prior_future in waiting:
+            prior_future.add_done_callback(prior_done)
+        return job_id
+
+    def tag(self, job_id, subject):
+        """Records what the job works on (e.g. the name of its scan), see pending_subjects"""
+        with self.lock:
+            if job_id in self.jobs:
+                self.subjects[job_id] = subject
+
+    def pending_subjects(self):
+        """Returns the set of subjects of the jobs that haven't finished yet"""
+        with self.lock:
+            return set(subject for job_id, subject in self.subjects.items() if not self.jobs[job_id].done())
+
+    def on_done(self, job_id, callback):
+        """Calls callback(result) once the job completes successfully (immediately if it already has)"""
+        with self.lock:
+            future = self.jobs.get(job_id)
+        if future is None:
+            return
+        def done(future):
+            if not future.cancelled() and future.exception() is None:
+                callback(future.result())
+        future.add_done_callback(done)
+
+    def status(self, job_id):
+        """Returns a dict of the job's status ('queued', 'running', 'done' or 'failed') and its
+        result or error, or None if the job id isn't known"""
+        with self.lock:
+            future = self.jobs.get(job_id)
+        if future is None:
+            return None
+        if not future.done():
+            return {'status':'running' if future.running() else 'queued'}
+        error = future.exception()
+        if error is not None:
+            return {'status':'failed', 'error':str(error) or error.__class__.__name__}
+        return {'status':'done', 'result':future.result()}
+
+    def result(self, job_id, timeout=None):
+        """Waits at most timeout seconds (forever if None) for the job to finish and returns its
+        result.  Raises the job's error if it failed, concurrent.futures.TimeoutError if it hasn't
+        finished in time and KeyError if the job id isn't known."""
+        with self.lock:
+            future = self.jobs[job_id]
+        return future.result(timeout)
+
+    def shutdown(self, wait=True):
+        """Shuts down the process pool"""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=wait)
+                self.executor = None
+
+    def _submit(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) in the process pool, returns its Future (lock must be held)"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def _prune(self):
+        """Forgets the oldest finished jobs once more than MAX_FINISHED_JOBS are stored"""
+        finished = [job_id for job_id, future in self.jobs.items() if future.done()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+            self.subjects.pop(job_id, None)
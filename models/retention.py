@@ -0,0 +1,92 @@
+"""retention.py - retention policy for stored scans, and a background thread that periodically
+evicts the scans the policy no longer allows
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import threading
+import time
+
+class RetentionPolicy(object):
+    """Limits the stored scans by total size in bytes, age in seconds and number of scans (None or 0
+    for no limit).  Pinned scans and the newest scan are never evicted, but pinned scans still count
+    towards the size and number limits."""
+
+    def __init__(self, max_bytes=None, max_age=None, max_count=None):
+        self.max_bytes = max_bytes or None
+        self.max_age = max_age or None
+        self.max_count = max_count or None
+
+    @property
+    def enabled(self):
+        """Returns True if any limit is set"""
+        return any(limit is not None for limit in (self.max_bytes, self.max_age, self.max_count))
+
+    def select(self, entries, now=None, protected=None):
+        """Returns the names of the scans to evict, oldest first, from the specified catalog entries
+        (dicts with name, created, size, derived_size and pinned).  A scan takes its size plus the
+        size of the files derived from it.  Scans named in protected are kept."""
+        if now is None:
+            now = time.time()
+        protected = set(protected or [])
+        entries = sorted(entries, key=lambda entry: (entry['created'], entry['name']))
+        sizes = dict((entry['name'], entry['size'] + entry.get('derived_size', 0)) for entry in entries)
+        total_bytes = sum(sizes.values())
+        total_count = len(entries)
+        evicted = []
+        for entry in entries[:-1]:
+            if entry['pinned'] or entry['name'] in protected:
+                continue
+            too_old = self.max_age is not None and entry['created'] < now - self.max_age
+            too_many = self.max_count is not None and total_count > self.max_count
+            too_big = self.max_bytes is not None and total_bytes > self.max_bytes
+            if too_old or too_many or too_big:
+                evicted.append(entry['name'])
+                total_bytes -= sizes[entry['name']]
+                total_count -= 1
+        return evicted
+
+class RetentionSweeper(object):
+    """Calls sweep_fn every interval seconds, or sooner when woken, on a daemon thread until stopped"""
+
+    def __init__(self, sweep_fn, interval=600):
+        self.sweep_fn = sweep_fn
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.thread = None
+        self.error = None # last error raised by sweep_fn, if any
+
+    def start(self):
+        """Starts sweeping, if not already started"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.wake_event.clear()
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def wake(self):
+        """Requests a sweep now (e.g. once a scan has been stored) instead of at the next interval"""
+        self.wake_event.set()
+
+    def stop(self):
+        """Stops sweeping and waits for the thread to finish"""
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """Thread target - sweeps until stopped, carries on if a sweep fails"""
+        while not self.stop_event.is_set():
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+            try:
+                self.sweep_fn()
+                self.error = None
+            except Exception as err: # e.g. a file in use, try again next sweep
+                self.error = err
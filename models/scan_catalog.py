@@ -0,0 +1,255 @@
+"""scan_catalog.py - SQLite catalog of the scans stored on the controller, so that listing
+scans doesn't require listing and stat'ing the data folder
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+import sqlite3
+import threading
+
+from plot_cache import PREFIX as PLOT_CACHE_PREFIX
+from scan_reader import SCAN_EXTENSIONS, count_points, metadata_fname, read_metadata, sidecar_fname
+
+# Catalog columns, in table order
+COLUMNS = ('name', 'path', 'created', 'modified', 'size', 'point_count', 'comment', 'plot_path', 'config_snapshot',
+           'pinned', 'derived_size', 'plot_key')
+# Columns scans can be sorted by - each has an index on (column, name) for paging
+SORT_COLUMNS = ('created', 'modified', 'size', 'point_count')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    size INTEGER NOT NULL,
+    point_count INTEGER NOT NULL,
+    comment TEXT,
+    plot_path TEXT,
+    config_snapshot TEXT,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    derived_size INTEGER NOT NULL DEFAULT 0,
+    plot_key TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_created ON scans (created, name);
+CREATE INDEX IF NOT EXISTS scans_modified ON scans (modified, name);
+CREATE INDEX IF NOT EXISTS scans_size ON scans (size, name);
+CREATE INDEX IF NOT EXISTS scans_point_count ON scans (point_count, name);
+"""
+
+def derived_files_size(path):
+    """Returns the size in bytes of the binary copy and metadata of the specified scan file, those
+    that exist"""
+    total_bytes = 0
+    for fname in (sidecar_fname(path), metadata_fname(path)):
+        try:
+            total_bytes += os.path.getsize(fname)
+        except OSError: # not converted yet
+            pass
+    return total_bytes
+
+class ScanCatalog(object):
+    """Catalog of scan files, keyed by file name.  Safe to share between threads."""
+
+    def __init__(self, db_fname):
+        self.db_fname = db_fname
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_fname, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Brings a catalog created by an older version up to date (lock must be held)"""
+        # Catalogs created before scans could be pinned
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(scans)")]
+        if 'pinned' not in columns:
+            self.connection.execute("ALTER TABLE scans ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        # ... and before the size of the files derived from scans was stored
+        if 'derived_size' not in columns:
+            self.connection.execute("ALTER TABLE scans ADD COLUMN derived_size INTEGER NOT NULL DEFAULT 0")
+            self.connection.executemany("UPDATE scans SET derived_size = ? WHERE name = ?",
+                                        [(derived_files_size(path), name) for name, path in
+                                         self.connection.execute("SELECT name, path FROM scans").fetchall()])
+        # ... and before plots shared through the plot cache were stored by key, as they may be evicted
+        if 'plot_key' not in columns:
+            self.connection.execute("ALTER TABLE scans ADD COLUMN plot_key TEXT")
+            for name, plot_path in self.connection.execute("SELECT name, plot_path FROM scans "
+                                                           "WHERE plot_path IS NOT NULL").fetchall():
+                basename = os.path.splitext(os.path.basename(plot_path))[0]
+                if basename.startswith(PLOT_CACHE_PREFIX):
+                    self.connection.execute("UPDATE scans SET plot_key = ?, plot_path = NULL WHERE name = ?",
+                                            (basename[len(PLOT_CACHE_PREFIX):], name))
+        # Catalogs created before scans could be sorted by point count stored NULL for scans added without
+        # one, which paging would skip.  Scans that can't be counted have gone and are dropped.
+        for name, path in self.connection.execute("SELECT name, path FROM scans WHERE point_count IS NULL").fetchall():
+            try:
+                self.connection.execute("UPDATE scans SET point_count = ? WHERE name = ?",
+                                        (self.count_points(path), name))
+            except (IOError, OSError, ValueError): # removed or unreadable
+                self.connection.execute("DELETE FROM scans WHERE name = ?", (name,))
+        # ... and indexed only the sort column, not (column, name) as paging needs
+        for column in SORT_COLUMNS:
+            index = "scans_{0}".format(column)
+            if [row[2] for row in self.connection.execute("PRAGMA index_info({0})".format(index))] != [column, 'name']:
+                self.connection.execute("DROP INDEX IF EXISTS {0}".format(index))
+                self.connection.execute("CREATE INDEX {0} ON scans ({1}, name)".format(index, column))
+
+    def add(self, path, created=None, point_count=None, comment=None, plot_path=None, config_snapshot=None,
+            pinned=False, derived_size=None, plot_key=None):
+        """Adds (or replaces) the specified scan file, returns its name.  The number of points is
+        read from the scan's metadata or the file if not provided, and the size of the files derived
+        from the scan defaults to that of its binary copy and metadata (see add_derived for the others).
+        A plot is either the scan's own file (plot_path) or the key of a plot in the plot cache (plot_key)."""
+        stats = os.stat(path)
+        if point_count is None:
+            point_count = self.count_points(path)
+        if derived_size is None:
+            derived_size = derived_files_size(path)
+        name = os.path.basename(path)
+        values = (name, path, created if created is not None else stats.st_mtime, stats.st_mtime,
+                  stats.st_size, point_count, comment, plot_path, config_snapshot, int(pinned), derived_size,
+                  plot_key)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO scans ({0}) VALUES ({1})".format(
+                ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))), values)
+        return name
+
+    def update(self, name, **fields):
+        """Sets the specified fields of the named scan, returns True if the scan is in the catalog"""
+        unknown = set(fields) - set(COLUMNS[1:])
+        if unknown:
+            raise ValueError("Unknown catalog field(s) {0}".format(", ".join(sorted(unknown))))
+        if not fields:
+            return self.get(name) is not None
+        names = sorted(fields)
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE scans SET {0} WHERE name = ?".format(
+                ", ".join("{0} = ?".format(field) for field in names)), [fields[field] for field in names] + [name])
+            return cursor.rowcount > 0
+
+    def add_derived(self, name, num_bytes):
+        """Adds num_bytes to the size of the files derived from the named scan (e.g. once its plot
+        or tile pyramid has been written), returns True if the scan is in the catalog"""
+        with self.lock, self.connection:
+            cursor = self.connection.execute("UPDATE scans SET derived_size = derived_size + ? WHERE name = ?",
+                                             (num_bytes, name))
+            return cursor.rowcount > 0
+
+    def pin(self, name, pinned=True):
+        """Pins (or unpins) the named scan so the retention policy keeps it, returns True if the
+        scan is in the catalog"""
+        return self.update(name, pinned=int(pinned))
+
+    def remove(self, name):
+        """Removes the named scan from the catalog"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM scans WHERE name = ?", (name,))
+
+    def clear(self):
+        """Removes every scan from the catalog"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM scans")
+
+    def get(self, name):
+        """Returns a dict of the named scan's catalog entry, or None if not found"""
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM scans WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def names(self):
+        """Returns a list of the names of the scans in the catalog, newest first"""
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT name FROM scans ORDER BY created DESC")]
+
+    def list(self):
+        """Returns a list of dicts of the scans' catalog entries, newest first"""
+        with self.lock:
+            return [dict(row) for row in self.connection.execute("SELECT * FROM scans ORDER BY created DESC")]
+
+    def query(self, sort='created', descending=True, limit=50, after=None, created_from=None, created_to=None,
+              comment=None):
+        """Returns a list of dicts of at most limit scans' catalog entries, sorted by the specified
+        column (then by name).  Pages are continued from the (sort column value, name) of the last
+        entry of the previous page, so only the rows of the page are read.  Scans can be filtered by
+        creation time (created_from <= created < created_to) and by text in their comments."""
+        if sort not in SORT_COLUMNS:
+            raise ValueError("Unable to sort by '{0}', must be one of {1}".format(sort, SORT_COLUMNS))
+        conditions = []
+        parameters = []
+        if after is not None:
+            # The redundant first comparison lets SQLite start the page with an index seek
+            operator = "<" if descending else ">"
+            conditions.append("{0} {1}= ? AND ({0} {1} ? OR name {1} ?)".format(sort, operator))
+            parameters.extend([after[0], after[0], after[1]])
+        if created_from is not None:
+            conditions.append("created >= ?")
+            parameters.append(created_from)
+        if created_to is not None:
+            conditions.append("created < ?")
+            parameters.append(created_to)
+        if comment:
+            escaped = comment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("comment LIKE ? ESCAPE '\\'")
+            parameters.append("%{0}%".format(escaped))
+        sql = "SELECT * FROM scans"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        direction = "DESC" if descending else "ASC"
+        sql += " ORDER BY {0} {1}, name {1} LIMIT ?".format(sort, direction)
+        parameters.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def reconcile(self, folder, extension=SCAN_EXTENSIONS):
+        """Brings the catalog up to date with the scan files (those with the specified extension(s)) in
+        the specified folder:  adds missing files, removes entries of files that no longer exist
+        and refreshes the size, modification time and point count of changed files.  Returns the number of
+        entries added, removed and updated."""
+        on_disk = {}
+        for fname in os.listdir(folder):
+            if fname.endswith(extension):
+                try:
+                    on_disk[fname] = os.stat(os.path.join(folder, fname))
+                except OSError: # removed in the meantime
+                    pass
+        with self.lock:
+            cataloged = dict((row[0], (row[1], row[2])) for row in
+                             self.connection.execute("SELECT name, modified, size FROM scans"))
+        added = [name for name in on_disk if name not in cataloged]
+        removed = [name for name in cataloged if name not in on_disk]
+        updated = [name for name in on_disk if name in cataloged and
+                   cataloged[name] != (on_disk[name].st_mtime, on_disk[name].st_size)]
+        for name in added:
+            try:
+                self.add(os.path.join(folder, name))
+            except (IOError, OSError): # removed in the meantime
+                pass
+        changes = []
+        for name in updated:
+            try:
+                changes.append((on_disk[name].st_mtime, on_disk[name].st_size,
+                                self.count_points(os.path.join(folder, name)), name))
+            except (IOError, OSError): # removed in the meantime
+                pass
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM scans WHERE name = ?", [(name,) for name in removed])
+            self.connection.executemany("UPDATE scans SET modified = ?, size = ?, point_count = ? WHERE name = ?",
+                                        changes)
+        return len(added), len(removed), len(updated)
+
+    def count_points(self, path):
+        """Returns the number of points in the specified scan file, from its metadata if up to date"""
+        metadata = read_metadata(path)
+        if metadata is not None:
+            return metadata['num_points']
+        return count_points(path)
+
+    def close(self):
+        """Closes the catalog's database connection"""
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,72 @@
+"""scan_preview.py - low resolution preview of a scan in progress
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.cm as cm
+import matplotlib.image
+
+from heightmap import Heightmap
+from scan_reader import VALID_Z_THRESHOLD, parse_text
+
+# Maximum number of cells (i.e. pixels) in the preview image
+MAX_CELLS = 64 * 1024
+
+class ScanPreview(object):
+    """Heightmap of a scan in progress, updated incrementally as lines are appended to the scan
+    file and periodically written out as an image (one pixel per heightmap cell)."""
+
+    def __init__(self, image_file, y_step=None, z_cutoff=VALID_Z_THRESHOLD, max_cells=MAX_CELLS, cmap='Set1'):
+        self.image_file = image_file
+        self.z_cutoff = z_cutoff
+        self.cmap = cmap
+        self.heightmap = Heightmap(y_step=y_step, max_cells=max_cells)
+        self.pending = None # points received before the grid spacing could be determined
+        self.version = 0 # number of times the image has been written
+        self.rendered_points = 0 # number of points in the last image written
+
+    def add_text(self, text):
+        """Adds the valid points of the specified complete scan file lines"""
+        if not text:
+            return
+        try:
+            points = parse_text(text)
+        except ValueError: # garbled line(s), skip
+            return
+        if self.pending is not None:
+            points = np.vstack((self.pending, points))
+            self.pending = None
+        valid = points[:, 2] > self.z_cutoff
+        try:
+            self.heightmap.add(points[valid, 0], points[valid, 1], points[valid, 2])
+        except ValueError: # not enough points yet to determine grid spacing
+            self.pending = points[valid]
+
+    def render(self):
+        """Writes the preview image if points have been added since it was last written.
+        Returns True if the image was written."""
+        num_points = self.heightmap.num_points
+        if num_points == 0 or num_points == self.rendered_points:
+            return False
+        # Image row 0 is the top of the image (maximum scan position)
+        image = np.flipud(np.ma.masked_invalid(self.heightmap.image()))
+        folder, fname = os.path.split(self.image_file)
+        fd, temp_fname = tempfile.mkstemp(dir=folder, prefix=".", suffix=os.path.splitext(fname)[1])
+        os.close(fd)
+        try:
+            matplotlib.image.imsave(temp_fname, image, cmap=cm.get_cmap(self.cmap))
+            os.chmod(temp_fname, 0o644)
+            os.rename(temp_fname, self.image_file)
+        except Exception:
+            os.remove(temp_fname)
+            raise
+        self.rendered_points = num_points
+        self.version += 1
+        return True
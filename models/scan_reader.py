@@ -0,0 +1,354 @@
+"""scan_reader.py - fast loading of Gocator profiler scan files
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import errno
+import gzip
+import io
+import json
+import os
+import os.path
+import struct
+import warnings
+import zlib
+
+import numpy as np
+
+# Number of bytes of scan text parsed at a time
+CHUNK_SIZE = 8 * 1024 * 1024
+# Maximum number of points in each block returned by iter_scan
+BLOCK_SIZE = 1000000
+# Gocator reports -32.768 for points out of range - treat anything below this as invalid
+VALID_Z_THRESHOLD = -20
+# Extension of the binary copy of a scan
+SIDECAR_EXTENSION = ".npy"
+# Size of each point in the binary copy (3 float32s)
+SIDECAR_BYTES_PER_POINT = 12
+# Length of the binary copy's (fixed length) .npy header - room for any number of points, and a
+# multiple of 64 so the data is aligned
+SIDECAR_HEADER_BYTES = 128
+# Extension of a scan's metadata
+METADATA_EXTENSION = ".json"
+# Extension added to compressed scan files, and the supported compression
+COMPRESSED_EXTENSION = ".gz"
+COMPRESSIONS = ('gzip',)
+# Extensions of scan files
+SCAN_EXTENSIONS = (".csv", ".csv" + COMPRESSED_EXTENSION)
+# ID of the gzip extra field holding the (full 64 bit) uncompressed size of a compressed scan
+GZIP_SIZE_FIELD = b"Sz"
+
+def parse_text(text):
+    """Parses a block of comma-delimited X,Y,Z text (complete lines only, no header)
+    into an Nx3 float array."""
+    num_lines = text.count(b"\n")
+    if not text.endswith(b"\n"):
+        num_lines += 1
+    with warnings.catch_warnings():
+        # NumPy warns (rather than raises) when it can't parse to the end of the text
+        warnings.simplefilter("ignore", DeprecationWarning)
+        values = np.fromstring(text.replace(b",", b" "), dtype=np.float64, sep=" ")
+    if values.size != 3 * num_lines:
+        # Malformed data (e.g. missing values) - use the (slow) general-purpose parser
+        values = np.genfromtxt(io.BytesIO(text), delimiter=",")
+    return values.reshape(-1, 3)
+
+def _skip_header(fid):
+    """Advances the file past the leading comment ('#') lines, returns any data
+    read beyond the header."""
+    while True:
+        line = fid.readline()
+        if not line.startswith(b"#"):
+            return line
+
+def is_compressed(data_file):
+    """Returns True if the specified scan file is compressed"""
+    return data_file.endswith(COMPRESSED_EXTENSION)
+
+def uncompressed_fname(data_file):
+    """Returns the name of the specified scan file without any compression extension"""
+    if is_compressed(data_file):
+        return data_file[:-len(COMPRESSED_EXTENSION)]
+    return data_file
+
+def scan_root(data_file):
+    """Returns the name of the specified scan file without its extension(s), the root of the
+    names of the files derived from it"""
+    return os.path.splitext(uncompressed_fname(data_file))[0]
+
+def stored_fname(data_file):
+    """Returns the name the specified scan file is stored under:  the compressed copy if the
+    scan has been compressed, otherwise the name itself"""
+    if not os.path.exists(data_file) and os.path.exists(data_file + COMPRESSED_EXTENSION):
+        return data_file + COMPRESSED_EXTENSION
+    return data_file
+
+def open_scan(data_file):
+    """Opens the specified scan file for reading bytes, compressed scans are decompressed as
+    they're read"""
+    if is_compressed(data_file):
+        return gzip.open(data_file, "rb")
+    return open(data_file, "rb")
+
+def compress_scan(data_file, compression='gzip', compress_level=6, chunk_size=CHUNK_SIZE, keep_fn=None):
+    """Replaces the specified scan file with a compressed copy (keeping its modification time),
+    returns the name of the copy.  The uncompressed size is recorded in a gzip extra field as
+    the gzip trailer only holds it modulo 4 GB.  If the scan is removed while it's compressed
+    (or keep_fn() returns False before the copy is put in place) the copy is discarded and None
+    is returned."""
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression '{0}', must be one of {1}".format(compression, COMPRESSIONS))
+    compressed_file = data_file + COMPRESSED_EXTENSION
+    temp_file = compressed_file + ".tmp"
+    stats = os.stat(data_file)
+    fname = os.path.basename(data_file).encode('utf-8')
+    extra = GZIP_SIZE_FIELD + struct.pack("<HQ", 8, stats.st_size)
+    try:
+        with open(data_file, "rb") as fid, open(temp_file, "wb") as compressed_fid:
+            # Header:  deflate, FEXTRA and FNAME flags, modification time, unknown OS
+            compressed_fid.write(struct.pack("<4BL2BH", 0x1f, 0x8b, 8, 0x04 | 0x08, int(stats.st_mtime), 0, 255,
+                                             len(extra)) + extra + fname + b"\0")
+            compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            crc = 0
+            size = 0
+            for data in iter(lambda: fid.read(chunk_size), b""):
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                compressed_fid.write(compressor.compress(data))
+            compressed_fid.write(compressor.flush())
+            compressed_fid.write(struct.pack("<2L", crc & 0xffffffff, size & 0xffffffff))
+        if size != stats.st_size:
+            raise IOError("{0} changed while being compressed".format(data_file))
+        os.utime(temp_file, (stats.st_atime, stats.st_mtime))
+        if not os.path.exists(data_file) or (keep_fn is not None and not keep_fn()):
+            return None
+        if os.path.exists(compressed_file):
+            os.remove(compressed_file)
+        os.rename(temp_file, compressed_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+    try:
+        os.remove(data_file)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        # Removed after the check, the copy mustn't outlive it
+        os.remove(compressed_file)
+        return None
+    return compressed_file
+
+def gzip_member(fid):
+    """Returns a dict of the offset and length of the deflate stream of the (single member) gzip
+    file open in fid, and the CRC and size of its uncompressed data.  The size is read from the
+    extra field written by compress_scan if present, otherwise from the trailer (modulo 4 GB)."""
+    fid.seek(0)
+    header = fid.read(10)
+    if len(header) < 10 or header[:3] != b"\x1f\x8b\x08":
+        raise ValueError("Not a gzip file")
+    flags = ord(header[3:4])
+    size = None
+    if flags & 0x04: # FEXTRA - subfields of ID, length, data
+        extra_len, = struct.unpack("<H", fid.read(2))
+        extra = fid.read(extra_len)
+        pos = 0
+        while pos + 4 <= len(extra):
+            field_len, = struct.unpack("<H", extra[pos + 2:pos + 4])
+            if extra[pos:pos + 2] == GZIP_SIZE_FIELD and field_len == 8:
+                size, = struct.unpack("<Q", extra[pos + 4:pos + 12])
+            pos += 4 + field_len
+    for flag in (0x08, 0x10): # FNAME, FCOMMENT - zero-terminated
+        if flags & flag:
+            while fid.read(1) not in (b"\0", b""):
+                pass
+    if flags & 0x02: # FHCRC
+        fid.read(2)
+    offset = fid.tell()
+    fid.seek(-8, os.SEEK_END)
+    end = fid.tell()
+    if end < offset:
+        raise ValueError("Truncated gzip file")
+    crc, trailer_size = struct.unpack("<2L", fid.read(8))
+    return {'offset':offset,
+            'compress_size':end - offset,
+            'crc':crc,
+            'size':size if size is not None else trailer_size}
+
+def read_chunks(data_file, chunk_size=CHUNK_SIZE):
+    """Generator that yields successive Nx3 float arrays of the specified data file,
+    parsing roughly chunk_size bytes of text at a time."""
+    with open_scan(data_file) as fid:
+        remainder = _skip_header(fid)
+        while True:
+            chunk = fid.read(chunk_size)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            last_newline = chunk.rfind(b"\n")
+            if last_newline == -1:
+                remainder = chunk
+                continue
+            remainder = chunk[last_newline + 1:]
+            yield parse_text(chunk[:last_newline + 1])
+        if remainder.strip():
+            yield parse_text(remainder)
+
+def read_scan(data_file, chunk_size=CHUNK_SIZE):
+    """Reads the specified scan file, returns the X, Y, Z columns as float arrays.
+    Chunks that can't be parsed in bulk (e.g. missing values) are parsed with
+    np.genfromtxt."""
+    chunks = list(read_chunks(data_file, chunk_size))
+    if chunks:
+        data = np.concatenate(chunks)
+    else:
+        data = np.empty((0, 3))
+    return data[:, 0], data[:, 1], data[:, 2]
+
+def sidecar_fname(data_file):
+    """Returns the name of the binary sidecar file for the specified scan file"""
+    return scan_root(data_file) + SIDECAR_EXTENSION
+
+def has_sidecar(data_file):
+    """Returns True if the scan file has an up-to-date binary sidecar"""
+    sidecar_file = sidecar_fname(data_file)
+    try:
+        return os.path.getmtime(sidecar_file) >= os.path.getmtime(data_file)
+    except OSError: # one or both files don't exist
+        return False
+
+def sidecar_header(num_points):
+    """Returns the SIDECAR_HEADER_BYTES long .npy (version 1.0) header of an Nx3 float32 array of the
+    specified number of points"""
+    header = "{{'descr': '<f4', 'fortran_order': False, 'shape': ({0}, 3), }}".format(num_points)
+    # Magic string, version and header length take 10 bytes, the header is padded with spaces and a newline
+    header = header.ljust(SIDECAR_HEADER_BYTES - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode('latin1')
+
+def write_sidecar(data_file, block_size=BLOCK_SIZE, stats=None):
+    """Writes a binary copy of the specified scan file as an Nx3 float32 NumPy (.npy) array,
+    returns the name of the sidecar file.  The scan is converted a block at a time, written after
+    a header with a placeholder shape that's rewritten once the number of points is known, so the
+    data is only written once.  If a statistics dict (see new_statistics) is provided, the scan's
+    statistics are accumulated in it during the conversion."""
+    sidecar_file = sidecar_fname(data_file)
+    temp_file = sidecar_file + ".tmp"
+    num_points = 0
+    try:
+        with open(temp_file, "wb") as fid:
+            fid.write(sidecar_header(0))
+            for x, y, z in iter_scan(data_file, block_size):
+                fid.write(np.column_stack((x, y, z)).astype('<f4').tobytes())
+                num_points += x.size
+                if stats is not None:
+                    accumulate_statistics(stats, x, y, z)
+            fid.seek(0)
+            fid.write(sidecar_header(num_points))
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    if os.path.exists(sidecar_file):
+        os.remove(sidecar_file)
+    os.rename(temp_file, sidecar_file)
+    return sidecar_file
+
+def load_scan(data_file):
+    """Returns the X, Y, Z columns of the specified scan.  If the scan has a binary sidecar
+    the columns are read-only views of the memory-mapped sidecar, otherwise the scan
+    file is parsed."""
+    if has_sidecar(data_file):
+        data = np.load(sidecar_fname(data_file), mmap_mode='r')
+        return data[:, 0], data[:, 1], data[:, 2]
+    return read_scan(data_file)
+
+def count_points(data_file):
+    """Returns the number of points in the specified scan, read from the binary sidecar's
+    header if available or by counting lines otherwise"""
+    if has_sidecar(data_file):
+        return np.load(sidecar_fname(data_file), mmap_mode='r').shape[0]
+    num_points = 0
+    with open_scan(data_file) as fid:
+        chunk = _skip_header(fid)
+        last_chunk = chunk
+        while chunk:
+            num_points += chunk.count(b"\n")
+            last_chunk = chunk
+            chunk = fid.read(CHUNK_SIZE)
+    if last_chunk.strip() and not last_chunk.endswith(b"\n"):
+        num_points += 1
+    return num_points
+
+def iter_scan(data_file, block_size=BLOCK_SIZE):
+    """Generator that yields the X, Y, Z columns of the specified scan in blocks of at most
+    block_size points, so that memory use is bounded by the block size rather than the
+    length of the scan.  Blocks are read from the binary sidecar if available."""
+    if has_sidecar(data_file):
+        data = np.load(sidecar_fname(data_file), mmap_mode='r')
+        for start in range(0, data.shape[0], block_size):
+            block = data[start:start + block_size]
+            yield block[:, 0], block[:, 1], block[:, 2]
+        return
+    for chunk in read_chunks(data_file, min(CHUNK_SIZE, 32 * block_size)):
+        for start in range(0, chunk.shape[0], block_size):
+            block = chunk[start:start + block_size]
+            yield block[:, 0], block[:, 1], block[:, 2]
+
+def new_statistics():
+    """Returns an empty dict of scan statistics for accumulate_statistics"""
+    return {'num_points':0, 'num_valid':0, 'bounds':None}
+
+def accumulate_statistics(stats, x, y, z):
+    """Adds the specified block of points to a dict of scan statistics"""
+    stats['num_points'] += x.size
+    valid = z > VALID_Z_THRESHOLD
+    num_valid = int(np.count_nonzero(valid))
+    if num_valid > 0:
+        stats['num_valid'] += num_valid
+        stats['bounds'] = merge_bounds(stats['bounds'], x[valid], y[valid], z[valid])
+
+def scan_statistics(data_file, block_size=BLOCK_SIZE):
+    """Returns a dict of basic statistics (number of points, number of valid points and the
+    X, Y, Z bounds of the valid points) of the specified scan, computed in a single pass."""
+    stats = new_statistics()
+    for x, y, z in iter_scan(data_file, block_size):
+        accumulate_statistics(stats, x, y, z)
+    return stats
+
+def metadata_fname(data_file):
+    """Returns the name of the metadata file for the specified scan file"""
+    return scan_root(data_file) + METADATA_EXTENSION
+
+def write_metadata(data_file, stats=None, **metadata):
+    """Writes the specified scan's metadata as JSON:  its statistics (computed if not provided),
+    the fraction of its points that are valid and any other specified metadata (e.g. comments
+    or duration).  Returns the metadata."""
+    if stats is None:
+        stats = scan_statistics(data_file)
+    metadata.update(stats)
+    metadata['valid_fraction'] = float(stats['num_valid']) / stats['num_points'] if stats['num_points'] else 0.
+    temp_file = metadata_fname(data_file) + ".tmp"
+    with open(temp_file, "w") as fid:
+        json.dump(metadata, fid)
+    if os.path.exists(metadata_fname(data_file)):
+        os.remove(metadata_fname(data_file))
+    os.rename(temp_file, metadata_fname(data_file))
+    return metadata
+
+def read_metadata(data_file):
+    """Returns the specified scan's metadata, or None if it has no up-to-date metadata"""
+    metadata_file = metadata_fname(data_file)
+    try:
+        if os.path.getmtime(metadata_file) < os.path.getmtime(data_file):
+            return None
+        with open(metadata_file, "r") as fid:
+            return json.load(fid)
+    except (IOError, OSError, ValueError): # missing or unreadable
+        return None
+
+def merge_bounds(bounds, x, y, z):
+    """Returns the [(xmin, xmax), (ymin, ymax), (zmin, zmax)] bounds of the
+    specified points combined with the existing bounds (None if no existing bounds)."""
+    block_bounds = [(float(np.min(col)), float(np.max(col))) for col in (x, y, z)]
+    if bounds is None:
+        return block_bounds
+    return [(min(old[0], new[0]), max(old[1], new[1])) for old, new in zip(bounds, block_bounds)]
@@ -0,0 +1,138 @@
+"""scan_registry.py - keeps track of scans and the clients that own them
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+# Maximum number of finished scans to remember
+MAX_FINISHED_SCANS = 100
+
+class ScanRecord(object):
+    """State of a single scan (or laser targeting session)"""
+
+    # States in which the scanner is in use
+    ACTIVE_STATES = ('starting', 'scanning', 'stopping')
+
+    def __init__(self, owner, mode='scan', device_id=None, data_path=None, image_path=None, comments=None, settings=None):
+        self.scan_id = uuid.uuid4().hex
+        self.owner = owner # id of the client session that started the scan
+        self.mode = mode # 'scan' or 'target'
+        self.device_id = device_id # id of the device scanning
+        self.state = 'starting'
+        self.data_path = data_path
+        self.image_path = image_path
+        self.comments = comments
+        self.settings = settings or {} # client's settings e.g. whether to plot the scan
+        self.started = time.time()
+        self.stopped = None
+        self.num_points = None
+        self.jobs = {} # name -> id of jobs processing the scan
+        self.error = None
+
+    @property
+    def active(self):
+        """Returns True if the scanner is in use by this scan"""
+        return self.state in ScanRecord.ACTIVE_STATES
+
+    @property
+    def duration(self):
+        """Returns the duration of the scan in seconds (so far, if still active)"""
+        if self.stopped is not None:
+            return self.stopped - self.started
+        return time.time() - self.started
+
+    def as_dict(self):
+        """Returns a JSON-friendly dict of the scan's state"""
+        return {'id':self.scan_id,
+                'mode':self.mode,
+                'device':self.device_id,
+                'state':self.state,
+                'started':self.started,
+                'stopped':self.stopped,
+                'duration':self.duration,
+                'num_points':self.num_points,
+                'comments':self.comments,
+                'jobs':dict(self.jobs),
+                'error':self.error}
+
+class ScanRegistry(object):
+    """Thread-safe registry of scans.  Only one scan may use each device at a time; the registry
+    decides which client that is, so the device itself is only touched by the owner.  Scans on
+    different devices are independent."""
+
+    def __init__(self):
+        self.scans = OrderedDict() # scan id -> ScanRecord, oldest first
+        self.lock = threading.Lock()
+
+    def begin(self, owner, mode='scan', device_id=None, **kwargs):
+        """Registers a new scan of the specified device for the specified owner.  Returns the new
+        ScanRecord in the 'starting' state, or None if the device is already in use."""
+        with self.lock:
+            if self._active(device_id) is not None:
+                return None
+            record = ScanRecord(owner, mode, device_id, **kwargs)
+            self.scans[record.scan_id] = record
+            self._prune()
+            return record
+
+    def claim(self, scan_id, owner, force=False):
+        """Moves the specified active scan to the 'stopping' state if it's owned by the specified owner
+        (or if force is True).  Returns the ScanRecord, or None if the scan isn't active or has
+        another owner."""
+        with self.lock:
+            record = self.scans.get(scan_id)
+            if record is None or not record.active or record.state == 'stopping':
+                return None
+            if record.owner != owner and not force:
+                return None
+            record.state = 'stopping'
+            return record
+
+    def update(self, scan_id, **attributes):
+        """Sets the specified attributes of a scan, returns the ScanRecord (None if not found)"""
+        with self.lock:
+            record = self.scans.get(scan_id)
+            if record is not None:
+                for name, value in attributes.items():
+                    setattr(record, name, value)
+                if not record.active and record.stopped is None:
+                    record.stopped = time.time()
+                    self._prune()
+            return record
+
+    def get(self, scan_id):
+        """Returns the ScanRecord of the specified scan, or None if not found"""
+        with self.lock:
+            return self.scans.get(scan_id)
+
+    def active(self, device_id=None):
+        """Returns the ScanRecord currently using the specified device, or None if the device is idle"""
+        with self.lock:
+            return self._active(device_id)
+
+    def active_scans(self):
+        """Returns a list of the ScanRecords currently using any device"""
+        with self.lock:
+            return [record for record in self.scans.values() if record.active]
+
+    def list(self):
+        """Returns a list of the registered ScanRecords, oldest first"""
+        with self.lock:
+            return list(self.scans.values())
+
+    def _active(self, device_id):
+        """Returns the active ScanRecord of the specified device (lock must be held)"""
+        for record in self.scans.values():
+            if record.active and record.device_id == device_id:
+                return record
+        return None
+
+    def _prune(self):
+        """Forgets the oldest finished scans once more than MAX_FINISHED_SCANS are stored (lock must be held)"""
+        finished = [scan_id for scan_id, record in self.scans.items() if not record.active]
+        for scan_id in finished[:max(0, len(finished) - MAX_FINISHED_SCANS)]:
+            del self.scans[scan_id]
@@ -0,0 +1,45 @@
+"""scan_tail.py - follows a scan file as the profiler writes it
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+
+class ScanTail(object):
+    """Reads the complete lines appended to a growing scan file since the last poll.  Each poll
+    only reads the newly-written bytes."""
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.offset = 0 # number of bytes read so far
+        self.remainder = b"" # incomplete last line
+        self.num_rows = 0 # number of data (non-header) lines read
+
+    @property
+    def num_bytes(self):
+        """Returns the number of bytes of the file read so far"""
+        return self.offset
+
+    def poll(self):
+        """Reads any newly-appended complete lines, returns them (header lines excluded) as a
+        single bytes string."""
+        try:
+            if os.path.getsize(self.data_file) <= self.offset:
+                return b""
+            with open(self.data_file, "rb") as fid:
+                fid.seek(self.offset)
+                new_data = fid.read()
+        except (IOError, OSError): # profiler hasn't created the file yet
+            return b""
+        self.offset += len(new_data)
+        new_data = self.remainder + new_data
+        last_newline = new_data.rfind(b"\n")
+        if last_newline == -1:
+            self.remainder = new_data
+            return b""
+        self.remainder = new_data[last_newline + 1:]
+        lines = [line for line in new_data[:last_newline + 1].splitlines(True)
+                 if line.strip() and not line.startswith(b"#")]
+        self.num_rows += len(lines)
+        return b"".join(lines)
@@ -0,0 +1,61 @@
+"""stream_pump.py - drains a subprocess's output pipes in the background so that the
+subprocess never stalls on a full pipe
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from collections import deque
+import os.path
+import threading
+
+from log_reader import rotate_log
+
+# Default number of recent lines kept in memory
+MAX_LINES = 1000
+# Default number of rotated logs kept
+LOG_BACKUPS = 3
+
+class StreamPump(threading.Thread):
+    """Background thread that reads lines from a stream (e.g. a subprocess's stdout) until EOF,
+    appending each line to a log file as it arrives and keeping the most recent max_lines
+    lines in a ring buffer.  If max_log_bytes is set the log file is rotated (see
+    log_reader.rotate_log) before it would grow beyond max_log_bytes."""
+
+    def __init__(self, stream, log_fname=None, max_lines=MAX_LINES, max_log_bytes=None, log_backups=LOG_BACKUPS):
+        super(StreamPump, self).__init__()
+        self.daemon = True
+        self.stream = stream
+        self.log_fname = log_fname
+        self.lines = deque(maxlen=max_lines) # (line number, line)
+        self.num_lines = 0 # total number of lines read
+        self.lock = threading.Lock()
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+
+    def run(self):
+        """Reads the stream until EOF"""
+        log_fid = open(self.log_fname, "ab") if self.log_fname is not None else None
+        log_size = os.path.getsize(self.log_fname) if log_fid is not None else 0
+        try:
+            for line in iter(self.stream.readline, b''):
+                if log_fid is not None:
+                    if self.max_log_bytes and log_size > 0 and log_size + len(line) > self.max_log_bytes:
+                        log_fid.close()
+                        rotate_log(self.log_fname, self.log_backups)
+                        log_fid = open(self.log_fname, "ab")
+                        log_size = 0
+                    log_fid.write(line)
+                    log_fid.flush()
+                    log_size += len(line)
+                with self.lock:
+                    self.num_lines += 1
+                    self.lines.append((self.num_lines, line))
+        finally:
+            if log_fid is not None:
+                log_fid.close()
+            self.stream.close()
+
+    def recent(self, since=0):
+        """Returns a list of the (line number, line) buffered lines numbered after since"""
+        with self.lock:
+            return [(line_number, line) for line_number, line in self.lines if line_number > since]
@@ -0,0 +1,149 @@
+"""tiles.py - builds Deep Zoom tile pyramids of scan heightmaps so that large scans
+can be panned and zoomed by fetching only the visible tiles
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+import os.path
+import shutil
+import string
+import tempfile
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.cm as cm
+from matplotlib.colors import Normalize
+import matplotlib.image
+
+TILE_SIZE = 256
+# Prefix of the temporary folders pyramids are built in, so they can be told apart from finished pyramids
+TEMP_PREFIX = ".building_"
+DZI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" Overlap="0" Format="png">
+    <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+def num_levels(shape):
+    """Returns the number of levels of a pyramid of an image of the specified (rows, columns) shape:
+    each level halves the one above it, down to a single pixel"""
+    return (max(shape) - 1).bit_length() + 1
+
+def halve(grid):
+    """Returns the sums of each 2x2 block of the specified grid (a partial block at an odd edge
+    sums the cells it has), without padding a copy of the grid"""
+    rows, cols = grid.shape
+    halved = np.zeros(((rows + 1) // 2, (cols + 1) // 2), dtype=grid.dtype)
+    halved += grid[0::2, 0::2]
+    halved[:rows // 2] += grid[1::2, 0::2]
+    halved[:, :cols // 2] += grid[0::2, 1::2]
+    halved[:rows // 2, :cols // 2] += grid[1::2, 1::2]
+    return halved
+
+def iter_levels(grid_sum, grid_count):
+    """Generator that yields the (level, mean-Z image) of each level of the pyramid as float32, from
+    the full-resolution image of the specified grid of Z sums and point counts down to a single pixel
+    (level 0).  Each level is the 2x2 average of the valid cells of the level above it.  Only one
+    level is held at a time."""
+    grid_sum = np.asarray(grid_sum, dtype=np.float32)
+    grid_count = np.asarray(grid_count)
+    for level in range(num_levels(grid_sum.shape) - 1, -1, -1):
+        image = np.full(grid_sum.shape, np.nan, dtype=np.float32)
+        np.divide(grid_sum, grid_count, out=image, where=grid_count > 0, casting='unsafe')
+        yield level, image
+        if level > 0:
+            grid_sum = halve(grid_sum)
+            grid_count = halve(grid_count)
+
+def pyramid_versions(output_folder):
+    """Returns the names of the versions of the pyramid in output_folder, oldest first"""
+    try:
+        fnames = os.listdir(output_folder)
+    except OSError: # not built
+        return []
+    return sorted((fname for fname in fnames if all(char in string.hexdigits for char in fname)),
+                  key=lambda version: int(version, 16))
+
+def current_version(output_folder):
+    """Returns the name of the newest version of the pyramid in output_folder, or None if it
+    hasn't been built"""
+    versions = pyramid_versions(output_folder)
+    return versions[-1] if versions else None
+
+def write_tile(tile, fname, colormap, norm):
+    """Colors the specified image tile (NaN cells transparent) and writes it as PNG"""
+    matplotlib.image.imsave(fname, colormap(norm(np.ma.masked_invalid(tile)), bytes=True))
+
+def write_level(image, level_folder, colormap, norm, tile_size=TILE_SIZE, executor=None):
+    """Writes the specified image as tile_size x tile_size PNG tiles named <column>_<row>.png to the
+    specified folder, on the specified executor's threads if any.  Tiles are colored one at a time
+    rather than the whole image at once.  Returns the number of tiles."""
+    os.makedirs(level_folder)
+    rows, cols = image.shape
+    futures = []
+    for row in range(int(math.ceil(float(rows) / tile_size))):
+        for col in range(int(math.ceil(float(cols) / tile_size))):
+            tile = image[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+            fname = os.path.join(level_folder, "{0}_{1}.png".format(col, row))
+            if executor is None:
+                write_tile(tile, fname, colormap, norm)
+            else:
+                futures.append(executor.submit(write_tile, tile, fname, colormap, norm))
+    for future in futures:
+        future.result()
+    return int(math.ceil(float(rows) / tile_size)) * int(math.ceil(float(cols) / tile_size))
+
+def build_pyramid(grid_sum, grid_count, output_folder, name, cmap='Set1', tile_size=TILE_SIZE, max_workers=4):
+    """Builds a Deep Zoom pyramid of the specified grid of Z sums and point counts (grid row 0 is
+    the minimum scan position) in a new version folder of output_folder, as <version>/<name>.dzi and
+    <version>/<name>_files/<level>/<col>_<row>.png.  Levels are built and written one at a time, from
+    full resolution down, with each level's tiles written in parallel.  The pyramid is
+    built in a temporary folder (whose name starts with TEMP_PREFIX) and moved into place once complete.
+    Rebuilding a pyramid publishes it under a new version and removes the previous versions, so the
+    tiles at a URL never change.  Returns the name of the .dzi file."""
+    colormap = cm.get_cmap(cmap)
+    norm = None
+    parent_folder = os.path.dirname(os.path.abspath(output_folder))
+    temp_folder = tempfile.mkdtemp(dir=parent_folder, prefix=TEMP_PREFIX)
+    try:
+        tiles_folder = os.path.join(temp_folder, "{0}_files".format(name))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # Image row 0 is the top of the image (maximum scan position)
+            for level, image in iter_levels(np.flipud(grid_sum), np.flipud(grid_count)):
+                if norm is None: # full resolution, which sets the color scale
+                    rows, cols = image.shape
+                    norm = Normalize(vmin=np.nanmin(image), vmax=np.nanmax(image))
+                write_level(image, os.path.join(tiles_folder, str(level)), colormap, norm, tile_size, executor)
+        finally:
+            executor.shutdown()
+        with open(os.path.join(temp_folder, "{0}.dzi".format(name)), "w") as fid:
+            fid.write(DZI_TEMPLATE.format(tile_size=tile_size, width=cols, height=rows))
+        os.chmod(temp_folder, 0o755)
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+        # Versions are named by build time, so they sort oldest first
+        previous_versions = pyramid_versions(output_folder)
+        version_time = int(time.time() * 1e6)
+        if previous_versions:
+            version_time = max(version_time, int(previous_versions[-1], 16) + 1)
+        version = "{0:x}".format(version_time)
+        # Previous versions, and pyramids built before pyramids were versioned
+        previous_fnames = os.listdir(output_folder)
+        version_folder = os.path.join(output_folder, version)
+        os.rename(temp_folder, version_folder)
+    except Exception:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        raise
+    for fname in previous_fnames:
+        previous_fname = os.path.join(output_folder, fname)
+        if os.path.isdir(previous_fname):
+            shutil.rmtree(previous_fname, ignore_errors=True)
+        else:
+            os.remove(previous_fname)
+    return os.path.join(version_folder, "{0}.dzi".format(name))
@@ -0,0 +1,118 @@
+"""zip_cache.py - caches the compressed ZIP archive members of data files so that repeat
+downloads only compress new or changed files
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+
+class ZipCache(object):
+    """Folder of raw deflate streams of files, with a JSON manifest of each file's size, mtime,
+    CRC and compressed size.  A cached member is only used if its file's size and mtime are unchanged."""
+
+    MANIFEST = "manifest.json"
+    EXTENSION = ".deflate"
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.manifest = self._load() # file path -> {'size', 'mtime', 'crc', 'compress_size'}
+
+    def member_fname(self, file_path):
+        """Returns the name of the cached member of the specified file"""
+        if not isinstance(file_path, bytes):
+            file_path = file_path.encode('utf-8')
+        return os.path.join(self.folder, hashlib.sha1(file_path).hexdigest() + ZipCache.EXTENSION)
+
+    def get(self, file_path, stats):
+        """Returns the manifest entry of the specified file with the specified os.stat results, or
+        None if the file isn't cached or has changed since it was cached"""
+        with self.lock:
+            entry = self.manifest.get(file_path)
+        if entry is None or entry['size'] != stats.st_size or entry['mtime'] != stats.st_mtime:
+            return None
+        if not os.path.exists(self.member_fname(file_path)):
+            return None
+        return entry
+
+    def open_member(self):
+        """Returns a new temporary file to write a member to, pass to put() when complete or
+        discard() if abandoned"""
+        if not os.path.exists(self.folder):
+            try:
+                os.makedirs(self.folder)
+            except OSError: # created in the meantime
+                pass
+        fd, temp_fname = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        os.close(fd)
+        return open(temp_fname, "wb")
+
+    def put(self, file_path, stats, member_fid, crc, compress_size):
+        """Adds the member written to member_fid (see open_member) of the specified file with the
+        specified os.stat results, CRC and compressed size to the cache"""
+        member_fid.close()
+        os.rename(member_fid.name, self.member_fname(file_path))
+        with self.lock:
+            self.manifest[file_path] = {'size':stats.st_size,
+                                        'mtime':stats.st_mtime,
+                                        'crc':crc,
+                                        'compress_size':compress_size}
+            self._save()
+
+    def discard(self, member_fid):
+        """Abandons the member written to member_fid (see open_member)"""
+        member_fid.close()
+        if os.path.exists(member_fid.name):
+            os.remove(member_fid.name)
+
+    def remove(self, file_path):
+        """Removes the cached member of the specified file, if any"""
+        with self.lock:
+            if self.manifest.pop(file_path, None) is None:
+                return
+            member_fname = self.member_fname(file_path)
+            if os.path.exists(member_fname):
+                os.remove(member_fname)
+            self._save()
+
+    def prune(self, file_paths):
+        """Removes the cached members of files other than those specified"""
+        file_paths = set(file_paths)
+        with self.lock:
+            stale = [file_path for file_path in self.manifest if file_path not in file_paths]
+            if not stale:
+                return
+            for file_path in stale:
+                del self.manifest[file_path]
+                member_fname = self.member_fname(file_path)
+                if os.path.exists(member_fname):
+                    os.remove(member_fname)
+            self._save()
+
+    def clear(self):
+        """Removes all the cached members"""
+        with self.lock:
+            self.manifest = {}
+            if os.path.exists(self.folder):
+                shutil.rmtree(self.folder)
+
+    def _load(self):
+        """Returns the manifest saved in the cache folder (empty if none)"""
+        try:
+            with open(os.path.join(self.folder, ZipCache.MANIFEST), "r") as fid:
+                return json.load(fid)
+        except (IOError, ValueError): # no manifest or unreadable
+            return {}
+
+    def _save(self):
+        """Saves the manifest to the cache folder (lock must be held)"""
+        fd, temp_fname = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "w") as fid:
+            json.dump(self.manifest, fid)
+        os.rename(temp_fname, os.path.join(self.folder, ZipCache.MANIFEST))
@@ -0,0 +1,240 @@
+"""zip_stream.py - generates ZIP archives on the fly, so that archives can be sent
+as they're produced without first being written to disk
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import os
+import os.path
+import struct
+import time
+import zlib
+
+from scan_reader import COMPRESSED_EXTENSION, gzip_member, is_compressed
+
+# Size of the blocks read from each file
+CHUNK_SIZE = 64 * 1024
+# Largest size or offset that fits in a standard (non-ZIP64) header
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_DEFLATED = 8
+# General purpose flags:  sizes and CRC follow the data, UTF-8 file names
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+DATA_DESCRIPTOR = struct.Struct("<4sLLL")
+DATA_DESCRIPTOR64 = struct.Struct("<4sLQQ")
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+END_RECORD64 = struct.Struct("<4sQ2H2L4Q")
+END_LOCATOR64 = struct.Struct("<4sLQL")
+
+def dos_datetime(timestamp):
+    """Returns the (DOS time, DOS date) of the specified timestamp"""
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    return (t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday)
+
+class ZipEntry(object):
+    """Central directory record of a file in the archive"""
+
+    def __init__(self, arcname, mtime, header_offset, zip64, mode=0o644, flags=FLAG_DATA_DESCRIPTOR | FLAG_UTF8):
+        self.arcname = arcname.encode('utf-8') if not isinstance(arcname, bytes) else arcname
+        self.mtime = mtime
+        self.header_offset = header_offset
+        self.zip64 = zip64
+        self.mode = mode
+        self.flags = flags
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+    @property
+    def version(self):
+        """Returns the version needed to extract the file:  4.5 for ZIP64, otherwise 2.0"""
+        return 45 if self.zip64 else 20
+
+class ZipStream(object):
+    """Generates a deflated ZIP archive as a sequence of byte strings.  Each file's sizes and CRC
+    are written in a data descriptor after its data, so files are read only once; ZIP64 records
+    are used for large files and archives.  If a ZipCache is provided, files' compressed data
+    is saved to it and unchanged files are copied from it rather than compressed again.
+    The deflate streams of gzip files are copied as they are into members of their
+    uncompressed contents."""
+
+    def __init__(self, compress_level=6, chunk_size=CHUNK_SIZE, force_zip64=False, cache=None):
+        self.compress_level = compress_level
+        self.chunk_size = chunk_size
+        self.force_zip64 = force_zip64
+        self.cache = cache
+        self.offset = 0 # bytes generated so far
+        self.entries = []
+
+    def stream(self, files):
+        """Generator that yields the archive of the specified (file path, name in archive) files"""
+        for file_path, arcname in files:
+            for chunk in self.add_file(file_path, arcname):
+                yield chunk
+        for chunk in self.finish():
+            yield chunk
+
+    def add_file(self, file_path, arcname=None):
+        """Generator that yields the archive member of the specified file"""
+        if arcname is None:
+            arcname = os.path.basename(file_path)
+        if is_compressed(file_path) and not arcname.endswith(COMPRESSED_EXTENSION):
+            for chunk in self.add_gzip(file_path, arcname):
+                yield chunk
+            return
+        with open(file_path, "rb") as fid:
+            stats = os.fstat(fid.fileno())
+            cached = self.cache.get(file_path, stats) if self.cache is not None else None
+            if cached is not None:
+                for chunk in self.add_cached(file_path, arcname, stats, cached):
+                    yield chunk
+                return
+            # Leave room for the file growing while it's read, and for deflate's worst case
+            zip64 = self.force_zip64 or stats.st_size * 1.05 > ZIP64_LIMIT
+            entry = ZipEntry(arcname, stats.st_mtime, self.offset, zip64, stats.st_mode & 0o777)
+            yield self._emit(self.local_header(entry))
+            member_fid = self.cache.open_member() if self.cache is not None else None
+            try:
+                compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+                crc = 0
+                for data in iter(lambda: fid.read(self.chunk_size), b""):
+                    crc = zlib.crc32(data, crc)
+                    entry.file_size += len(data)
+                    compressed = compressor.compress(data)
+                    if compressed:
+                        entry.compress_size += len(compressed)
+                        if member_fid is not None:
+                            member_fid.write(compressed)
+                        yield self._emit(compressed)
+                compressed = compressor.flush()
+                entry.compress_size += len(compressed)
+                if member_fid is not None:
+                    member_fid.write(compressed)
+                yield self._emit(compressed)
+                entry.crc = crc & 0xffffffff
+                if member_fid is not None:
+                    self.cache_member(file_path, stats, member_fid, entry)
+                    member_fid = None
+            finally:
+                if member_fid is not None: # download abandoned
+                    self.cache.discard(member_fid)
+        if not zip64 and (entry.file_size > ZIP64_LIMIT or entry.compress_size > ZIP64_LIMIT):
+            raise ValueError("{0} grew too large while being archived".format(file_path))
+        descriptor = DATA_DESCRIPTOR64 if zip64 else DATA_DESCRIPTOR
+        yield self._emit(descriptor.pack(b"PK\x07\x08", entry.crc, entry.compress_size, entry.file_size))
+        self.entries.append(entry)
+
+    def add_cached(self, file_path, arcname, stats, cached):
+        """Generator that yields the archive member of the specified file from its cached
+        compressed data (see ZipCache.get).  As the sizes and CRC are known they're written in
+        the local header rather than a data descriptor."""
+        zip64 = self.force_zip64 or stats.st_size > ZIP64_LIMIT or cached['compress_size'] > ZIP64_LIMIT
+        entry = ZipEntry(arcname, stats.st_mtime, self.offset, zip64, stats.st_mode & 0o777, flags=FLAG_UTF8)
+        entry.crc = cached['crc']
+        entry.compress_size = cached['compress_size']
+        entry.file_size = stats.st_size
+        yield self._emit(self.local_header(entry))
+        with open(self.cache.member_fname(file_path), "rb") as member_fid:
+            for compressed in iter(lambda: member_fid.read(self.chunk_size), b""):
+                yield self._emit(compressed)
+        self.entries.append(entry)
+
+    def add_gzip(self, file_path, arcname):
+        """Generator that yields an archive member of the uncompressed contents of the specified
+        gzip file, copying its deflate stream rather than decompressing and compressing it again"""
+        with open(file_path, "rb") as fid:
+            stats = os.fstat(fid.fileno())
+            member = gzip_member(fid)
+            zip64 = self.force_zip64 or member['size'] > ZIP64_LIMIT or member['compress_size'] > ZIP64_LIMIT
+            entry = ZipEntry(arcname, stats.st_mtime, self.offset, zip64, stats.st_mode & 0o777, flags=FLAG_UTF8)
+            entry.crc = member['crc']
+            entry.compress_size = member['compress_size']
+            entry.file_size = member['size']
+            yield self._emit(self.local_header(entry))
+            fid.seek(member['offset'])
+            remaining = member['compress_size']
+            while remaining > 0:
+                compressed = fid.read(min(self.chunk_size, remaining))
+                if not compressed:
+                    raise ValueError("{0} was truncated while being archived".format(file_path))
+                remaining -= len(compressed)
+                yield self._emit(compressed)
+        self.entries.append(entry)
+
+    def cache_member(self, file_path, stats, member_fid, entry):
+        """Saves the compressed data of the specified file to the cache, unless the file changed while
+        it was read"""
+        try:
+            current_stats = os.stat(file_path)
+            if (entry.file_size == stats.st_size == current_stats.st_size and
+                    stats.st_mtime == current_stats.st_mtime):
+                self.cache.put(file_path, stats, member_fid, entry.crc, entry.compress_size)
+                return
+        except (IOError, OSError): # file removed or cache cleared in the meantime
+            pass
+        self.cache.discard(member_fid)
+
+    def local_header(self, entry):
+        """Returns the local file header of the specified entry (sizes and CRC are zero if
+        they follow the data)"""
+        extra = b""
+        crc, compress_size, file_size = entry.crc, entry.compress_size, entry.file_size
+        if entry.zip64:
+            extra = struct.pack("<2H2Q", 1, 16, file_size, compress_size)
+            compress_size = file_size = 0xffffffff
+        dostime, dosdate = dos_datetime(entry.mtime)
+        return LOCAL_HEADER.pack(b"PK\x03\x04", entry.version, 0, entry.flags,
+                                 ZIP_DEFLATED, dostime, dosdate, crc, compress_size, file_size,
+                                 len(entry.arcname), len(extra)) + entry.arcname + extra
+
+    def finish(self):
+        """Generator that yields the archive's central directory"""
+        cd_offset = self.offset
+        for entry in self.entries:
+            yield self._emit(self.central_header(entry))
+        cd_size = self.offset - cd_offset
+        num_entries = len(self.entries)
+        if (self.force_zip64 or num_entries >= 0xffff or cd_offset > ZIP64_LIMIT or
+                cd_size > ZIP64_LIMIT):
+            end64_offset = self.offset
+            yield self._emit(END_RECORD64.pack(b"PK\x06\x06", END_RECORD64.size - 12, 45, 45, 0, 0,
+                                               num_entries, num_entries, cd_size, cd_offset))
+            yield self._emit(END_LOCATOR64.pack(b"PK\x06\x07", 0, end64_offset, 1))
+            num_entries = min(num_entries, 0xffff)
+            cd_size = min(cd_size, 0xffffffff)
+            cd_offset = min(cd_offset, 0xffffffff)
+        yield self._emit(END_RECORD.pack(b"PK\x05\x06", 0, 0, num_entries, num_entries,
+                                         cd_size, cd_offset, 0))
+
+    def central_header(self, entry):
+        """Returns the central directory header of the specified entry"""
+        zip64_fields = []
+        file_size, compress_size, header_offset = entry.file_size, entry.compress_size, entry.header_offset
+        if entry.zip64 or file_size > ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = 0xffffffff
+        if entry.zip64 or compress_size > ZIP64_LIMIT:
+            zip64_fields.append(compress_size)
+            compress_size = 0xffffffff
+        if header_offset > ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = 0xffffffff
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack("<2H{0}Q".format(len(zip64_fields)), 1, 8 * len(zip64_fields), *zip64_fields)
+        version = max(entry.version, 45 if zip64_fields else 20)
+        dostime, dosdate = dos_datetime(entry.mtime)
+        return CENTRAL_HEADER.pack(b"PK\x01\x02", version, 3, version, 0, entry.flags,
+                                   ZIP_DEFLATED, dostime, dosdate, entry.crc, compress_size, file_size,
+                                   len(entry.arcname), len(extra), 0, 0, 0,
+                                   (0o100000 | entry.mode) << 16, header_offset) + entry.arcname + extra
+
+    def _emit(self, data):
+        """Accounts for the specified bytes of the archive, returns them"""
+        self.offset += len(data)
+        return data
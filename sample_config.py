@@ -12,6 +12,58 @@ BASEPATH = os.path.dirname(os.path.abspath(__file__))
 OUTPUTIMAGEPATH = os.path.join(BASEPATH, 'static', 'data', 'img')
 # Output path for profile data
 OUTPUTDATAPATH = os.path.join(BASEPATH, 'static', 'data')
+# SQLite catalog of the stored scans
+CATALOG_PATH = os.path.join(OUTPUTDATAPATH, 'catalog.sqlite')
+# Retention of stored scans:  the oldest unpinned scans are evicted once the scans take up more than
+# RETENTION_MAX_BYTES, are older than RETENTION_MAX_AGE seconds or number more than RETENTION_MAX_COUNT
+# (0 for no limit).  Checked after each scan and every RETENTION_SWEEP_INTERVAL seconds.
+RETENTION_MAX_BYTES = 0
+RETENTION_MAX_AGE = 0
+RETENTION_MAX_COUNT = 0
+RETENTION_SWEEP_INTERVAL = 600
+# Free disk space in bytes required to start a scan, in addition to the space taken by the largest recent scan
+SCAN_RESERVE_BYTES = 50 * 1024 * 1024
+# Compression of stored scans, either None or 'gzip'.  Scans are compressed by a render job once they've been plotted
+SCAN_COMPRESSION = None
+# Number of scans listed per page, and the most a client may ask for
+SCANS_PAGE_SIZE = 50
+SCANS_MAX_PAGE_SIZE = 500
+# Plot style, either 'heightmap' (fast, gridded) or 'scatter' (individual points)
+PLOT_MODE = 'heightmap'
+# Scatter plots are reduced to at most PLOT_POINT_BUDGET points by one of 'stride', 'voxel'
+# (grid average) or 'minmax' (grid minimum and maximum, keeps hole edges) decimation.  None plots every point,
+# which holds the entire scan in memory
+PLOT_DECIMATION = 'minmax'
+PLOT_POINT_BUDGET = 200000
+# Maximum size in bytes of the cache of rendered plots (0 to disable)
+PLOTCACHE_MAXBYTES = 100 * 1024 * 1024
+# Seconds to wait for a plot evicted from the cache to be rendered again when it's next viewed
+PLOT_TIMEOUT = 60
+# Build a Deep Zoom tile pyramid of each scan for pan & zoom viewing?
+BUILD_TILES = False
+# Number of worker processes used to render plots
+RENDER_WORKERS = 1
+# Seconds between scan progress updates sent to the browser
+SCAN_STREAM_INTERVAL = 0.5
+# Seconds between updates of the low resolution preview shown while scanning (0 to disable)
+PREVIEW_INTERVAL = 2
+# Size in bytes at which the profiler logs are rotated, and the number of rotated logs kept
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+# Amount of the end of each log shown on the logs page, older lines are loaded on request
+LOG_TAIL_LINES = 500
+LOG_TAIL_BYTES = 64 * 1024
+# Gocator devices on this controller:  a (device id, profiler configuration file) pair for each head,
+# the first being the default device used by the URLs that don't name a device (/devices/<device id>/...
+# for the others).  Each device has its own profiler and logs, and scans on different devices run in
+# parallel.  Empty for a single device configured by the profiler's own configuration file.
+DEVICES = []
+# Keep one profiler process connected to the sensor, switched between idle, targeting and scanning
+# (and restarted if it dies), rather than starting the profiler for every scan?
+PROFILER_PERSISTENT = False
+# Port and number of worker threads used by the production server (hqs.py)
+SERVER_PORT = 5000
+SERVER_WORKERS = 8
 SECRET_KEY = 'secret_key'
 THREADS_PER_PAGE = 2
 USERNAME = 'admin'
@@ -0,0 +1,131 @@
+/* deepzoom.js - minimal pan & zoom viewer for the Deep Zoom tile pyramids built by models/tiles.py.
+ * Only the tiles of the level closest to the current zoom that are in view are fetched.
+ *
+ * Usage:  var viewer = new DeepZoomViewer($("#viewer"), "/tiles/scan/scan.dzi");
+ */
+
+function DeepZoomViewer(container, dziURL) {
+    var viewer = this;
+    viewer.container = container;
+    viewer.tiles = {}; // "level/col_row" -> img element
+    viewer.scale = 1; // screen pixels per full-resolution image pixel
+    viewer.x = 0; // full-resolution image coordinates of the top left of the view
+    viewer.y = 0;
+    viewer.layer = $('<div class="deepzoom-tiles">').css({position:"absolute", left:0, top:0}).appendTo(container);
+    container.css({position:"relative", overflow:"hidden", cursor:"move"});
+    viewer.tilesURL = dziURL.replace(/\.dzi$/, "_files/");
+    $.ajax({url:dziURL, type:"GET", dataType:"xml"}).done(function(dzi) {
+        var image = $(dzi).find("Image");
+        var size = $(dzi).find("Size");
+        viewer.tileSize = parseInt(image.attr("TileSize"), 10);
+        viewer.format = image.attr("Format");
+        viewer.width = parseInt(size.attr("Width"), 10);
+        viewer.height = parseInt(size.attr("Height"), 10);
+        viewer.maxLevel = Math.ceil(Math.log(Math.max(viewer.width, viewer.height)) / Math.LN2);
+        viewer.home();
+        viewer.bindEvents();
+    }).fail(function() {
+        container.text("Unable to load zoomable image.");
+    });
+}
+
+/* Fits the whole image in the view */
+DeepZoomViewer.prototype.home = function() {
+    this.minScale = Math.min(this.container.width() / this.width, this.container.height() / this.height);
+    this.scale = this.minScale;
+    this.x = (this.width - this.container.width() / this.scale) / 2;
+    this.y = (this.height - this.container.height() / this.scale) / 2;
+    this.render();
+};
+
+/* Zooms by the specified factor about the specified point of the view (default its center) */
+DeepZoomViewer.prototype.zoomBy = function(factor, viewX, viewY) {
+    if (viewX === undefined) {
+        viewX = this.container.width() / 2;
+        viewY = this.container.height() / 2;
+    }
+    // Zoom out no further than the whole image, in no further than 4 screen pixels per image pixel
+    var newScale = Math.max(this.minScale, Math.min(4, this.scale * factor));
+    this.x += viewX / this.scale - viewX / newScale;
+    this.y += viewY / this.scale - viewY / newScale;
+    this.scale = newScale;
+    this.render();
+};
+
+/* Pans the view by the specified number of screen pixels */
+DeepZoomViewer.prototype.panBy = function(dx, dy) {
+    this.x -= dx / this.scale;
+    this.y -= dy / this.scale;
+    this.render();
+};
+
+/* Places the visible tiles of the level closest to the current zoom, removes the others */
+DeepZoomViewer.prototype.render = function() {
+    var level = Math.max(0, Math.min(this.maxLevel, this.maxLevel + Math.ceil(Math.log(this.scale) / Math.LN2)));
+    var levelScale = Math.pow(2, this.maxLevel - level); // full-resolution pixels per level pixel
+    var levelWidth = Math.ceil(this.width / levelScale);
+    var levelHeight = Math.ceil(this.height / levelScale);
+    var tileSpan = this.tileSize * levelScale; // full-resolution pixels per tile
+    var firstCol = Math.max(0, Math.floor(this.x / tileSpan));
+    var firstRow = Math.max(0, Math.floor(this.y / tileSpan));
+    var lastCol = Math.min(Math.ceil(levelWidth / this.tileSize), Math.ceil((this.x + this.container.width() / this.scale) / tileSpan)) - 1;
+    var lastRow = Math.min(Math.ceil(levelHeight / this.tileSize), Math.ceil((this.y + this.container.height() / this.scale) / tileSpan)) - 1;
+    var visible = {};
+    for (var row = firstRow; row <= lastRow; row++) {
+        for (var col = firstCol; col <= lastCol; col++) {
+            var key = level + "/" + col + "_" + row;
+            var tile = this.tiles[key];
+            if (!tile) {
+                tile = $('<img>').css({position:"absolute"}).attr("src", this.tilesURL + key + "." + this.format);
+                tile.on("dragstart", function() { return false; });
+                this.tiles[key] = tile.appendTo(this.layer);
+            }
+            var tileWidth = Math.min(this.tileSize, levelWidth - col * this.tileSize);
+            var tileHeight = Math.min(this.tileSize, levelHeight - row * this.tileSize);
+            tile.css({left:(col * tileSpan - this.x) * this.scale,
+                      top:(row * tileSpan - this.y) * this.scale,
+                      width:tileWidth * levelScale * this.scale,
+                      height:tileHeight * levelScale * this.scale});
+            visible[key] = true;
+        }
+    }
+    for (var tileKey in this.tiles) {
+        if (!visible[tileKey]) {
+            this.tiles[tileKey].remove();
+            delete this.tiles[tileKey];
+        }
+    }
+};
+
+/* Mouse drag pans, the mouse wheel zooms about the pointer and double-clicking zooms in */
+DeepZoomViewer.prototype.bindEvents = function() {
+    var viewer = this;
+    var dragging = null;
+    viewer.container.on("mousedown", function(event) {
+        dragging = {x:event.pageX, y:event.pageY};
+        event.preventDefault();
+    });
+    $(document).on("mousemove", function(event) {
+        if (dragging) {
+            viewer.panBy(event.pageX - dragging.x, event.pageY - dragging.y);
+            dragging = {x:event.pageX, y:event.pageY};
+        }
+    }).on("mouseup", function() {
+        dragging = null;
+    });
+    viewer.container.on("wheel mousewheel DOMMouseScroll", function(event) {
+        var original = event.originalEvent;
+        var delta = original.deltaY || -original.wheelDelta || original.detail;
+        var offset = viewer.container.offset();
+        viewer.zoomBy(delta < 0 ? 1.25 : 0.8, event.pageX - offset.left, event.pageY - offset.top);
+        event.preventDefault();
+    });
+    viewer.container.on("dblclick", function(event) {
+        var offset = viewer.container.offset();
+        viewer.zoomBy(2, event.pageX - offset.left, event.pageY - offset.top);
+    });
+    $(window).on("resize", function() {
+        viewer.minScale = Math.min(viewer.container.width() / viewer.width, viewer.container.height() / viewer.height);
+        viewer.render();
+    });
+};
@@ -0,0 +1,84 @@
+"""test_config_cache.py - tests the config_cache module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import stat
+import tempfile
+import threading
+from models import config_cache
+
+class TestConfigCache(unittest.TestCase):
+    """Tests the ConfigCache class"""
+
+    SAMPLECFGPATH = os.path.join(os.path.dirname(__file__), 'support_files', 'sample_config.cfg')
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.config_fname = os.path.join(self.temp_folder, "test.cfg")
+        shutil.copyfile(TestConfigCache.SAMPLECFGPATH, self.config_fname)
+        self.cache = config_cache.ConfigCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def test_read(self):
+        """Verify configurations are only parsed again once changed"""
+        cfg = self.cache.read(self.config_fname)
+        self.assertTrue('Trigger' in cfg)
+        self.assertIs(cfg, self.cache.read(self.config_fname))
+        with open(self.config_fname, "ab") as fid:
+            fid.write(b"\n[Extra]\nkey = value\n")
+        changed_cfg = self.cache.read(self.config_fname)
+        self.assertIsNot(cfg, changed_cfg)
+        self.assertEqual('value', changed_cfg['Extra']['key'])
+        self.assertRaises(IOError, self.cache.read, os.path.join(self.temp_folder, "potato.cfg"))
+        self.cache.clear()
+        self.assertIsNot(changed_cfg, self.cache.read(self.config_fname))
+
+    def test_update(self):
+        """Verify updates replace the file, keeping its comments and permissions"""
+        os.chmod(self.config_fname, 0o640)
+        with open(self.config_fname, "rb") as fid:
+            original = fid.read()
+        def update(cfg):
+            if 'Encoder' not in cfg:
+                cfg['Encoder'] = {}
+            cfg['Encoder']['model'] = 'Test Encoder'
+        cfg = self.cache.update(self.config_fname, update)
+        self.assertIs(cfg, self.cache.read(self.config_fname))
+        self.assertEqual(0.01, cfg['Encoder'].as_float('resolution'))
+        self.assertEqual('Test Encoder', self.cache.read(self.config_fname)['Encoder']['model'])
+        self.assertEqual(0o640, stat.S_IMODE(os.stat(self.config_fname).st_mode))
+        self.assertEqual(["test.cfg"], os.listdir(self.temp_folder))
+        with open(self.config_fname, "rb") as fid:
+            updated = fid.read()
+        for line in original.splitlines():
+            if line.strip().startswith(b"#"):
+                self.assertTrue(line in updated)
+        # Creates missing files
+        new_fname = os.path.join(self.temp_folder, "new.cfg")
+        self.cache.update(new_fname, update)
+        self.assertEqual('Test Encoder', config_cache.ConfigCache().read(new_fname)['Encoder']['model'])
+
+    def test_concurrent_updates(self):
+        """Verify concurrent updates aren't lost"""
+        def increment(cfg):
+            cfg['Counter'] = {'count':int(cfg.get('Counter', {}).get('count', 0)) + 1}
+        def worker():
+            for i in range(10):
+                self.cache.update(self.config_fname, increment)
+        threads = [threading.Thread(target=worker) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual('50', self.cache.read(self.config_fname)['Counter']['count'])
+        self.assertEqual('50', config_cache.ConfigCache().read(self.config_fname)['Counter']['count'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""test_decimate.py - tests the decimate module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os.path
+import numpy as np
+from models import decimate
+from models import scan_reader
+
+class TestDecimate(unittest.TestCase):
+    """Tests reducing point clouds to a point budget"""
+
+    SUPPORTFILESPATH = os.path.join(os.path.dirname(__file__), 'support_files')
+    SAMPLEINPUTDATA = os.path.join(SUPPORTFILESPATH, 'sample_data.csv')
+
+    def setUp(self):
+        self.x, self.y, self.z = scan_reader.read_scan(TestDecimate.SAMPLEINPUTDATA)
+
+    def blocks(self, block_size=1000):
+        """Helper function to return the sample data in blocks"""
+        return scan_reader.iter_scan(TestDecimate.SAMPLEINPUTDATA, block_size)
+
+    def test_stride(self):
+        """Verify keeping every Nth point"""
+        x, y, z = decimate.decimate(self.blocks(), budget=5000, mode='stride')
+        self.assertTrue(2500 <= x.size <= 5000)
+        stride = int(np.ceil(float(self.x.size) / x.size))
+        self.assertTrue(np.array_equal(self.x[::stride], x))
+        self.assertTrue(np.array_equal(self.z[::stride], z))
+
+    def test_voxel(self):
+        """Verify averaging points on a grid"""
+        x, y, z = decimate.decimate(self.blocks(), budget=5000, mode='voxel')
+        self.assertTrue(0 < x.size <= 5000)
+        self.assertTrue(np.min(self.z) <= np.min(z) and np.max(z) <= np.max(self.z))
+
+    def test_minmax(self):
+        """Verify keeping the extremes of each grid cell"""
+        x, y, z = decimate.decimate(self.blocks(), budget=5000, mode='minmax')
+        self.assertTrue(0 < x.size <= 5000)
+        self.assertEqual(np.min(self.z), np.min(z))
+        self.assertEqual(np.max(self.z), np.max(z))
+
+    def test_under_budget(self):
+        """Verify small point clouds are returned unchanged by stride decimation"""
+        x, y, z = decimate.decimate(self.blocks(), budget=self.x.size, mode='stride')
+        self.assertTrue(np.array_equal(self.x, x))
+
+    def test_bad_mode(self):
+        """Verify rejecting unknown decimation modes"""
+        self.assertRaises(ValueError, decimate.decimate, self.blocks(), 5000, 'potato')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""test_device_manager.py - tests the device_manager module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os.path
+from models import device_manager
+from models import gocator_model
+
+class TestDeviceManager(unittest.TestCase):
+    """Tests the DeviceManager class"""
+
+    SAMPLECFGPATH = os.path.join(os.path.dirname(__file__), 'support_files', 'sample_config.cfg')
+
+    def test_single_device(self):
+        """Verify a single device with the default configuration and logs when none are listed"""
+        devices = device_manager.DeviceManager()
+        self.assertEqual([None], devices.ids())
+        model = devices.default
+        self.assertIsNone(model.device_id)
+        self.assertIs(model, devices.get())
+        self.assertEqual(gocator_model.GocatorModel.ENCODERCONFIGPATH, model.config_fname)
+        self.assertEqual(gocator_model.GocatorModel.LOGS, model.logs)
+        self.assertIsNone(devices.get("potato"))
+
+    def test_devices(self):
+        """Verify one model per device, each with its own configuration file and logs"""
+        devices = device_manager.DeviceManager([("head1", TestDeviceManager.SAMPLECFGPATH), (8710, "head2.cfg")])
+        self.assertEqual(["head1", "8710"], devices.ids())
+        self.assertEqual(2, len(devices))
+        self.assertIs(devices.get("head1"), devices.default)
+        self.assertIs(devices.default, devices.get())
+        models = list(devices)
+        self.assertEqual(["head1", "8710"], [model.device_id for model in models])
+        self.assertEqual("head2.cfg", devices.get("8710").config_fname)
+        self.assertEqual(device_manager.device_logs("8710"), devices.get("8710").logs)
+        self.assertNotEqual(models[0].logs['output'], models[1].logs['output'])
+        self.assertNotEqual(models[0].logs['error'], models[1].logs['error'])
+        self.assertEqual('Encoder', devices.get("head1").get_configured_trigger()['type'])
+        self.assertEqual({'device':"head1", 'running':False, 'persistent':False},
+                         devices.get("head1").profiler_status())
+
+    def test_invalid_devices(self):
+        """Verify device ids must be unique and usable in URLs and filenames"""
+        self.assertRaises(ValueError, device_manager.DeviceManager, [("head/1", "head1.cfg")])
+        self.assertRaises(ValueError, device_manager.DeviceManager, [("head1", "a.cfg"), ("head1", "b.cfg")])
+
+if __name__ == "__main__":
+    unittest.main()
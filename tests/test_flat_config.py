@@ -0,0 +1,99 @@
+"""test_flat_config.py - tests the flat_config module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import io
+import os
+import os.path
+import shutil
+import tempfile
+from models import flat_config
+from models.configobj import ConfigObj
+
+class TestFlatConfig(unittest.TestCase):
+    """Tests the flat_config module"""
+
+    SAMPLECFGPATH = os.path.join(os.path.dirname(__file__), 'support_files', 'sample_config.cfg')
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.config_fname = os.path.join(self.temp_folder, "test.cfg")
+        shutil.copyfile(TestFlatConfig.SAMPLECFGPATH, self.config_fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def write_config(self, text):
+        """Writes the specified text to the test configuration file"""
+        with open(self.config_fname, "wb") as fid:
+            fid.write(text)
+
+    def as_dict(self, cfg):
+        """Returns the configuration as a plain dict of strings"""
+        return dict((key, self.as_dict(value) if isinstance(value, dict) else str(value))
+                    for key, value in cfg.items())
+
+    def test_read(self):
+        """Verify flat configurations are read as ConfigObj reads them"""
+        cfg = flat_config.FlatConfig(self.config_fname)
+        self.assertEqual(ConfigObj(self.config_fname).dict(), self.as_dict(cfg))
+        self.assertEqual(['System', 'Network', 'Encoder', 'Trigger'], list(cfg.keys()))
+        self.assertEqual(8710, cfg['System'].as_int('device_id'))
+        self.assertFalse(cfg['Network'].as_bool('use_dhcp'))
+        self.assertEqual(0.01, cfg['Encoder'].as_float('resolution'))
+        self.write_config(b"top = 'quoted # value'  # comment\n[Section]\nempty =\nspaced = a b  \n")
+        cfg = flat_config.FlatConfig(self.config_fname)
+        self.assertEqual(ConfigObj(self.config_fname).dict(), self.as_dict(cfg))
+        self.assertEqual({}, dict(flat_config.FlatConfig(os.path.join(self.temp_folder, "potato.cfg"))))
+
+    def test_unsupported(self):
+        """Verify files using more than the flat subset are rejected, and load_config reads them with ConfigObj"""
+        unsupported = [b"[Section]\nkey = a, b\n",
+                       b"[Section]\n[[Subsection]]\nkey = value\n",
+                       b"[Section]\nkey = '''multiline\nvalue'''\n",
+                       b"[Section]\nhome = /tmp\npath = $home/scans\n",
+                       b"\xef\xbb\xbf[Section]\nkey = value\n"]
+        for text in unsupported:
+            self.write_config(text)
+            self.assertRaises(flat_config.UnsupportedConfig, flat_config.FlatConfig, self.config_fname)
+            cfg = flat_config.load_config(self.config_fname)
+            self.assertTrue(isinstance(cfg, ConfigObj))
+            self.assertEqual(ConfigObj(self.config_fname).dict(), cfg.dict())
+        self.write_config(b"[Section]\nkey = value\nkey = again\n")
+        self.assertRaises(flat_config.UnsupportedConfig, flat_config.FlatConfig, self.config_fname)
+        self.assertTrue(isinstance(flat_config.load_config(TestFlatConfig.SAMPLECFGPATH), flat_config.FlatConfig))
+        self.assertTrue(isinstance(flat_config.load_config(TestFlatConfig.SAMPLECFGPATH, configspec=[]), ConfigObj))
+
+    def test_write(self):
+        """Verify writing reproduces the file apart from changed values"""
+        with open(self.config_fname, "rb") as fid:
+            original = fid.read()
+        cfg = flat_config.FlatConfig(self.config_fname)
+        output = io.BytesIO()
+        cfg.write(output)
+        self.assertEqual(original, output.getvalue())
+        cfg['Trigger']['frame_rate'] = 2000
+        cfg['Trigger']['enable_gate'] = True
+        cfg['Encoder']['model'] = 'Test Encoder # 2'
+        cfg['Network']['dns'] = '8.8.8.8'
+        cfg['Extra'] = {'key':'value'}
+        del cfg['System']
+        cfg.write()
+        with open(self.config_fname, "rb") as fid:
+            updated = fid.read()
+        self.assertTrue(b"frame_rate = 2000\n" in updated)
+        self.assertTrue(b"gateway = 0.0.0.0# Gateway (default 0.0.0.0)\ndns = 8.8.8.8\n" in updated)
+        self.assertFalse(b"device_id" in updated)
+        for line in original.splitlines():
+            if line.strip().startswith(b"#") or b"travel_threshold" in line:
+                self.assertTrue(line in updated)
+        parsed = ConfigObj(self.config_fname)
+        self.assertEqual(self.as_dict(cfg), parsed.dict())
+        self.assertEqual('Test Encoder # 2', parsed['Encoder']['model'])
+        self.assertEqual(self.as_dict(cfg), self.as_dict(flat_config.FlatConfig(self.config_fname)))
+        self.assertRaises(TypeError, flat_config.format_value, ['a', 'b'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,7 +6,17 @@ Chris R. Coughlin (TRI/Austin, Inc.)
 import unittest
 import os.path
 import random
+import shutil
+import sys
+import tempfile
+import time
 from models import gocator_model
+from models.decimate import DECIMATION_MODES
+from models import log_reader
+from models import scan_reader
+from models.plot_cache import PlotCache
+from models.scan_preview import ScanPreview
+from models.scan_tail import ScanTail
 from models.configobj import ConfigObj
 
 class TestGocatorModel(unittest.TestCase):
@@ -143,6 +153,138 @@ class TestGocatorModel(unittest.TestCase):
         self.assertTrue(self.start_scanner())
         self.model.stop_scanner()
 
+    def test_stop_mock_scanner(self):
+        """Verify stopping a scanner process and logging its output"""
+        mock_scanner = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mock_scanner', 'gocator_encoder.py')
+        self.model.clear_scanner_logs()
+        self.model.launch([sys.executable, mock_scanner])
+        self.assertTrue(self.model.scanner_running)
+        self.model.stop_scanner(timeout=5)
+        self.assertFalse(self.model.scanner_running)
+        standard_output, standard_error = self.model.get_scanner_logs()
+        self.assertTrue("Operation halted by user" in standard_error)
+        self.model.clear_scanner_logs()
+
+    def test_scan_progress(self):
+        """Verify reporting the progress of a scan"""
+        progress = self.model.scan_progress()
+        self.assertFalse(progress['running'])
+        self.assertEqual(0, progress['rows'])
+        mock_scanner = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mock_scanner', 'gocator_encoder.py')
+        self.model.clear_scanner_logs()
+        self.model.launch([sys.executable, mock_scanner])
+        self.model.scanner_proc.stdin.write(b"\r\n")
+        self.model.scanner_proc.stdin.flush()
+        deadline = time.time() + 5
+        while not self.model.scan_progress()['lines'] and time.time() < deadline:
+            time.sleep(0.1)
+        progress = self.model.scan_progress()
+        self.assertTrue(progress['running'])
+        self.assertTrue(progress['elapsed'] >= 0)
+        self.assertEqual(1, len(progress['lines']))
+        self.assertEqual([], self.model.scan_progress(since=progress['lines'][-1][0])['lines'])
+        self.model.stop_scanner(timeout=5)
+        self.model.clear_scanner_logs()
+
+    def test_persistent_profiler(self):
+        """Verify targeting and scanning with one persistent profiler process"""
+        mock_scanner = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mock_scanner', 'gocator_encoder.py')
+        temp_folder = tempfile.mkdtemp()
+        self.model.clear_scanner_logs()
+        self.model.persistent_profiler = True
+        try:
+            self.assertTrue(self.model.start_profiler([sys.executable, mock_scanner, "-i"]))
+            self.assertFalse(self.model.scanner_running)
+            proc = self.model.supervisor.proc
+            self.assertTrue(self.model.start_target())
+            self.model.stop_scanner()
+            self.assertFalse(self.model.scanner_running)
+            data_file = os.path.join(temp_folder, "scan.csv")
+            self.assertTrue(self.model.start_scanner(data_file, "Persistent"))
+            progress = self.model.scan_progress()
+            self.assertTrue(progress['running'])
+            self.assertTrue(progress['elapsed'] >= 0)
+            self.assertTrue(all(line_number > self.model.first_line for line_number, line in progress['lines']))
+            self.model.stop_scanner()
+            self.assertFalse(self.model.scanner_running)
+            self.assertIs(proc, self.model.supervisor.proc)
+            self.assertTrue(scan_reader.has_sidecar(data_file))
+            self.assertEqual("Persistent", scan_reader.read_metadata(data_file)['comments'])
+            # Saving the configuration restarts the idle profiler so that it's read again
+            self.model.supervisor.poll_interval = 0.05
+            self.assertTrue(self.model.set_configured_encoder(self.model.get_configured_encoder()))
+            deadline = time.time() + 10
+            while self.model.supervisor.proc is proc and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertIsNot(proc, self.model.supervisor.proc)
+        finally:
+            self.model.stop_profiler()
+            self.assertIsNone(self.model.supervisor)
+            shutil.rmtree(temp_folder)
+            self.model.clear_scanner_logs()
+
+    def test_scan_preview(self):
+        """Verify previewing a scan in progress"""
+        temp_folder = tempfile.mkdtemp()
+        try:
+            data_file = os.path.join(temp_folder, "scan.csv")
+            preview_file = os.path.join(temp_folder, "preview.png")
+            with open(TestGocatorModel.SAMPLEINPUTDATA, "rb") as fid:
+                lines = fid.read().splitlines(True)
+            self.model.scan_tail = ScanTail(data_file)
+            self.model.preview = ScanPreview(preview_file)
+            self.model.start_progress(0.05, 0.05)
+            with open(data_file, "wb") as fid:
+                fid.writelines(lines[:len(lines) // 2])
+            deadline = time.time() + 5
+            while self.model.scan_progress()['preview'] is None and time.time() < deadline:
+                time.sleep(0.05)
+            progress = self.model.scan_progress()
+            self.assertEqual(preview_file, progress['preview'])
+            self.assertTrue(progress['preview_version'] > 0)
+            self.assertTrue(progress['rows'] > 0)
+            self.assertEqual(progress['bytes'], os.path.getsize(data_file))
+            self.assertTrue(os.path.exists(preview_file))
+            self.model.stop_progress()
+            self.assertIsNone(self.model.preview)
+            self.assertIsNone(self.model.scan_tail)
+            self.assertEqual(0, self.model.scan_progress()['rows'])
+            self.assertFalse(os.path.exists(preview_file))
+        finally:
+            self.model.stop_progress()
+            shutil.rmtree(temp_folder)
+
+    def test_convert_scan(self):
+        """Verify writing a scan's sidecar and metadata, and plotting with the stored bounds"""
+        temp_folder = tempfile.mkdtemp()
+        try:
+            data_file = os.path.join(temp_folder, "scan.csv")
+            shutil.copyfile(TestGocatorModel.SAMPLEINPUTDATA, data_file)
+            self.assertEqual(scan_reader.sidecar_fname(data_file), self.model.convert_scan(data_file, comments="Test"))
+            metadata = scan_reader.read_metadata(data_file)
+            self.assertEqual("Test", metadata['comments'])
+            self.assertEqual(scan_reader.count_points(data_file), metadata['num_points'])
+            for mode in gocator_model.GocatorModel.PLOT_MODES:
+                img_file = os.path.join(temp_folder, "plot_{0}.png".format(mode))
+                self.model.profile(data_file, img_file, mode=mode)
+                self.assertTrue(os.path.exists(img_file))
+            self.assertIsNone(self.model.convert_scan(os.path.join(temp_folder, "missing.csv")))
+            # Compressed storage
+            os.remove(data_file)
+            shutil.copyfile(TestGocatorModel.SAMPLEINPUTDATA, data_file)
+            self.model.convert_scan(data_file, comments="Compressed")
+            scan_reader.compress_scan(data_file)
+            self.assertFalse(os.path.exists(data_file))
+            data_file = scan_reader.stored_fname(data_file)
+            self.assertTrue(scan_reader.is_compressed(data_file))
+            self.assertEqual("Compressed", scan_reader.read_metadata(data_file)['comments'])
+            self.assertTrue(scan_reader.has_sidecar(data_file))
+            img_file = os.path.join(temp_folder, "plot_compressed.png")
+            self.model.profile(data_file, img_file)
+            self.assertTrue(os.path.exists(img_file))
+        finally:
+            shutil.rmtree(temp_folder)
+
     def test_stop_scanning(self):
         """Verify stopping the scanner process"""
         self.model.stop_scanner()
@@ -150,14 +292,44 @@ class TestGocatorModel(unittest.TestCase):
         self.model.clear_scanner_logs()
 
     def test_profile(self):
-        """Verify creating a scatter plot of data"""
+        """Verify creating a plot of data"""
         img_file = os.path.join(TestGocatorModel.SUPPORTFILESPATH, "test_profile.png")
-        self.model.profile(TestGocatorModel.SAMPLEINPUTDATA, img_file)
-        self.assertTrue(os.path.exists(img_file))
+        for mode in gocator_model.GocatorModel.PLOT_MODES:
+            self.model.profile(TestGocatorModel.SAMPLEINPUTDATA, img_file, mode=mode)
+            self.assertTrue(os.path.exists(img_file))
+            try:
+                os.remove(img_file)
+            except WindowsError: # File in use
+                pass
+        self.assertRaises(ValueError, self.model.profile, TestGocatorModel.SAMPLEINPUTDATA, img_file, mode='potato')
+
+    def test_decimated_profile(self):
+        """Verify creating a scatter plot of decimated data"""
+        img_file = os.path.join(TestGocatorModel.SUPPORTFILESPATH, "test_profile.png")
+        for decimation in [None] + list(DECIMATION_MODES):
+            self.model.profile(TestGocatorModel.SAMPLEINPUTDATA, img_file, mode='scatter',
+                               decimation=decimation, point_budget=1000)
+            self.assertTrue(os.path.exists(img_file))
+            try:
+                os.remove(img_file)
+            except WindowsError: # File in use
+                pass
+
+    def test_cached_profile(self):
+        """Verify returning a plot from the plot cache"""
+        cache_folder = tempfile.mkdtemp()
+        img_file = os.path.join(cache_folder, "test_profile.png")
         try:
-            os.remove(img_file)
-        except WindowsError: # File in use
-            pass
+            self.model.plot_cache = PlotCache(cache_folder)
+            cached_file = self.model.profile(TestGocatorModel.SAMPLEINPUTDATA, img_file)
+            self.assertNotEqual(img_file, cached_file)
+            self.assertFalse(os.path.exists(img_file))
+            self.assertTrue(os.path.exists(cached_file))
+            self.assertEqual(cached_file, self.model.profile(TestGocatorModel.SAMPLEINPUTDATA, img_file))
+            self.assertNotEqual(cached_file, self.model.profile(TestGocatorModel.SAMPLEINPUTDATA, img_file,
+                                                                cmap='jet'))
+        finally:
+            shutil.rmtree(cache_folder)
 
     def test_get_scanner_logs(self):
         """Verify returning standard output and standard error log files"""
@@ -177,6 +349,29 @@ class TestGocatorModel(unittest.TestCase):
         self.assertTrue(len(standard_output)==0)
         self.assertTrue(len(standard_error)==0)
 
+    def test_read_scanner_log(self):
+        """Verify reading the scanner logs backwards through their rotated backups"""
+        output_log = gocator_model.GocatorModel.STDOUTPATH
+        try:
+            self.model.clear_scanner_logs()
+            self.assertEqual(("", ""), self.model.get_scanner_logs())
+            for backup, first_line in ((2, 0), (1, 100), (0, 200)):
+                with open(log_reader.backup_fname(output_log, backup), "wb") as fid:
+                    fid.write(b"".join(b"line %d\n" % i for i in range(first_line, first_line + 100)))
+            self.assertEqual(b"line 298\nline 299\n", self.model.get_scanner_logs(max_lines=2)[0])
+            chunk = self.model.read_scanner_log('output', max_lines=60)
+            lines = chunk['text'].splitlines()
+            while chunk['older'] is not None:
+                chunk = self.model.read_scanner_log('output', max_lines=60, **chunk['older'])
+                lines = chunk['text'].splitlines() + lines
+            self.assertEqual([b"line %d" % i for i in range(300)], lines)
+            self.assertRaises(ValueError, self.model.read_scanner_log, 'potato')
+            self.assertRaises(ValueError, self.model.read_scanner_log, 'output', self.model.log_backups + 1)
+        finally:
+            self.model.clear_scanner_logs()
+        for backup in range(3):
+            self.assertFalse(os.path.exists(log_reader.backup_fname(output_log, backup)))
+
     def start_targeting(self):
         """Attempts to start the targeting process, returns True if process is running."""
         return self.model.start_target()
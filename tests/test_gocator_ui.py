@@ -3,18 +3,32 @@
 Chris R. Coughlin (TRI/Austin, Inc.)
 """
 
+import datetime
+import io
 import json
 import os
+import shutil
 import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import Future
 import gocator_ui
 from models import gocator_model
 from models.configobj import ConfigObj
+from models.device_manager import DeviceManager
+from models.plot_cache import PlotCache
+from models.scan_registry import ScanRecord
 import flask
 import unittest
 
 class TestGocatorUI(unittest.TestCase):
     """Tests the Gocator UI"""
 
+    # Seconds to wait for a render job to finish
+    JOB_TIMEOUT = 20
+    SAMPLE_DATA = os.path.join(os.path.dirname(__file__), "support_files", "sample_data.csv")
+
     @classmethod
     def setUpClass(cls):
         """Stores current system configuration for restoration"""
@@ -44,6 +58,27 @@ class TestGocatorUI(unittest.TestCase):
                     pass
             os.remove(file_name)
 
+    def copy_sample_data(self, data_path=None):
+        """Helper function to copy the sample scan to data_path (default a new temporary data file),
+        returns the copy's name"""
+        if data_path is None:
+            data_path = gocator_ui.temp_data_fname()
+        shutil.copyfile(TestGocatorUI.SAMPLE_DATA, data_path)
+        return data_path
+
+    def wait_for_job(self, job_id, until=None):
+        """Helper function to poll the status of a render job until it's finished (and until() is
+        True, e.g. once the job's callbacks have run), returns the job's last status.  Fails after
+        JOB_TIMEOUT seconds."""
+        deadline = time.time() + TestGocatorUI.JOB_TIMEOUT
+        while True:
+            response_dict = json.loads(self.app.get('/jobs/{0}'.format(job_id)).data)
+            if response_dict['status'] in ('done', 'failed') and (until is None or until()):
+                return response_dict
+            if time.time() > deadline:
+                self.fail("Job {0} unfinished after {1} s: {2}".format(job_id, TestGocatorUI.JOB_TIMEOUT, response_dict))
+            time.sleep(0.1)
+
     def test_temp_fnames(self):
         """Verify returning temporary filenames"""
         fldr = os.path.join(os.path.dirname(__file__), "support_files")
@@ -58,7 +93,9 @@ class TestGocatorUI(unittest.TestCase):
         plot_folder = os.path.join(data_folder, "img")
         expected_data_files = [fname for fname in os.listdir(data_folder) if fname.endswith("csv")]
         expected_plot_files = [fname for fname in os.listdir(plot_folder) if fname.endswith("png")]
-        self.assertListEqual(expected_data_files, gocator_ui.list_data_files())
+        # Data files are listed from the catalog, which doesn't know about files added by other tests
+        gocator_ui.catalog.reconcile(data_folder)
+        self.assertListEqual(sorted(expected_data_files), sorted(gocator_ui.list_data_files()))
         self.assertListEqual(expected_plot_files, gocator_ui.list_plot_files())
 
     def login(self, username, password):
@@ -142,6 +179,27 @@ class TestGocatorUI(unittest.TestCase):
         rv = self.app.get('/clearlogs', follow_redirects=True)
         self.assertTrue("Logs cleared" in rv.data)
 
+    def test_api_logs(self):
+        """Verify paging through the logs"""
+        with open(gocator_model.GocatorModel.STDERRPATH, "wb") as fid:
+            fid.write(b"".join(b"error %d\n" % i for i in range(1000)))
+        try:
+            rv = self.app.get('/logs')
+            self.assertTrue("error 999" in rv.data)
+            self.assertFalse("error 0\n" in rv.data)
+            rv = self.app.get('/api/logs', query_string={'log':'error', 'lines':'10'})
+            response_dict = json.loads(rv.data)
+            self.assertEqual(["error {0}".format(i) for i in range(990, 1000)], response_dict['text'].splitlines())
+            rv = self.app.get('/api/logs', query_string={'log':'error', 'lines':'10',
+                                                         'before':response_dict['older']['before']})
+            response_dict = json.loads(rv.data)
+            self.assertEqual("error 980", response_dict['text'].splitlines()[0])
+            for bad_query in ({'log':'potato'}, {'bytes':'0'}, {'before':'potato'}, {'backup':'-1'}):
+                rv = self.app.get('/api/logs', query_string=bad_query)
+                self.assertEqual(400, rv.status_code)
+        finally:
+            gocator_ui.model.clear_scanner_logs()
+
     def test_get_info(self):
         """Verify returning static information pages"""
         rv = self.app.get('/help')
@@ -167,9 +225,405 @@ class TestGocatorUI(unittest.TestCase):
         response_dict = json.loads(rv.data)
         self.assertFalse(response_dict['scanning'])
         self.assertFalse(response_dict.has_key('error'))
-        self.assertTrue(response_dict.has_key('image'))
+        self.assertFalse(response_dict.has_key('job'))
         self.assertTrue(response_dict.has_key('data'))
 
+    def test_scan_stream(self):
+        """Verify streaming scan progress ends once no scan is running"""
+        rv = self.app.get('/scan/stream')
+        self.assertTrue(rv.mimetype.startswith('text/event-stream'))
+        self.assertTrue("event: done" in rv.data)
+        event_data = [line for line in rv.data.splitlines() if line.startswith("data: ")]
+        self.assertEqual(1, len(event_data))
+        progress = json.loads(event_data[0][len("data: "):])
+        self.assertFalse(progress['running'])
+        self.assertEqual(0, gocator_ui.event_id({'Last-Event-ID':'potato'}, {}))
+        self.assertEqual(12, gocator_ui.event_id({}, {'since':'12'}))
+
+    def test_scan_registry(self):
+        """Verify clients can't stop scans they don't own"""
+        record = gocator_ui.scans.begin("another client", data_path=gocator_ui.temp_data_fname())
+        try:
+            rv = self.app.get('/scanner')
+            response_dict = json.loads(rv.data)
+            self.assertTrue(response_dict['busy'])
+            self.assertFalse(response_dict['owned'])
+            rv = self.app.post("/scan", data=dict(get_plot="false", get_data="true"))
+            response_dict = json.loads(rv.data)
+            self.assertFalse(response_dict['scanning'])
+            self.assertTrue('error' in response_dict)
+            rv = self.app.post("/stopscan")
+            self.assertTrue('error' in json.loads(rv.data))
+            rv = self.app.get('/scans/{0}'.format(record.scan_id))
+            response_dict = json.loads(rv.data)
+            self.assertEqual('starting', response_dict['state'])
+            self.assertFalse(response_dict['owned'])
+        finally:
+            gocator_ui.scans.update(record.scan_id, state='failed')
+        rv = self.app.get('/scanner')
+        self.assertFalse(json.loads(rv.data)['busy'])
+        rv = self.app.get('/scans/potato')
+        self.assertEqual(404, rv.status_code)
+
+    def test_stopscan_error(self):
+        """Verify a scan that fails while stopping frees the scanner"""
+        original_catalog_scan = gocator_ui.catalog_scan
+        def failing_catalog_scan(record):
+            raise ValueError("Unable to catalog scan")
+        gocator_ui.catalog_scan = failing_catalog_scan
+        try:
+            rv = self.app.post("/scan", data=dict(get_plot="false", get_data="true"))
+            scan_id = json.loads(rv.data)['scan']
+            rv = self.app.post("/stopscan")
+            response_dict = json.loads(rv.data)
+            self.assertFalse(response_dict['scanning'])
+            self.assertEqual("Unable to catalog scan", response_dict['error'])
+        finally:
+            gocator_ui.catalog_scan = original_catalog_scan
+        self.assertEqual('failed', json.loads(self.app.get('/scans/{0}'.format(scan_id)).data)['state'])
+        self.assertFalse(json.loads(self.app.get('/scanner').data)['busy'])
+
+    def test_devices(self):
+        """Verify scanning on several devices in parallel"""
+        response_dict = json.loads(self.app.get('/api/devices').data)
+        self.assertEqual([None], [device['device'] for device in response_dict['devices']])
+        self.assertEqual(404, self.app.get('/devices/potato/scanner').status_code)
+        self.assertEqual(404, self.app.post('/devices/potato/scan').status_code)
+        mock_scanner = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mock_scanner', 'gocator_encoder.py')
+        temp_folder = tempfile.mkdtemp()
+        original_devices = gocator_ui.devices
+        devices = DeviceManager([(device_id, os.path.join(temp_folder, "{0}.cfg".format(device_id)))
+                                 for device_id in ("head1", "head2")])
+        gocator_ui.devices = devices
+        scan_names = []
+        try:
+            for model in devices:
+                shutil.copyfile(os.path.join(os.path.dirname(__file__), "support_files", "sample_config.cfg"),
+                                model.config_fname)
+                model.persistent_profiler = True
+                self.assertTrue(model.start_profiler([sys.executable, mock_scanner, "-i"]))
+            for device_id in devices.ids():
+                rv = self.app.post("/devices/{0}/scan".format(device_id), data=dict(get_plot="false"))
+                self.assertTrue(json.loads(rv.data)['scanning'])
+            response_dict = json.loads(self.app.get('/api/devices').data)
+            self.assertEqual("head1", response_dict['default'])
+            self.assertEqual(["head1", "head2"], [device['device'] for device in response_dict['devices']])
+            for device in response_dict['devices']:
+                self.assertTrue(device['busy'])
+                self.assertTrue(device['owned'])
+                self.assertTrue(device['running'])
+                self.assertEqual('scan', device['mode'])
+            # URLs that don't name a device use the first device
+            self.assertEqual("head1", json.loads(self.app.get('/scanner').data)['device'])
+            for device_id in devices.ids():
+                response_dict = json.loads(self.app.post("/devices/{0}/stopscan".format(device_id)).data)
+                self.assertFalse('error' in response_dict)
+                scan_names.append(response_dict['data'].rsplit('/', 1)[-1])
+            self.assertEqual(2, len(set(scan_names)))
+            for device_id, scan_name in zip(devices.ids(), scan_names):
+                config_snapshot = json.loads(gocator_ui.catalog.get(scan_name)['config_snapshot'])
+                self.assertEqual(device_id, config_snapshot['device'])
+            self.assertFalse(json.loads(self.app.get('/devices/head2/scanner').data)['busy'])
+        finally:
+            gocator_ui.devices = original_devices
+            for model in devices:
+                model.stop_profiler()
+                model.clear_scanner_logs()
+            for scan_name in scan_names:
+                gocator_ui.remove_scan(scan_name)
+            shutil.rmtree(temp_folder)
+
+    def test_jobs(self):
+        """Verify polling the status of a plotting job"""
+        data_path = self.copy_sample_data()
+        try:
+            job_id = gocator_ui.submit_profile(data_path, gocator_ui.temp_image_fname())
+            response_dict = self.wait_for_job(job_id)
+            self.assertEqual('done', response_dict['status'])
+            self.assertEqual(job_id, response_dict['job'])
+            self.assertTrue(response_dict['image'].endswith(".png"))
+        finally:
+            self.remove_file(data_path)
+        rv = self.app.get('/jobs/potato')
+        self.assertEqual(404, rv.status_code)
+
+    def test_catalog(self):
+        """Verify finished scans are added to the catalog and listed"""
+        data_path = self.copy_sample_data()
+        scan_name = os.path.basename(data_path)
+        record = ScanRecord("test client", data_path=data_path, comments="Catalog test scan")
+        record.num_points = 12345
+        try:
+            gocator_ui.catalog_scan(record)
+            entry = gocator_ui.catalog.get(scan_name)
+            self.assertEqual(data_path, entry['path'])
+            self.assertEqual(12345, entry['point_count'])
+            self.assertEqual(os.path.getsize(data_path), entry['size'])
+            self.assertTrue('encoder' in json.loads(entry['config_snapshot']))
+            self.assertTrue(scan_name in gocator_ui.list_data_files())
+            rv = self.app.get("/data")
+            self.assertTrue(scan_name in rv.data)
+            self.assertTrue("Catalog test scan" in rv.data)
+        finally:
+            self.remove_file(data_path)
+            gocator_ui.catalog.remove(scan_name)
+
+    def test_scan_plot(self):
+        """Verify plots are cataloged by plot cache key and rendered again once evicted"""
+        data_path = self.copy_sample_data()
+        scan_name = os.path.basename(data_path)
+        original_cache = gocator_ui.plot_cache
+        gocator_ui.plot_cache = PlotCache(tempfile.mkdtemp(dir=gocator_ui.app.config['OUTPUTIMAGEPATH']))
+        try:
+            gocator_ui.catalog.add(data_path)
+            self.assertEqual(404, self.app.get('/plots/{0}'.format(scan_name)).status_code)
+            # A plot of the scan's own counts against it
+            plot_path = gocator_ui.temp_image_fname()
+            with open(plot_path, "wb") as fid:
+                fid.write(b"\0" * 100)
+            gocator_ui.catalog_plot(scan_name, plot_path)
+            entry = gocator_ui.catalog.get(scan_name)
+            self.assertEqual((plot_path, None, 100), (entry['plot_path'], entry['plot_key'], entry['derived_size']))
+            rv = self.app.get('/plots/{0}'.format(scan_name))
+            self.assertEqual(302, rv.status_code)
+            self.assertTrue(rv.headers['Location'].endswith(os.path.basename(plot_path)))
+            # A plot in the plot cache is stored by key, and rendered again once evicted
+            cached_plot = gocator_ui.plot_cache.put("abc", "png", plot_path)
+            gocator_ui.catalog_plot(scan_name, cached_plot)
+            entry = gocator_ui.catalog.get(scan_name)
+            self.assertEqual((None, "abc"), (entry['plot_path'], entry['plot_key']))
+            listed = json.loads(self.app.get('/api/scans?limit=500').data)['scans']
+            self.assertEqual(['/plots/{0}'.format(scan_name)],
+                             [scan['plot'] for scan in listed if scan['name'] == scan_name])
+            rv = self.app.get('/plots/{0}'.format(scan_name))
+            self.assertTrue(rv.headers['Location'].endswith(os.path.basename(cached_plot)))
+            gocator_ui.plot_cache.clear()
+            rv = self.app.get('/plots/{0}'.format(scan_name))
+            self.assertEqual(302, rv.status_code)
+            self.assertTrue(os.path.basename(rv.headers['Location']).startswith("plot_"))
+            self.assertEqual(1, len(gocator_ui.plot_cache.entries()))
+            # Cached plots are left to the cache
+            gocator_ui.remove_scan(scan_name)
+            self.assertEqual(1, len(gocator_ui.plot_cache.entries()))
+        finally:
+            self.remove_file(data_path)
+            gocator_ui.catalog.remove(scan_name)
+            shutil.rmtree(gocator_ui.plot_cache.folder)
+            gocator_ui.plot_cache = original_cache
+
+    def test_api_scans(self):
+        """Verify paging through the catalog of scans"""
+        data_folder = gocator_ui.app.config['OUTPUTDATAPATH']
+        data_paths = []
+        try:
+            for i in range(5):
+                data_paths.append(gocator_ui.temp_data_fname())
+                with open(data_paths[-1], "wb") as fid:
+                    fid.write(b"1,2,3\n" * (i + 1))
+                gocator_ui.catalog.add(data_paths[-1], created=1000 + i, comment="API test {0}".format(i))
+            query = {'to':'1004', 'order':'asc', 'limit':'2'}
+            names = []
+            for page in range(2):
+                rv = self.app.get('/api/scans', query_string=query)
+                response_dict = json.loads(rv.data)
+                names.extend(scan['name'] for scan in response_dict['scans'])
+                query['cursor'] = response_dict['next_cursor']
+            self.assertEqual([os.path.basename(data_path) for data_path in data_paths[:4]], names)
+            self.assertIsNone(response_dict['next_cursor'])
+            rv = self.app.get('/api/scans', query_string={'sort':'point_count', 'comment':'API test 3'})
+            response_dict = json.loads(rv.data)
+            self.assertEqual(1, len(response_dict['scans']))
+            self.assertEqual(4, response_dict['scans'][0]['point_count'])
+            self.assertTrue(response_dict['scans'][0]['url'].endswith(os.path.basename(data_paths[3])))
+            # Listed by the date the scan was recorded, not the file's modification date
+            self.assertEqual(str(datetime.datetime.fromtimestamp(1003)), response_dict['scans'][0]['date'])
+            for bad_query in ({'sort':'potato'}, {'cursor':'potato'}, {'from':'potato'}, {'limit':'potato'},
+                              {'sort':'size', 'cursor':gocator_ui.encode_cursor('created', True, {'created':1, 'name':'a'})}):
+                rv = self.app.get('/api/scans', query_string=bad_query)
+                self.assertEqual(400, rv.status_code)
+                self.assertTrue('error' in json.loads(rv.data))
+        finally:
+            for data_path in data_paths:
+                self.remove_file(data_path)
+            gocator_ui.catalog.reconcile(data_folder)
+
+    def test_retention(self):
+        """Verify evicting old scans with everything derived from them, and pinning scans"""
+        data_folder = gocator_ui.app.config['OUTPUTDATAPATH']
+        data_paths = []
+        original_retention = gocator_ui.retention
+        try:
+            for i in range(4):
+                data_paths.append(self.copy_sample_data())
+                if i == 0:
+                    gocator_ui.model.convert_scan(data_paths[-1])
+                gocator_ui.catalog.add(data_paths[-1], created=1000 + i)
+            names = [os.path.basename(data_path) for data_path in data_paths]
+            tile_folder = os.path.join(gocator_ui.app.config['OUTPUTIMAGEPATH'], os.path.splitext(names[0])[0])
+            os.mkdir(tile_folder)
+            # Derived files count towards the size limit
+            self.assertEqual(os.path.getsize(gocator_ui.scan_reader.sidecar_fname(data_paths[0])) +
+                             os.path.getsize(gocator_ui.scan_reader.metadata_fname(data_paths[0])),
+                             gocator_ui.catalog.get(names[0])['derived_size'])
+            self.assertEqual(0, gocator_ui.catalog.get(names[1])['derived_size'])
+            rv = self.app.post('/api/scans/{0}/pin'.format(names[1]))
+            self.assertEqual(302, rv.status_code)
+            self.admin_login()
+            rv = self.app.post('/api/scans/{0}/pin'.format(names[1]))
+            self.assertTrue(json.loads(rv.data)['pinned'])
+            self.assertEqual(404, self.app.post('/api/scans/potato.csv/pin').status_code)
+            self.assertEqual([], gocator_ui.sweep_scans())
+            # Only evicts scans created before the test scans' timestamp 1500, except those read by unfinished jobs
+            gocator_ui.retention = gocator_ui.RetentionPolicy(max_age=time.time() - 1500)
+            pending_job = Future()
+            gocator_ui.render_jobs.jobs['pending'] = pending_job
+            gocator_ui.render_jobs.tag('pending', names[2])
+            self.assertEqual([names[0]], gocator_ui.sweep_scans())
+            self.assertTrue(os.path.exists(data_paths[2]))
+            pending_job.set_result(None)
+            self.assertEqual([names[2]], gocator_ui.sweep_scans())
+            for fname in (data_paths[0], data_paths[2], tile_folder):
+                self.assertFalse(os.path.exists(fname))
+            self.assertFalse(os.path.exists(gocator_ui.scan_reader.sidecar_fname(data_paths[0])))
+            self.assertFalse(os.path.exists(gocator_ui.scan_reader.metadata_fname(data_paths[0])))
+            self.assertIsNone(gocator_ui.catalog.get(names[0]))
+            # A scan removed by another sweep in the meantime is skipped
+            gocator_ui.remove_scan(names[0])
+            self.assertTrue(os.path.exists(data_paths[1]))
+            rv = self.app.delete('/api/scans/{0}/pin'.format(names[1]))
+            self.assertFalse(json.loads(rv.data)['pinned'])
+            self.assertEqual([names[1]], gocator_ui.sweep_scans())
+            self.assertTrue(os.path.exists(data_paths[3]))
+        finally:
+            gocator_ui.retention = original_retention
+            gocator_ui.render_jobs.jobs.pop('pending', None)
+            gocator_ui.render_jobs.subjects.pop('pending', None)
+            for data_path in data_paths:
+                self.remove_file(data_path)
+            gocator_ui.catalog.reconcile(data_folder)
+
+    def test_free_space(self):
+        """Verify scans aren't started without enough free disk space"""
+        data_folder = gocator_ui.app.config['OUTPUTDATAPATH']
+        self.assertTrue(gocator_ui.free_space(data_folder) > 0)
+        self.assertTrue(gocator_ui.expected_scan_size() >= gocator_ui.app.config.get('SCAN_RESERVE_BYTES', 0))
+        original_reserve = gocator_ui.app.config.get('SCAN_RESERVE_BYTES', 0)
+        gocator_ui.app.config['SCAN_RESERVE_BYTES'] = gocator_ui.free_space(data_folder) * 2
+        try:
+            rv = self.app.post("/scan", data=dict(get_plot="false", get_data="true"))
+            response_dict = json.loads(rv.data)
+            self.assertFalse(response_dict['scanning'])
+            self.assertTrue("disk space" in response_dict['error'])
+            self.assertIsNone(gocator_ui.scans.active())
+        finally:
+            gocator_ui.app.config['SCAN_RESERVE_BYTES'] = original_reserve
+
+    def test_compression(self):
+        """Verify compressing a stored scan in the background and cataloging the compressed copy"""
+        data_folder = gocator_ui.app.config['OUTPUTDATAPATH']
+        data_path = self.copy_sample_data()
+        scan_name = os.path.basename(data_path)
+        removed_path = gocator_ui.temp_data_fname()
+        try:
+            gocator_ui.catalog.add(data_path, comment="Compress me")
+            job_id = gocator_ui.submit_compression(data_path, 'gzip')
+            response_dict = self.wait_for_job(job_id, until=lambda: gocator_ui.catalog.get(scan_name) is None)
+            self.assertEqual('done', response_dict['status'])
+            self.assertFalse(os.path.exists(data_path))
+            entry = gocator_ui.catalog.get(scan_name + gocator_ui.scan_reader.COMPRESSED_EXTENSION)
+            self.assertEqual("Compress me", entry['comment'])
+            self.assertEqual(200, self.app.get('/data/{0}'.format(scan_name)).status_code)
+            # A failed compression keeps the scan
+            job_id = gocator_ui.submit_compression(data_path, 'gzip')
+            self.assertEqual('failed', self.wait_for_job(job_id)['status'])
+            self.assertIsNotNone(gocator_ui.catalog.get(scan_name + gocator_ui.scan_reader.COMPRESSED_EXTENSION))
+            # A scan removed from the catalog (e.g. evicted) isn't replaced by a compressed copy
+            self.copy_sample_data(removed_path)
+            job_id = gocator_ui.submit_compression(removed_path, 'gzip')
+            response_dict = self.wait_for_job(job_id)
+            self.assertEqual('done', response_dict['status'])
+            self.assertFalse('image' in response_dict)
+            self.assertTrue(os.path.exists(removed_path))
+            self.assertFalse(os.path.exists(removed_path + gocator_ui.scan_reader.COMPRESSED_EXTENSION))
+        finally:
+            self.remove_file(data_path)
+            self.remove_file(data_path + gocator_ui.scan_reader.COMPRESSED_EXTENSION)
+            self.remove_file(removed_path)
+            gocator_ui.catalog.reconcile(data_folder)
+
+    def test_download_scan(self):
+        """Verify downloading stored and compressed scans"""
+        data_folder = gocator_ui.app.config['OUTPUTDATAPATH']
+        sample_path = TestGocatorUI.SAMPLE_DATA
+        with open(sample_path, "rb") as fid:
+            sample_data = fid.read()
+        data_path = gocator_ui.temp_data_fname()
+        shutil.copyfile(sample_path, data_path)
+        compressed_path = None
+        try:
+            gocator_ui.catalog.add(data_path)
+            rv = self.app.get('/data/{0}'.format(os.path.basename(data_path)))
+            self.assertEqual(sample_data, rv.data)
+            self.assertEqual('text/csv', rv.mimetype)
+            gocator_ui.catalog.remove(os.path.basename(data_path))
+            compressed_path = gocator_ui.scan_reader.compress_scan(data_path)
+            compressed_name = os.path.basename(compressed_path)
+            gocator_ui.catalog.add(compressed_path)
+            rv = self.app.get('/data/{0}'.format(compressed_name), headers=[('Accept-Encoding', 'gzip, deflate')])
+            self.assertEqual('gzip', rv.headers['Content-Encoding'])
+            with open(compressed_path, "rb") as fid:
+                self.assertEqual(fid.read(), rv.data)
+            self.assertTrue(os.path.basename(data_path) in rv.headers['Content-Disposition'])
+            rv = self.app.get('/data/{0}'.format(compressed_name))
+            self.assertFalse('Content-Encoding' in rv.headers)
+            self.assertEqual(sample_data, rv.data)
+            self.assertEqual(404, self.app.get('/data/potato.csv').status_code)
+            rv = self.app.get("/scans.zip")
+            with zipfile.ZipFile(io.BytesIO(rv.data)) as archive_zip:
+                self.assertEqual(sample_data, archive_zip.read(os.path.basename(data_path)))
+        finally:
+            for fname in (data_path, compressed_path):
+                if fname is not None:
+                    self.remove_file(fname)
+            gocator_ui.catalog.reconcile(data_folder)
+
+    def test_parse_time(self):
+        """Verify reading dates in scan queries"""
+        self.assertIsNone(gocator_ui.parse_time(''))
+        self.assertEqual(1234.5, gocator_ui.parse_time('1234.5'))
+        start = gocator_ui.parse_time('2013-06-01')
+        self.assertEqual(start + 3600, gocator_ui.parse_time('2013-06-01T01:00'))
+        self.assertEqual(gocator_ui.parse_time('2013-06-02'), gocator_ui.parse_time('2013-06-01', end_of_day=True))
+        self.assertRaises(ValueError, gocator_ui.parse_time, '06/01/2013')
+
+    def test_tiles(self):
+        """Verify building and serving a tile pyramid"""
+        data_path = self.copy_sample_data()
+        scan_name = os.path.splitext(os.path.basename(data_path))[0]
+        try:
+            job_id = gocator_ui.submit_tiles(data_path)
+            self.assertEqual('done', self.wait_for_job(job_id)['status'])
+            version = gocator_ui.current_version(os.path.join(gocator_ui.app.config['OUTPUTIMAGEPATH'], scan_name))
+            rv = self.app.get('/tiles/{0}/{1}/{0}.dzi'.format(scan_name, version))
+            self.assertEqual(200, rv.status_code)
+            self.assertTrue("immutable" in rv.headers['Cache-Control'])
+            rv = self.app.get('/tiles/{0}/{1}/{0}_files/0/0_0.png'.format(scan_name, version))
+            self.assertEqual(200, rv.status_code)
+            rv = self.app.get('/view/{0}'.format(scan_name))
+            self.assertTrue("{0}/{1}.dzi".format(version, scan_name) in rv.data)
+            self.assertEqual(404, self.app.get('/view/potato').status_code)
+            self.assertFalse(gocator_ui.is_tile_path("{0}/plot.png".format(scan_name)))
+            self.assertTrue(scan_name in gocator_ui.list_tile_folders())
+            # Pyramids being built are left alone
+            temp_folder = tempfile.mkdtemp(dir=gocator_ui.app.config['OUTPUTIMAGEPATH'], prefix=gocator_ui.TEMP_PREFIX)
+            try:
+                self.assertFalse(os.path.basename(temp_folder) in gocator_ui.list_tile_folders())
+            finally:
+                os.rmdir(temp_folder)
+        finally:
+            self.remove_file(data_path)
+            shutil.rmtree(os.path.join(gocator_ui.app.config['OUTPUTIMAGEPATH'], scan_name), ignore_errors=True)
+
     def test_target(self):
         """Verify starting and stopping the scanner in targeting mode"""
         rv = self.app.post("/target")
@@ -181,6 +635,7 @@ class TestGocatorUI(unittest.TestCase):
 
     def test_data(self):
         """Verify returning a list of stored data and clearing it"""
+        gocator_ui.catalog.reconcile(gocator_ui.app.config['OUTPUTDATAPATH'])
         rv = self.app.get("/data")
         self.assertTrue("Data" in rv.data)
         data_files = os.listdir(gocator_ui.app.config['OUTPUTDATAPATH'])
@@ -195,6 +650,15 @@ class TestGocatorUI(unittest.TestCase):
         self.assertEqual(len(gocator_ui.list_data_files()), 0)
         self.assertEqual(len(gocator_ui.list_plot_files()), 0)
 
+    def test_download_zip(self):
+        """Verify streaming a ZIP of the stored data"""
+        rv = self.app.get("/scans.zip")
+        self.assertEqual('application/zip', rv.mimetype)
+        with zipfile.ZipFile(io.BytesIO(rv.data)) as archive_zip:
+            self.assertIsNone(archive_zip.testzip())
+            self.assertEqual(sorted(gocator_ui.list_data_files()), sorted(archive_zip.namelist()))
+        self.assertFalse(os.path.exists(os.path.join(gocator_ui.app.config['OUTPUTDATAPATH'], "scans.zip")))
+
     def test_dnld_data(self):
         """Verify returning a URL to a ZIP of the stored data contents"""
         rv = self.app.post("/dnld_data")
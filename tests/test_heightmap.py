@@ -0,0 +1,80 @@
+"""test_heightmap.py - tests the heightmap module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import numpy as np
+from models import heightmap
+
+class TestHeightmap(unittest.TestCase):
+    """Tests binning points onto a regular grid"""
+
+    def setUp(self):
+        # 10x20 grid of points on 0.5 x 0.1 spacing, Z = row number
+        self.x, self.y = np.meshgrid(np.arange(20) * 0.5, np.arange(10) * 0.1)
+        self.z = np.round(self.y / 0.1)
+        self.x = self.x.ravel()
+        self.y = self.y.ravel()
+        self.z = self.z.ravel()
+
+    def test_estimate_steps(self):
+        """Verify estimating grid spacing from points"""
+        x_step, y_step = heightmap.estimate_steps(self.x, self.y)
+        self.assertAlmostEqual(0.5, x_step)
+        self.assertAlmostEqual(0.1, y_step)
+
+    def test_add(self):
+        """Verify binning points onto the grid"""
+        grid = heightmap.Heightmap(x_step=0.5, y_step=0.1)
+        grid.add(self.x, self.y, self.z)
+        self.assertEqual((10, 20), grid.shape)
+        self.assertEqual(self.x.size, grid.num_points)
+        self.assertTrue(np.allclose(self.z.reshape(10, 20), grid.image()))
+        self.assertTrue(np.allclose([-0.25, 9.75, -0.05, 0.95], grid.extent))
+
+    def test_grow(self):
+        """Verify the grid grows as points are added"""
+        grid = heightmap.Heightmap(x_step=0.5, y_step=0.1)
+        for row in range(10):
+            in_row = slice(row * 20, (row + 1) * 20)
+            grid.add(self.x[in_row], self.y[in_row], self.z[in_row])
+        rows, cols = grid.shape
+        self.assertTrue(rows >= 10)
+        self.assertEqual(self.x.size, grid.num_points)
+        self.assertTrue(np.allclose(self.z.reshape(10, 20), grid.image()[:10]))
+
+    def test_coarsen(self):
+        """Verify the grid is coarsened to stay within the cell budget"""
+        grid = heightmap.Heightmap(x_step=0.5, y_step=0.1, max_cells=50)
+        grid.add(self.x, self.y, self.z)
+        self.assertTrue(grid.sum.size <= 50)
+        self.assertAlmostEqual(1.0, grid.x_step)
+        self.assertAlmostEqual(0.2, grid.y_step)
+        self.assertEqual(self.x.size, grid.num_points)
+        self.assertAlmostEqual(self.z.sum(), grid.sum.sum())
+
+    def test_float32(self):
+        """Verify accumulating a compact grid through coarsening"""
+        grid = heightmap.Heightmap(x_step=0.5, y_step=0.1, max_cells=50, dtype=np.float32)
+        grid.add(self.x, self.y, self.z)
+        self.assertEqual(np.float32, grid.sum.dtype)
+        self.assertEqual(np.int32, grid.count.dtype)
+        self.assertEqual(self.x.size, grid.num_points)
+        self.assertAlmostEqual(self.z.sum(), grid.sum.sum(), places=3)
+
+    def test_extrema(self):
+        """Verify tracking the minimum and maximum Z of each cell through coarsening"""
+        grid = heightmap.Heightmap(x_step=0.5, y_step=0.1, max_cells=50, track_extrema=True)
+        grid.add(self.x, self.y, self.z)
+        x, y, zmin = grid.points('min')
+        x, y, zmax = grid.points('max')
+        x, y, zmean = grid.points()
+        self.assertTrue(np.all(zmin <= zmean) and np.all(zmean <= zmax))
+        self.assertEqual(self.z.min(), zmin.min())
+        self.assertEqual(self.z.max(), zmax.max())
+        # 2x2 cells span two rows of Z
+        self.assertTrue(np.allclose(1, zmax - zmin))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""test_hqs.py - tests the hqs module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os.path
+import shutil
+import threading
+import unittest
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+import gocator_ui
+import hqs
+
+class TestHQS(AsyncHTTPTestCase):
+    """Tests the Tornado server"""
+
+    def get_app(self):
+        gocator_ui.app.config['TESTING'] = True
+        return hqs.make_app(workers=2)
+
+    def test_wsgi(self):
+        """Verify Flask requests are served"""
+        response = self.fetch('/help')
+        self.assertEqual(200, response.code)
+        self.assertTrue(b"Help" in response.body)
+        response = self.fetch('/jobs/potato')
+        self.assertEqual(404, response.code)
+        self.assertEqual("Unknown job", json.loads(response.body)['error'])
+
+    def test_static(self):
+        """Verify static files are served by the IOLoop"""
+        response = self.fetch('/static/img/working.gif')
+        self.assertEqual(200, response.code)
+        with open(os.path.join(gocator_ui.app.static_folder, 'img', 'working.gif'), 'rb') as fid:
+            self.assertEqual(fid.read(), response.body)
+
+    def test_tiles(self):
+        """Verify only tiles and descriptors are served as immutable"""
+        image_folder = gocator_ui.app.config['OUTPUTIMAGEPATH']
+        tile_folder = os.path.join(image_folder, "hqs_test", "1", "hqs_test_files", "0")
+        os.makedirs(tile_folder)
+        plot_file = os.path.join(image_folder, "hqs_test", "plot.png")
+        try:
+            for fname in (os.path.join(tile_folder, "0_0.png"), os.path.join(image_folder, "hqs_test", "1", "hqs_test.dzi"),
+                          plot_file):
+                with open(fname, "wb") as fid:
+                    fid.write(b"test")
+            for url in ('/tiles/hqs_test/1/hqs_test_files/0/0_0.png', '/tiles/hqs_test/1/hqs_test.dzi'):
+                response = self.fetch(url)
+                self.assertEqual(200, response.code)
+                self.assertTrue("immutable" in response.headers['Cache-Control'])
+            response = self.fetch('/tiles/hqs_test/plot.png?v=1')
+            self.assertEqual(200, response.code)
+            self.assertEqual('no-cache', response.headers['Cache-Control'])
+            self.assertFalse('Expires' in response.headers)
+        finally:
+            shutil.rmtree(os.path.join(image_folder, "hqs_test"))
+
+    def test_scan_stream(self):
+        """Verify the scan progress stream ends once no scan is running"""
+        response = self.fetch('/scan/stream')
+        self.assertEqual(200, response.code)
+        self.assertEqual('text/event-stream', response.headers['Content-Type'])
+        self.assertTrue(b"event: done" in response.body)
+
+class TestWSGIHandler(AsyncHTTPTestCase):
+    """Tests running a WSGI application on worker threads"""
+
+    def get_app(self):
+        self.request_threads = []
+        return Application([(r".*", hqs.WSGIHandler, dict(wsgi_app=self.wsgi_app,
+                                                          executor=ThreadPoolExecutor(max_workers=2)))])
+
+    def wsgi_app(self, environ, start_response):
+        """WSGI application that records the thread it's called on, responds in 10 chunks"""
+        self.request_threads.append(threading.current_thread())
+        start_response("201 Created", [("Content-Type", "text/plain"), ("X-Test", "1"), ("X-Test", "2")])
+        return (str(i).encode('ascii') * 1024 for i in range(10))
+
+    def test_wsgi(self):
+        """Verify streaming a WSGI response produced on a worker thread"""
+        response = self.fetch('/')
+        self.assertEqual(201, response.code)
+        self.assertEqual(b"".join(str(i).encode('ascii') * 1024 for i in range(10)), response.body)
+        self.assertEqual('text/plain', response.headers['Content-Type'])
+        self.assertEqual(['1', '2'], response.headers.get_list('X-Test'))
+        self.assertNotEqual(threading.current_thread(), self.request_threads[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""test_log_reader.py - tests the log_reader module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+from models import log_reader
+
+class TestLogReader(unittest.TestCase):
+    """Tests rotating and reading the ends of log files"""
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.log_fname = os.path.join(self.temp_folder, "test.log")
+        self.lines = [b"line %d\n" % i for i in range(5000)]
+        self.content = b"".join(self.lines)
+        self.write_log(self.log_fname, self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def write_log(self, log_fname, content):
+        """Writes the specified content to a log file"""
+        with open(log_fname, "wb") as fid:
+            fid.write(content)
+
+    def test_tail_lines(self):
+        """Verify reading the last lines of a log"""
+        for block_size in (7, 100, 64 * 1024):
+            tail = log_reader.read_tail(self.log_fname, max_lines=10, max_bytes=None, block_size=block_size)
+            self.assertEqual(b"".join(self.lines[-10:]), tail['text'])
+            self.assertEqual(len(self.content), tail['end'])
+            self.assertEqual(len(self.content), tail['size'])
+            self.assertEqual(len(self.content) - len(tail['text']), tail['start'])
+        tail = log_reader.read_tail(self.log_fname, max_lines=10000, max_bytes=None, block_size=1000)
+        self.assertEqual(self.content, tail['text'])
+        self.assertEqual(0, tail['start'])
+        # Unterminated last line counts as a line
+        self.write_log(self.log_fname, self.content + b"partial")
+        tail = log_reader.read_tail(self.log_fname, max_lines=2, max_bytes=None)
+        self.assertEqual(self.lines[-1] + b"partial", tail['text'])
+
+    def test_tail_bytes(self):
+        """Verify reading at most a number of bytes, starting at the start of a line"""
+        tail = log_reader.read_tail(self.log_fname, max_bytes=100, block_size=32)
+        self.assertTrue(len(tail['text']) <= 100)
+        self.assertTrue(tail['text'].startswith(b"line"))
+        self.assertTrue(self.content.endswith(tail['text']))
+        self.assertEqual(b"\n", self.content[tail['start'] - 1:tail['start']])
+        # A single line longer than the limit is cut
+        self.write_log(self.log_fname, b"x" * 1000 + b"\n")
+        self.assertEqual(b"x" * 9 + b"\n", log_reader.read_tail(self.log_fname, max_bytes=10)['text'])
+        tail = log_reader.read_tail(self.log_fname, max_lines=5, max_bytes=10000)
+        self.assertEqual(0, tail['start'])
+
+    def test_paging(self):
+        """Verify reading a log backwards a chunk at a time"""
+        chunks = []
+        before = None
+        while before != 0:
+            tail = log_reader.read_tail(self.log_fname, max_lines=300, max_bytes=1000, before=before, block_size=256)
+            self.assertTrue(tail['start'] < tail['end'])
+            chunks.insert(0, tail['text'])
+            before = tail['start']
+        self.assertEqual(self.content, b"".join(chunks))
+        self.assertEqual(b"", log_reader.read_tail(self.log_fname, before=0)['text'])
+
+    def test_rotate(self):
+        """Verify rotating logs, keeping a number of backups"""
+        for i in range(4):
+            log_reader.rotate_log(self.log_fname, 2)
+            self.assertFalse(os.path.exists(self.log_fname))
+            self.write_log(self.log_fname, b"log %d\n" % i)
+        with open(log_reader.backup_fname(self.log_fname, 1), "rb") as fid:
+            self.assertEqual(b"log 2\n", fid.read())
+        with open(log_reader.backup_fname(self.log_fname, 2), "rb") as fid:
+            self.assertEqual(b"log 1\n", fid.read())
+        self.assertFalse(os.path.exists(log_reader.backup_fname(self.log_fname, 3)))
+        log_reader.rotate_log(self.log_fname, 0)
+        self.assertFalse(os.path.exists(self.log_fname))
+
+if __name__ == "__main__":
+    unittest.main()
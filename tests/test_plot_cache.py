@@ -0,0 +1,90 @@
+"""test_plot_cache.py - tests the plot_cache module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+import time
+from models import plot_cache
+
+class TestPlotCache(unittest.TestCase):
+    """Tests the PlotCache class"""
+
+    SUPPORTFILESPATH = os.path.join(os.path.dirname(__file__), 'support_files')
+    SAMPLEINPUTDATA = os.path.join(SUPPORTFILESPATH, 'sample_data.csv')
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = plot_cache.PlotCache(self.folder, max_bytes=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def make_plot(self, num_bytes=100):
+        """Helper function to create a dummy plot file"""
+        fd, fname = tempfile.mkstemp(dir=self.folder, suffix=".png")
+        with os.fdopen(fd, "wb") as fid:
+            fid.write(b"\0" * num_bytes)
+        return fname
+
+    def test_key(self):
+        """Verify cache keys depend on the data and the render settings"""
+        key = self.cache.key(TestPlotCache.SAMPLEINPUTDATA, cmap='Set1', z_cutoff=-20)
+        self.assertEqual(key, self.cache.key(TestPlotCache.SAMPLEINPUTDATA, z_cutoff=-20, cmap='Set1'))
+        self.assertNotEqual(key, self.cache.key(TestPlotCache.SAMPLEINPUTDATA, cmap='jet', z_cutoff=-20))
+        self.assertNotEqual(key, self.cache.key(TestPlotCache.SAMPLEINPUTDATA, cmap='Set1', z_cutoff=-10))
+
+    def test_file_digest(self):
+        """Verify data file digests are remembered until the file changes"""
+        data_file = os.path.join(self.folder, "data.csv")
+        shutil.copyfile(TestPlotCache.SAMPLEINPUTDATA, data_file)
+        digest = plot_cache.file_digest(data_file)
+        self.assertEqual(plot_cache.hash_file(TestPlotCache.SAMPLEINPUTDATA), digest)
+        original_hash_file = plot_cache.hash_file
+        plot_cache.hash_file = None # a hit doesn't read the file
+        try:
+            self.assertEqual(digest, plot_cache.file_digest(data_file))
+        finally:
+            plot_cache.hash_file = original_hash_file
+        with open(data_file, "ab") as fid:
+            fid.write(b"1,2,3\n")
+        self.assertNotEqual(digest, plot_cache.file_digest(data_file))
+
+    def test_get_put(self):
+        """Verify storing and retrieving plots"""
+        self.assertTrue(self.cache.get("abc", "png") is None)
+        cached_file = self.cache.put("abc", "png", self.make_plot())
+        self.assertEqual(cached_file, self.cache.get("abc", "png"))
+        self.assertTrue(os.path.exists(cached_file))
+        self.assertTrue(self.cache.get("abc", "svg") is None)
+        self.assertEqual("abc", self.cache.key_of(cached_file))
+        self.assertTrue(self.cache.key_of(self.make_plot()) is None)
+        self.assertTrue(self.cache.key_of(os.path.join(self.folder, "other", "plot_abc.png")) is None)
+
+    def test_evict(self):
+        """Verify evicting the least-recently used plots"""
+        first = self.cache.put("first", "png", self.make_plot())
+        second = self.cache.put("second", "png", self.make_plot())
+        old_time = time.time() - 60
+        os.utime(first, (old_time, old_time))
+        os.utime(second, (old_time - 60, old_time - 60))
+        self.cache.get("first", "png") # first is now most recently used
+        self.cache.put("third", "png", self.make_plot())
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(self.cache.get("third", "png") is not None)
+
+    def test_clear(self):
+        """Verify clearing the cache leaves other files alone"""
+        self.cache.put("abc", "png", self.make_plot())
+        other_file = self.make_plot()
+        self.cache.clear()
+        self.assertEqual([], self.cache.entries())
+        self.assertTrue(os.path.exists(other_file))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""test_profiler_supervisor.py - tests the profiler_supervisor module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from models import profiler_supervisor
+
+class TestProfilerSupervisor(unittest.TestCase):
+    """Tests the ProfilerSupervisor class"""
+
+    MOCKSCANNER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mock_scanner', 'gocator_encoder.py')
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.supervisor = profiler_supervisor.ProfilerSupervisor([sys.executable, TestProfilerSupervisor.MOCKSCANNER, "-i"],
+                                                                 os.path.join(self.temp_folder, "output.log"),
+                                                                 os.path.join(self.temp_folder, "errors.log"))
+        self.supervisor.poll_interval = 0.05
+        self.supervisor.restart_delay = 0.05
+
+    def tearDown(self):
+        self.supervisor.stop()
+        shutil.rmtree(self.temp_folder)
+
+    def wait_for(self, condition, timeout=10):
+        """Waits up to timeout seconds for condition() to be True, returns its last value"""
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.05)
+        return condition()
+
+    def test_command_line(self):
+        """Verify commands are single lines of tab-separated fields"""
+        self.assertEqual(b"idle\n", profiler_supervisor.command_line('idle'))
+        self.assertEqual(b"scan\t/tmp/a scan.csv\tline one line two \n",
+                         profiler_supervisor.command_line('scan', "/tmp/a scan.csv", u"line one\nline\ttwo\r"))
+        self.assertRaises(ValueError, self.supervisor.send, 'potato')
+
+    def test_modes(self):
+        """Verify switching one profiler process between modes"""
+        self.assertTrue(self.supervisor.start())
+        pid = self.supervisor.proc.pid
+        self.assertEqual(profiler_supervisor.IDLE, self.supervisor.mode)
+        self.assertTrue(self.supervisor.target())
+        self.assertEqual(profiler_supervisor.TARGET, self.supervisor.mode)
+        output_file = os.path.join(self.temp_folder, "scan.csv")
+        self.assertTrue(self.supervisor.scan(output_file, "Test scan"))
+        self.assertEqual(profiler_supervisor.SCAN, self.supervisor.mode)
+        self.assertTrue(self.supervisor.idle())
+        self.assertEqual(profiler_supervisor.IDLE, self.supervisor.mode)
+        self.assertEqual(pid, self.supervisor.proc.pid)
+        with open(output_file, "rb") as fid:
+            self.assertEqual(b"# Test scan\n", fid.readline())
+        self.supervisor.stop()
+        self.assertFalse(self.supervisor.running)
+        with open(os.path.join(self.temp_folder, "errors.log"), "rb") as fid:
+            self.assertTrue(b"Operation halted by user" in fid.read())
+
+    def test_restart(self):
+        """Verify the profiler is restarted if it dies, resuming targeting"""
+        self.supervisor.start(wait=False)
+        self.assertTrue(self.wait_for(lambda: self.supervisor.running))
+        self.assertTrue(self.supervisor.target())
+        proc = self.supervisor.proc
+        proc.kill()
+        proc.wait()
+        self.assertTrue(self.wait_for(lambda: self.supervisor.running and self.supervisor.mode == profiler_supervisor.TARGET))
+        self.assertIsNot(proc, self.supervisor.proc)
+        self.assertEqual(1, self.supervisor.restarts)
+        self.assertIsNotNone(self.supervisor.last_exit)
+
+    def test_reload(self):
+        """Verify reloading restarts the profiler once it's idle"""
+        self.assertTrue(self.supervisor.start())
+        self.assertTrue(self.supervisor.target())
+        proc = self.supervisor.proc
+        self.supervisor.reload()
+        time.sleep(0.2)
+        self.assertIs(proc, self.supervisor.proc)
+        self.assertTrue(self.supervisor.idle())
+        self.assertTrue(self.wait_for(lambda: self.supervisor.proc is not proc and self.supervisor.running))
+        self.assertFalse(self.supervisor.reload_pending)
+        self.assertEqual(0, self.supervisor.restarts)
+
+    def test_unacknowledged(self):
+        """Verify a profiler that doesn't acknowledge commands is restarted when stopping"""
+        self.supervisor.command = [sys.executable, "-c", "import sys\nfor line in sys.stdin: pass"]
+        self.supervisor.ack_timeout = 0.2
+        self.assertFalse(self.supervisor.start())
+        proc = self.supervisor.proc
+        self.assertTrue(self.supervisor.running)
+        self.assertFalse(self.supervisor.target())
+        self.assertEqual(profiler_supervisor.IDLE, self.supervisor.mode)
+        self.assertFalse(self.supervisor.idle())
+        self.assertIsNot(proc, self.supervisor.proc)
+        self.assertIsNotNone(proc.poll())
+
+    def test_stop_process(self):
+        """Verify terminating a process that doesn't quit"""
+        proc = subprocess.Popen([sys.executable, "-c", "import time\ntime.sleep(60)"])
+        start = time.time()
+        self.assertTrue(profiler_supervisor.stop_process(proc, 0.5))
+        self.assertIsNotNone(proc.poll())
+        self.assertTrue(time.time() - start < 30)
+
+if __name__ == "__main__":
+    unittest.main()
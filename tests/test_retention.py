@@ -0,0 +1,88 @@
+"""test_retention.py - tests the retention module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import threading
+from models import retention
+
+class TestRetentionPolicy(unittest.TestCase):
+    """Tests the RetentionPolicy class"""
+
+    def setUp(self):
+        # Ten 100 byte scans, one created every 10 seconds
+        self.entries = [{'name':"scan{0}.csv".format(i), 'created':1000 + 10 * i, 'size':100, 'pinned':0}
+                        for i in range(10)]
+
+    def test_disabled(self):
+        """Verify nothing is evicted without limits"""
+        policy = retention.RetentionPolicy(0, 0, 0)
+        self.assertFalse(policy.enabled)
+        self.assertEqual([], policy.select(self.entries, now=1e9))
+
+    def test_limits(self):
+        """Verify evicting the oldest scans by size, age and number"""
+        self.assertEqual(["scan0.csv", "scan1.csv", "scan2.csv"],
+                         retention.RetentionPolicy(max_bytes=700).select(self.entries))
+        self.assertEqual(["scan0.csv", "scan1.csv"],
+                         retention.RetentionPolicy(max_age=75).select(self.entries, now=1095))
+        self.assertEqual(["scan0.csv", "scan1.csv", "scan2.csv", "scan3.csv", "scan4.csv"],
+                         retention.RetentionPolicy(max_count=5).select(self.entries))
+        self.assertEqual(["scan0.csv", "scan1.csv", "scan2.csv", "scan3.csv"],
+                         retention.RetentionPolicy(max_bytes=700, max_count=6).select(list(reversed(self.entries))))
+
+    def test_derived_size(self):
+        """Verify the size limit counts the files derived from each scan"""
+        for entry in self.entries:
+            entry['derived_size'] = 2 * entry['size']
+        policy = retention.RetentionPolicy(max_bytes=700)
+        self.assertEqual(["scan{0}.csv".format(i) for i in range(8)], policy.select(self.entries))
+
+    def test_kept(self):
+        """Verify pinned, protected and newest scans are kept"""
+        self.entries[0]['pinned'] = 1
+        policy = retention.RetentionPolicy(max_count=8)
+        self.assertEqual(["scan1.csv", "scan2.csv"], policy.select(self.entries))
+        self.assertEqual(["scan2.csv", "scan3.csv"], policy.select(self.entries, protected=["scan1.csv"]))
+        self.assertEqual([entry['name'] for entry in self.entries[1:9]],
+                         retention.RetentionPolicy(max_bytes=1).select(self.entries))
+
+class TestRetentionSweeper(unittest.TestCase):
+    """Tests the RetentionSweeper class"""
+
+    def test_sweep(self):
+        """Verify sweeping periodically, surviving errors, until stopped"""
+        swept = threading.Event()
+        calls = []
+        def sweep():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError("File in use")
+            swept.set()
+        sweeper = retention.RetentionSweeper(sweep, interval=0.01)
+        sweeper.start()
+        self.assertTrue(swept.wait(5))
+        sweeper.stop()
+        self.assertIsNone(sweeper.thread)
+        num_calls = len(calls)
+        self.assertTrue(num_calls >= 2)
+        swept.clear()
+        self.assertFalse(swept.wait(0.05))
+        self.assertEqual(num_calls, len(calls))
+
+    def test_wake(self):
+        """Verify sweeping as soon as woken, before the interval has passed"""
+        swept = threading.Event()
+        sweeper = retention.RetentionSweeper(swept.set, interval=600)
+        sweeper.start()
+        try:
+            self.assertFalse(swept.wait(0.05))
+            sweeper.wake()
+            self.assertTrue(swept.wait(5))
+        finally:
+            sweeper.stop()
+        self.assertIsNone(sweeper.thread)
+
+if __name__ == "__main__":
+    unittest.main()
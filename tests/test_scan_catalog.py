@@ -0,0 +1,177 @@
+"""test_scan_catalog.py - tests the scan_catalog module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import sqlite3
+import tempfile
+from models import scan_catalog
+
+class TestScanCatalog(unittest.TestCase):
+    """Tests the ScanCatalog class"""
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.catalog = scan_catalog.ScanCatalog(os.path.join(self.temp_folder, "catalog.sqlite"))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.temp_folder)
+
+    def make_scan(self, name, content=b"1,2,3\n"):
+        """Writes a scan file with the specified name and content, returns its path"""
+        path = os.path.join(self.temp_folder, name)
+        with open(path, "wb") as fid:
+            fid.write(content)
+        return path
+
+    def test_add(self):
+        """Verify adding, updating and removing scans"""
+        path = self.make_scan("scan1.csv")
+        self.assertEqual("scan1.csv", self.catalog.add(path, created=100, point_count=1, comment="First scan",
+                                                       config_snapshot="{}"))
+        self.catalog.add(self.make_scan("scan2.csv"), created=200)
+        entry = self.catalog.get("scan1.csv")
+        self.assertEqual(path, entry['path'])
+        self.assertEqual(100, entry['created'])
+        self.assertEqual(os.path.getsize(path), entry['size'])
+        self.assertEqual("First scan", entry['comment'])
+        self.assertEqual(["scan2.csv", "scan1.csv"], self.catalog.names())
+        self.assertEqual(["scan2.csv", "scan1.csv"], [entry['name'] for entry in self.catalog.list()])
+        self.assertTrue(self.catalog.update("scan1.csv", plot_path="plot.png"))
+        self.assertEqual("plot.png", self.catalog.get("scan1.csv")['plot_path'])
+        self.assertFalse(self.catalog.update("potato.csv", plot_path="plot.png"))
+        self.assertRaises(ValueError, self.catalog.update, "scan1.csv", potato=1)
+        self.catalog.remove("scan1.csv")
+        self.assertIsNone(self.catalog.get("scan1.csv"))
+        self.catalog.clear()
+        self.assertEqual([], self.catalog.names())
+
+    def test_query(self):
+        """Verify paging, sorting and filtering scans"""
+        for i in range(10):
+            self.catalog.add(self.make_scan("scan{0}.csv".format(i), b"1,2,3\n" * (i % 4 + 1)),
+                             created=1000 + i, comment="Part {0}".format("A" if i % 2 else "B_%"))
+        self.assertEqual(["scan9.csv", "scan8.csv", "scan7.csv"], [entry['name'] for entry in self.catalog.query(limit=3)])
+        # Page through scans sorted by (non-unique) point count
+        names = []
+        after = None
+        while True:
+            page = self.catalog.query(sort='point_count', descending=False, limit=3, after=after)
+            if not page:
+                break
+            names.extend(entry['name'] for entry in page)
+            after = (page[-1]['point_count'], page[-1]['name'])
+        self.assertEqual(["scan0.csv", "scan4.csv", "scan8.csv", "scan1.csv", "scan5.csv", "scan9.csv",
+                          "scan2.csv", "scan6.csv", "scan3.csv", "scan7.csv"], names)
+        page = self.catalog.query(sort='size', limit=2, after=(18, "scan6.csv"))
+        self.assertEqual(["scan2.csv", "scan9.csv"], [entry['name'] for entry in page])
+        page = self.catalog.query(created_from=1002, created_to=1005)
+        self.assertEqual(["scan4.csv", "scan3.csv", "scan2.csv"], [entry['name'] for entry in page])
+        page = self.catalog.query(comment="b_%")
+        self.assertEqual(["scan8.csv", "scan6.csv", "scan4.csv", "scan2.csv", "scan0.csv"],
+                         [entry['name'] for entry in page])
+        self.assertEqual([], self.catalog.query(comment="B_x"))
+        self.assertRaises(ValueError, self.catalog.query, sort='potato')
+
+    def test_derived_size(self):
+        """Verify storing the size of the files derived from scans"""
+        path = self.make_scan("scan1.csv")
+        self.catalog.add(path, point_count=1)
+        self.assertEqual(0, self.catalog.get("scan1.csv")['derived_size'])
+        with open(os.path.join(self.temp_folder, "scan1.npy"), "wb") as fid:
+            fid.write(b"\0" * 100)
+        self.catalog.add(path, point_count=1)
+        self.assertEqual(100, self.catalog.get("scan1.csv")['derived_size'])
+        self.assertTrue(self.catalog.add_derived("scan1.csv", 50))
+        self.assertEqual(150, self.catalog.get("scan1.csv")['derived_size'])
+        self.assertFalse(self.catalog.add_derived("potato.csv", 50))
+        self.catalog.add(path, point_count=1, derived_size=10)
+        self.assertEqual(10, self.catalog.get("scan1.csv")['derived_size'])
+
+    def test_pin(self):
+        """Verify pinning scans, and adding the pinned column to older catalogs"""
+        self.catalog.add(self.make_scan("scan1.csv"))
+        self.assertFalse(self.catalog.get("scan1.csv")['pinned'])
+        self.assertTrue(self.catalog.pin("scan1.csv"))
+        self.assertTrue(self.catalog.get("scan1.csv")['pinned'])
+        self.assertTrue(self.catalog.pin("scan1.csv", False))
+        self.assertFalse(self.catalog.get("scan1.csv")['pinned'])
+        self.assertFalse(self.catalog.pin("potato.csv"))
+        self.catalog.close()
+        db_fname = os.path.join(self.temp_folder, "old_catalog.sqlite")
+        connection = sqlite3.connect(db_fname)
+        with connection:
+            connection.execute("CREATE TABLE scans (name TEXT PRIMARY KEY, path TEXT NOT NULL, created REAL NOT NULL, "
+                               "modified REAL NOT NULL, size INTEGER NOT NULL, point_count INTEGER NOT NULL, "
+                               "comment TEXT, plot_path TEXT, config_snapshot TEXT)")
+            connection.execute("INSERT INTO scans VALUES ('old.csv', 'old.csv', 1, 1, 1, 1, NULL, NULL, NULL)")
+        connection.close()
+        self.catalog = scan_catalog.ScanCatalog(db_fname)
+        self.assertFalse(self.catalog.get("old.csv")['pinned'])
+        self.assertEqual(0, self.catalog.get("old.csv")['derived_size'])
+        self.assertIsNone(self.catalog.get("old.csv")['plot_key'])
+        self.assertTrue(self.catalog.pin("old.csv"))
+
+    def test_migrate(self):
+        """Verify counting the points and rebuilding the paging indexes of older catalogs"""
+        self.catalog.close()
+        db_fname = os.path.join(self.temp_folder, "old_catalog.sqlite")
+        connection = sqlite3.connect(db_fname)
+        with connection:
+            connection.execute("CREATE TABLE scans (name TEXT PRIMARY KEY, path TEXT NOT NULL, created REAL NOT NULL, "
+                               "modified REAL NOT NULL, size INTEGER NOT NULL, point_count INTEGER, "
+                               "comment TEXT, plot_path TEXT, config_snapshot TEXT)")
+            connection.execute("CREATE INDEX scans_created ON scans (created)")
+            connection.execute("CREATE INDEX scans_modified ON scans (modified)")
+            connection.execute("INSERT INTO scans VALUES (?, ?, 1, 1, 12, NULL, NULL, NULL, NULL)",
+                               ("counted.csv", self.make_scan("counted.csv", b"1,2,3\n4,5,6\n")))
+            connection.execute("INSERT INTO scans VALUES (?, ?, 2, 2, 6, NULL, NULL, NULL, NULL)",
+                               ("gone.csv", os.path.join(self.temp_folder, "gone.csv")))
+            connection.execute("INSERT INTO scans VALUES (?, ?, 3, 3, 6, 1, NULL, ?, NULL)",
+                               ("plotted.csv", self.make_scan("plotted.csv"), "/img/plot_abc.png"))
+            connection.execute("INSERT INTO scans VALUES (?, ?, 4, 4, 6, 1, NULL, ?, NULL)",
+                               ("own_plot.csv", self.make_scan("own_plot.csv"), "/img/tmp123.png"))
+        connection.close()
+        self.catalog = scan_catalog.ScanCatalog(db_fname)
+        self.assertEqual(2, self.catalog.get("counted.csv")['point_count'])
+        self.assertIsNone(self.catalog.get("gone.csv"))
+        # Plots in the plot cache are stored by key, as they may be evicted
+        entry = self.catalog.get("plotted.csv")
+        self.assertEqual(("abc", None), (entry['plot_key'], entry['plot_path']))
+        entry = self.catalog.get("own_plot.csv")
+        self.assertEqual((None, "/img/tmp123.png"), (entry['plot_key'], entry['plot_path']))
+        self.assertEqual(["counted.csv"], [entry['name'] for entry in self.catalog.query('point_count', limit=1)])
+        for column in scan_catalog.SORT_COLUMNS:
+            index_columns = [row[2] for row in self.catalog.connection.execute(
+                "PRAGMA index_info(scans_{0})".format(column))]
+            self.assertEqual([column, 'name'], index_columns)
+
+    def test_persistence(self):
+        """Verify the catalog persists"""
+        self.catalog.add(self.make_scan("scan1.csv"))
+        self.catalog.close()
+        self.catalog = scan_catalog.ScanCatalog(os.path.join(self.temp_folder, "catalog.sqlite"))
+        self.assertEqual(["scan1.csv"], self.catalog.names())
+
+    def test_reconcile(self):
+        """Verify bringing the catalog up to date with the data folder"""
+        self.catalog.add(self.make_scan("scan1.csv"), comment="Kept")
+        self.catalog.add(self.make_scan("scan2.csv"))
+        os.remove(os.path.join(self.temp_folder, "scan2.csv"))
+        self.make_scan("scan3.csv")
+        self.make_scan("notes.txt")
+        self.make_scan("scan1.csv", b"1,2,3\n4,5,6\n")
+        self.assertEqual((1, 1, 1), self.catalog.reconcile(self.temp_folder))
+        self.assertEqual(["scan1.csv", "scan3.csv"], sorted(self.catalog.names()))
+        entry = self.catalog.get("scan1.csv")
+        self.assertEqual(12, entry['size'])
+        self.assertEqual("Kept", entry['comment'])
+        self.assertEqual((0, 0, 0), self.catalog.reconcile(self.temp_folder))
+
+if __name__ == "__main__":
+    unittest.main()
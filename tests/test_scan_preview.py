@@ -0,0 +1,60 @@
+"""test_scan_preview.py - tests the scan_preview module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+import numpy as np
+from models import scan_preview
+from models.heightmap import Heightmap
+
+class TestScanPreview(unittest.TestCase):
+    """Tests previewing a scan in progress"""
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.image_file = os.path.join(self.temp_folder, "preview.png")
+        # 10x20 grid of points on 0.5 x 0.1 spacing, Z = row number, one invalid point per row
+        self.lines = []
+        for row in range(10):
+            for col in range(20):
+                z = row if col > 0 else -30
+                self.lines.append("{0},{1},{2}\n".format(col * 0.5, row * 0.1, z).encode('ascii'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def test_add_text(self):
+        """Verify the preview matches a heightmap of the entire scan when updated a few lines at a time"""
+        preview = scan_preview.ScanPreview(self.image_file)
+        for start in range(0, len(self.lines), 7):
+            preview.add_text(b"".join(self.lines[start:start + 7]))
+        self.assertEqual(10 * 19, preview.heightmap.num_points)
+        points = np.array([[float(value) for value in line.split(b",")] for line in self.lines])
+        points = points[points[:, 2] > -20]
+        expected = Heightmap()
+        expected.add(points[:, 0], points[:, 1], points[:, 2])
+        for expected_values, values in zip(expected.points(), preview.heightmap.points()):
+            self.assertTrue(np.allclose(expected_values, values))
+
+    def test_render(self):
+        """Verify the preview image is only written when new points are added"""
+        preview = scan_preview.ScanPreview(self.image_file)
+        self.assertFalse(preview.render())
+        self.assertFalse(os.path.exists(self.image_file))
+        preview.add_text(b"".join(self.lines[:100]))
+        self.assertTrue(preview.render())
+        self.assertTrue(os.path.exists(self.image_file))
+        self.assertEqual(1, preview.version)
+        self.assertFalse(preview.render())
+        preview.add_text(b"".join(self.lines[100:]))
+        self.assertTrue(preview.render())
+        self.assertEqual(2, preview.version)
+        self.assertEqual(["preview.png"], os.listdir(self.temp_folder))
+
+if __name__ == "__main__":
+    unittest.main()
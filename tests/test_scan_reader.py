@@ -0,0 +1,172 @@
+"""test_scan_reader.py - tests the scan_reader module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import gzip
+import os
+import os.path
+import shutil
+import numpy as np
+from models import scan_reader
+
+class TestScanReader(unittest.TestCase):
+    """Tests reading Gocator scan files"""
+
+    SUPPORTFILESPATH = os.path.join(os.path.dirname(__file__), 'support_files')
+    SAMPLEINPUTDATA = os.path.join(SUPPORTFILESPATH, 'sample_data.csv')
+    OUTPUTPATH = os.path.join(SUPPORTFILESPATH, 'sample_malformed.csv')
+
+    SIDECARINPUTDATA = os.path.join(SUPPORTFILESPATH, 'sample_sidecar.csv')
+
+    def tearDown(self):
+        for fname in [TestScanReader.OUTPUTPATH, TestScanReader.SIDECARINPUTDATA,
+                      TestScanReader.SIDECARINPUTDATA + scan_reader.COMPRESSED_EXTENSION,
+                      scan_reader.sidecar_fname(TestScanReader.SIDECARINPUTDATA),
+                      scan_reader.metadata_fname(TestScanReader.SIDECARINPUTDATA)]:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def test_read_scan(self):
+        """Verify reading a scan returns the same values as np.genfromtxt"""
+        expected = np.genfromtxt(TestScanReader.SAMPLEINPUTDATA, delimiter=",", unpack=True)
+        returned = scan_reader.read_scan(TestScanReader.SAMPLEINPUTDATA)
+        for expected_col, returned_col in zip(expected, returned):
+            self.assertEqual(returned_col.dtype, np.float64)
+            self.assertTrue(np.array_equal(expected_col, returned_col))
+
+    def test_read_chunks(self):
+        """Verify small chunks split on line boundaries"""
+        expected = np.genfromtxt(TestScanReader.SAMPLEINPUTDATA, delimiter=",")
+        chunks = list(scan_reader.read_chunks(TestScanReader.SAMPLEINPUTDATA, chunk_size=1000))
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(np.array_equal(expected, np.concatenate(chunks)))
+
+    def test_read_malformed(self):
+        """Verify falling back to np.genfromtxt when values are missing"""
+        with open(TestScanReader.OUTPUTPATH, "w") as fid:
+            fid.write("# Malformed scan\n1.0,2.0,3.0\n4.0,,6.0\n")
+        x, y, z = scan_reader.read_scan(TestScanReader.OUTPUTPATH)
+        self.assertTrue(np.array_equal(x, [1.0, 4.0]))
+        self.assertTrue(np.isnan(y[1]))
+        self.assertTrue(np.array_equal(z, [3.0, 6.0]))
+
+    def test_sidecar(self):
+        """Verify writing and memory-mapping a binary copy of a scan"""
+        shutil.copyfile(TestScanReader.SAMPLEINPUTDATA, TestScanReader.SIDECARINPUTDATA)
+        self.assertFalse(scan_reader.has_sidecar(TestScanReader.SIDECARINPUTDATA))
+        sidecar_file = scan_reader.write_sidecar(TestScanReader.SIDECARINPUTDATA)
+        self.assertEqual(scan_reader.sidecar_fname(TestScanReader.SIDECARINPUTDATA), sidecar_file)
+        self.assertTrue(scan_reader.has_sidecar(TestScanReader.SIDECARINPUTDATA))
+        expected = scan_reader.read_scan(TestScanReader.SIDECARINPUTDATA)
+        returned = scan_reader.load_scan(TestScanReader.SIDECARINPUTDATA)
+        for expected_col, returned_col in zip(expected, returned):
+            self.assertTrue(isinstance(returned_col.base, np.memmap))
+            self.assertTrue(np.allclose(expected_col, returned_col, atol=1e-5))
+        # Fixed length header, no temporary files left behind
+        self.assertEqual(scan_reader.SIDECAR_HEADER_BYTES + expected[0].size * scan_reader.SIDECAR_BYTES_PER_POINT,
+                         os.path.getsize(sidecar_file))
+        self.assertFalse(os.path.exists(sidecar_file + ".tmp"))
+
+    def test_count_points(self):
+        """Verify counting the points in a scan with and without a sidecar"""
+        x, y, z = scan_reader.read_scan(TestScanReader.SAMPLEINPUTDATA)
+        shutil.copyfile(TestScanReader.SAMPLEINPUTDATA, TestScanReader.SIDECARINPUTDATA)
+        self.assertEqual(x.size, scan_reader.count_points(TestScanReader.SIDECARINPUTDATA))
+        scan_reader.write_sidecar(TestScanReader.SIDECARINPUTDATA)
+        self.assertEqual(x.size, scan_reader.count_points(TestScanReader.SIDECARINPUTDATA))
+
+    def test_iter_scan(self):
+        """Verify reading a scan in fixed-size blocks"""
+        expected = scan_reader.read_scan(TestScanReader.SAMPLEINPUTDATA)
+        blocks = list(scan_reader.iter_scan(TestScanReader.SAMPLEINPUTDATA, block_size=1000))
+        self.assertTrue(all(block[0].size <= 1000 for block in blocks))
+        for idx, expected_col in enumerate(expected):
+            self.assertTrue(np.array_equal(expected_col, np.concatenate([block[idx] for block in blocks])))
+
+    def test_scan_statistics(self):
+        """Verify computing a scan's statistics in a single pass"""
+        x, y, z = scan_reader.read_scan(TestScanReader.SAMPLEINPUTDATA)
+        valid = z > scan_reader.VALID_Z_THRESHOLD
+        stats = scan_reader.scan_statistics(TestScanReader.SAMPLEINPUTDATA, block_size=1000)
+        self.assertEqual(x.size, stats['num_points'])
+        self.assertEqual(np.count_nonzero(valid), stats['num_valid'])
+        for col, (col_min, col_max) in zip((x, y, z), stats['bounds']):
+            self.assertEqual(np.min(col[valid]), col_min)
+            self.assertEqual(np.max(col[valid]), col_max)
+
+    def test_metadata(self):
+        """Verify writing and reading a scan's metadata, with statistics computed during conversion"""
+        shutil.copyfile(TestScanReader.SAMPLEINPUTDATA, TestScanReader.SIDECARINPUTDATA)
+        self.assertIsNone(scan_reader.read_metadata(TestScanReader.SIDECARINPUTDATA))
+        stats = scan_reader.new_statistics()
+        scan_reader.write_sidecar(TestScanReader.SIDECARINPUTDATA, block_size=1000, stats=stats)
+        expected = scan_reader.scan_statistics(TestScanReader.SAMPLEINPUTDATA)
+        self.assertEqual(expected, stats)
+        scan_reader.write_metadata(TestScanReader.SIDECARINPUTDATA, stats, comments="Test scan", duration=1.5)
+        metadata = scan_reader.read_metadata(TestScanReader.SIDECARINPUTDATA)
+        self.assertEqual("Test scan", metadata['comments'])
+        self.assertEqual(1.5, metadata['duration'])
+        self.assertEqual(expected['num_points'], metadata['num_points'])
+        self.assertAlmostEqual(float(expected['num_valid']) / expected['num_points'], metadata['valid_fraction'])
+        self.assertEqual([list(bounds) for bounds in expected['bounds']], metadata['bounds'])
+        # Metadata is ignored once the scan changes
+        metadata_file = scan_reader.metadata_fname(TestScanReader.SIDECARINPUTDATA)
+        os.utime(metadata_file, (0, os.path.getmtime(TestScanReader.SIDECARINPUTDATA) - 10))
+        self.assertIsNone(scan_reader.read_metadata(TestScanReader.SIDECARINPUTDATA))
+        metadata = scan_reader.write_metadata(TestScanReader.SIDECARINPUTDATA)
+        self.assertEqual(expected['num_points'], metadata['num_points'])
+        self.assertIsNotNone(scan_reader.read_metadata(TestScanReader.SIDECARINPUTDATA))
+
+    def test_compress_scan(self):
+        """Verify compressed scans are read transparently"""
+        shutil.copyfile(TestScanReader.SAMPLEINPUTDATA, TestScanReader.SIDECARINPUTDATA)
+        scan_reader.write_sidecar(TestScanReader.SIDECARINPUTDATA)
+        mtime = os.path.getmtime(TestScanReader.SIDECARINPUTDATA)
+        self.assertRaises(ValueError, scan_reader.compress_scan, TestScanReader.SIDECARINPUTDATA, 'potato')
+        compressed_file = scan_reader.compress_scan(TestScanReader.SIDECARINPUTDATA)
+        self.assertEqual(TestScanReader.SIDECARINPUTDATA + scan_reader.COMPRESSED_EXTENSION, compressed_file)
+        self.assertFalse(os.path.exists(TestScanReader.SIDECARINPUTDATA))
+        self.assertEqual(compressed_file, scan_reader.stored_fname(TestScanReader.SIDECARINPUTDATA))
+        self.assertTrue(scan_reader.is_compressed(compressed_file))
+        self.assertEqual(TestScanReader.SIDECARINPUTDATA, scan_reader.uncompressed_fname(compressed_file))
+        self.assertEqual(int(mtime), int(os.path.getmtime(compressed_file)))
+        # Derived files are shared with the uncompressed scan
+        self.assertEqual(scan_reader.sidecar_fname(TestScanReader.SIDECARINPUTDATA),
+                         scan_reader.sidecar_fname(compressed_file))
+        self.assertTrue(scan_reader.has_sidecar(compressed_file))
+        with open(TestScanReader.SAMPLEINPUTDATA, "rb") as fid:
+            original = fid.read()
+        with gzip.open(compressed_file, "rb") as fid:
+            self.assertEqual(original, fid.read())
+        with scan_reader.open_scan(compressed_file) as fid:
+            self.assertEqual(original, fid.read())
+        expected = scan_reader.read_scan(TestScanReader.SAMPLEINPUTDATA)
+        for expected_col, col in zip(expected, scan_reader.read_scan(compressed_file)):
+            self.assertTrue(np.array_equal(expected_col, col))
+        os.remove(scan_reader.sidecar_fname(compressed_file))
+        self.assertEqual(scan_reader.count_points(TestScanReader.SAMPLEINPUTDATA),
+                         scan_reader.count_points(compressed_file))
+        with open(compressed_file, "rb") as fid:
+            member = scan_reader.gzip_member(fid)
+        self.assertEqual(len(original), member['size'])
+        self.assertEqual(os.path.getsize(compressed_file) - 8, member['offset'] + member['compress_size'])
+
+    def test_compress_removed_scan(self):
+        """Verify no compressed copy is left of a scan removed while being compressed"""
+        compressed_file = TestScanReader.SIDECARINPUTDATA + scan_reader.COMPRESSED_EXTENSION
+        shutil.copyfile(TestScanReader.SAMPLEINPUTDATA, TestScanReader.SIDECARINPUTDATA)
+        self.assertIsNone(scan_reader.compress_scan(TestScanReader.SIDECARINPUTDATA, keep_fn=lambda: False))
+        self.assertTrue(os.path.exists(TestScanReader.SIDECARINPUTDATA))
+        self.assertFalse(os.path.exists(compressed_file))
+        self.assertFalse(os.path.exists(compressed_file + ".tmp"))
+        # Removed once the copy has been put in place
+        def remove_scan():
+            os.remove(TestScanReader.SIDECARINPUTDATA)
+            return True
+        self.assertIsNone(scan_reader.compress_scan(TestScanReader.SIDECARINPUTDATA, keep_fn=remove_scan))
+        self.assertFalse(os.path.exists(compressed_file))
+
+if __name__ == "__main__":
+    unittest.main()
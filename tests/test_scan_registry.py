@@ -0,0 +1,92 @@
+"""test_scan_registry.py - tests the scan_registry module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import threading
+from models import scan_registry
+
+class TestScanRegistry(unittest.TestCase):
+    """Tests the ScanRegistry class"""
+
+    def setUp(self):
+        self.registry = scan_registry.ScanRegistry()
+
+    def test_begin(self):
+        """Verify only one scan can use the scanner at a time"""
+        record = self.registry.begin("alice", data_path="scan.csv", comments="First scan")
+        self.assertEqual('starting', record.state)
+        self.assertEqual("alice", record.owner)
+        self.assertTrue(self.registry.begin("bob") is None)
+        self.assertTrue(self.registry.active() is record)
+        self.registry.update(record.scan_id, state='failed')
+        self.assertTrue(self.registry.active() is None)
+        self.assertTrue(self.registry.begin("bob") is not None)
+
+    def test_claim(self):
+        """Verify only the owner (or a forced claim) can stop a scan"""
+        record = self.registry.begin("alice")
+        self.registry.update(record.scan_id, state='scanning')
+        self.assertTrue(self.registry.claim(record.scan_id, "bob") is None)
+        self.assertTrue(self.registry.claim(record.scan_id, "alice") is record)
+        self.assertEqual('stopping', record.state)
+        # Already being stopped
+        self.assertTrue(self.registry.claim(record.scan_id, "alice") is None)
+        self.assertTrue(self.registry.claim("potato", "alice") is None)
+        self.assertTrue(self.registry.begin("alice") is None)
+
+    def test_forced_claim(self):
+        """Verify forcing a claim on another owner's scan"""
+        record = self.registry.begin("alice")
+        self.assertTrue(self.registry.claim(record.scan_id, "bob", force=True) is record)
+
+    def test_update(self):
+        """Verify finishing a scan records its results"""
+        record = self.registry.begin("alice")
+        self.registry.update(record.scan_id, state='stopped', num_points=42)
+        status = self.registry.get(record.scan_id).as_dict()
+        self.assertEqual('stopped', status['state'])
+        self.assertEqual(42, status['num_points'])
+        self.assertTrue(status['stopped'] is not None)
+        self.assertTrue(status['duration'] >= 0)
+
+    def test_concurrent_begin(self):
+        """Verify concurrent clients can't both start the scanner"""
+        started = []
+        def begin(owner):
+            record = self.registry.begin(owner)
+            if record is not None:
+                started.append(record)
+        threads = [threading.Thread(target=begin, args=("client{0}".format(i),)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(started))
+
+    def test_devices(self):
+        """Verify each device can be used by one scan at a time, independently of the others"""
+        first = self.registry.begin("alice", device_id="head1")
+        second = self.registry.begin("bob", mode='target', device_id="head2")
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertEqual("head2", second.as_dict()['device'])
+        self.assertIsNone(self.registry.begin("bob", device_id="head1"))
+        self.assertIs(first, self.registry.active("head1"))
+        self.assertIs(second, self.registry.active("head2"))
+        self.assertIsNone(self.registry.active())
+        self.assertEqual(set([first, second]), set(self.registry.active_scans()))
+        self.registry.update(first.scan_id, state='stopped')
+        self.assertEqual([second], self.registry.active_scans())
+        self.assertIsNotNone(self.registry.begin("bob", device_id="head1"))
+
+    def test_prune(self):
+        """Verify old finished scans are forgotten"""
+        for i in range(scan_registry.MAX_FINISHED_SCANS + 10):
+            record = self.registry.begin("alice")
+            self.registry.update(record.scan_id, state='stopped')
+        self.assertEqual(scan_registry.MAX_FINISHED_SCANS, len(self.registry.list()))
+
+if __name__ == "__main__":
+    unittest.main()
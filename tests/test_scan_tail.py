@@ -0,0 +1,47 @@
+"""test_scan_tail.py - tests the scan_tail module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import tempfile
+from models import scan_tail
+
+class TestScanTail(unittest.TestCase):
+    """Tests the ScanTail class"""
+
+    def setUp(self):
+        fd, self.data_file = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        self.tail = scan_tail.ScanTail(self.data_file)
+
+    def tearDown(self):
+        os.remove(self.data_file)
+
+    def append(self, text):
+        """Appends the specified text to the data file"""
+        with open(self.data_file, "ab") as fid:
+            fid.write(text)
+
+    def test_poll(self):
+        """Verify only complete new data lines are returned"""
+        self.assertEqual(b"", self.tail.poll())
+        self.append(b"# Comment\n1.0,2.0,3.0\n4.0,5")
+        self.assertEqual(b"1.0,2.0,3.0\n", self.tail.poll())
+        self.assertEqual(1, self.tail.num_rows)
+        self.assertEqual(b"", self.tail.poll())
+        self.append(b".0,6.0\n7.0,8.0,9.0\n")
+        self.assertEqual(b"4.0,5.0,6.0\n7.0,8.0,9.0\n", self.tail.poll())
+        self.assertEqual(3, self.tail.num_rows)
+        self.assertEqual(os.path.getsize(self.data_file), self.tail.num_bytes)
+
+    def test_missing_file(self):
+        """Verify polling a file that hasn't been created yet"""
+        tail = scan_tail.ScanTail(self.data_file + ".missing")
+        self.assertEqual(b"", tail.poll())
+        self.assertEqual(0, tail.num_rows)
+
+if __name__ == "__main__":
+    unittest.main()
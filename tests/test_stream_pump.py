@@ -0,0 +1,70 @@
+"""test_stream_pump.py - tests the stream_pump module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+from models import stream_pump
+
+class TestStreamPump(unittest.TestCase):
+    """Tests the StreamPump class"""
+
+    def setUp(self):
+        fd, self.log_fname = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.log_fname)
+
+    def test_pump(self):
+        """Verify draining more output than fits in a pipe buffer"""
+        num_lines = 20000 # ~ 300 KB, well beyond the usual 64 KB pipe buffer
+        proc = subprocess.Popen([sys.executable, "-c",
+                                 "import sys\nfor i in range({0}): sys.stdout.write('line %d\\n' % i)".format(num_lines)],
+                                stdout=subprocess.PIPE)
+        pump = stream_pump.StreamPump(proc.stdout, self.log_fname, max_lines=100)
+        pump.start()
+        proc.wait()
+        pump.join(10)
+        self.assertFalse(pump.is_alive())
+        self.assertEqual(num_lines, pump.num_lines)
+        recent = pump.recent()
+        self.assertEqual(100, len(recent))
+        self.assertEqual((num_lines, "line {0}\n".format(num_lines - 1).encode('ascii')), recent[-1])
+        self.assertEqual(10, len(pump.recent(since=num_lines - 10)))
+        with open(self.log_fname, "rb") as fid:
+            self.assertEqual(num_lines, len(fid.readlines()))
+
+    def test_rotate(self):
+        """Verify rotating the log file once it reaches its maximum size"""
+        num_lines = 1000
+        proc = subprocess.Popen([sys.executable, "-c",
+                                 "import sys\nfor i in range({0}): sys.stdout.write('line %04d\\n' % i)".format(num_lines)],
+                                stdout=subprocess.PIPE)
+        pump = stream_pump.StreamPump(proc.stdout, self.log_fname, max_log_bytes=1000, log_backups=2)
+        pump.start()
+        proc.wait()
+        pump.join(10)
+        backups = ["{0}.{1}".format(self.log_fname, backup) for backup in (1, 2)]
+        try:
+            logs = []
+            for fname in reversed([self.log_fname] + backups):
+                self.assertTrue(os.path.getsize(fname) <= 1000)
+                with open(fname, "rb") as fid:
+                    logs.append(fid.read())
+            # Whole lines are kept together
+            self.assertEqual(["line {0:04d}\n".format(i).encode('ascii') for i in range(num_lines - 300, num_lines)],
+                             b"".join(logs).splitlines(True))
+            self.assertFalse(os.path.exists("{0}.3".format(self.log_fname)))
+        finally:
+            for fname in backups:
+                if os.path.exists(fname):
+                    os.remove(fname)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""test_tiles.py - tests the tiles module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+import numpy as np
+from models import tiles
+
+class TestTiles(unittest.TestCase):
+    """Tests building Deep Zoom tile pyramids"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.grid_count = np.ones((300, 600))
+        self.grid_count[:, :10] = 0 # empty columns
+        self.grid_sum = np.arange(self.grid_count.size, dtype=np.float64).reshape(self.grid_count.shape)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_iter_levels(self):
+        """Verify each level halves the size of the level above it"""
+        self.assertEqual(11, tiles.num_levels((300, 600))) # ceil(log2(600)) + 1
+        self.assertEqual(10, tiles.num_levels((512, 3)))
+        self.assertEqual(1, tiles.num_levels((1, 1)))
+        numbered_levels = list(tiles.iter_levels(self.grid_sum, self.grid_count))
+        self.assertEqual(list(range(10, -1, -1)), [level for level, image in numbered_levels])
+        levels = [image for level, image in reversed(numbered_levels)]
+        self.assertTrue(all(image.dtype == np.float32 for image in levels))
+        self.assertEqual((1, 1), levels[0].shape)
+        self.assertEqual((300, 600), levels[-1].shape)
+        self.assertEqual((150, 300), levels[-2].shape)
+        self.assertEqual((38, 75), levels[-4].shape)
+        self.assertTrue(np.isnan(levels[-1][0, 0]))
+        self.assertTrue(np.isnan(levels[-2][0, 0]))
+        self.assertAlmostEqual(np.mean(self.grid_sum[:2, 10:12]), levels[-2][0, 5], places=2)
+        self.assertAlmostEqual(np.mean(self.grid_sum[298:, 598:]), levels[-2][149, 299], places=2)
+
+    def test_halve(self):
+        """Verify summing 2x2 blocks, including the partial blocks at odd edges"""
+        grid = np.arange(15).reshape(3, 5)
+        self.assertTrue(np.array_equal([[0 + 1 + 5 + 6, 2 + 3 + 7 + 8, 4 + 9], [10 + 11, 12 + 13, 14]],
+                                       tiles.halve(grid)))
+
+    def test_build_pyramid(self):
+        """Verify writing the tiles and descriptor"""
+        output_folder = os.path.join(self.folder, "scan")
+        self.assertIsNone(tiles.current_version(output_folder))
+        dzi_file = tiles.build_pyramid(self.grid_sum, self.grid_count, output_folder, "scan", tile_size=256)
+        version = tiles.current_version(output_folder)
+        self.assertEqual(os.path.join(output_folder, version, "scan.dzi"), dzi_file)
+        with open(dzi_file) as fid:
+            descriptor = fid.read()
+        self.assertTrue('Width="600"' in descriptor and 'Height="300"' in descriptor)
+        tiles_folder = os.path.join(output_folder, version, "scan_files")
+        self.assertEqual(11, len(os.listdir(tiles_folder)))
+        self.assertEqual(["0_0.png"], os.listdir(os.path.join(tiles_folder, "0")))
+        self.assertEqual(6, len(os.listdir(os.path.join(tiles_folder, "10")))) # 3 columns x 2 rows
+        self.assertEqual(["scan"], os.listdir(self.folder)) # no temporary folders left behind
+
+    def test_rebuild_pyramid(self):
+        """Verify rebuilding a pyramid publishes a new version instead of changing the old one"""
+        output_folder = os.path.join(self.folder, "scan")
+        first_dzi = tiles.build_pyramid(self.grid_sum, self.grid_count, output_folder, "scan")
+        second_dzi = tiles.build_pyramid(self.grid_sum, self.grid_count, output_folder, "scan")
+        self.assertNotEqual(first_dzi, second_dzi)
+        self.assertTrue(os.path.exists(second_dzi))
+        self.assertFalse(os.path.exists(first_dzi))
+        self.assertEqual([tiles.current_version(output_folder)], tiles.pyramid_versions(output_folder))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""test_zip_cache.py - tests the zip_cache module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import io
+import os
+import os.path
+import shutil
+import tempfile
+import zipfile
+from models import zip_cache
+from models import zip_stream
+
+class TestZipCache(unittest.TestCase):
+    """Tests caching compressed ZIP members"""
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        self.cache_folder = os.path.join(self.temp_folder, ".zipcache")
+        self.files = []
+        for i in range(3):
+            file_path = os.path.join(self.temp_folder, "scan{0}.csv".format(i))
+            with open(file_path, "wb") as fid:
+                fid.write(b"".join(b"%d,%d,%d\n" % (i, j, j * i) for j in range(5000)))
+            self.files.append((file_path, os.path.basename(file_path)))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def archive(self, cache):
+        """Returns a ZipFile of the test files produced with the specified cache"""
+        return zipfile.ZipFile(io.BytesIO(b"".join(zip_stream.ZipStream(cache=cache).stream(self.files))))
+
+    def check_archive(self, archive_zip):
+        """Verifies the archive contains the test files"""
+        self.assertIsNone(archive_zip.testzip())
+        for file_path, arcname in self.files:
+            with open(file_path, "rb") as fid:
+                self.assertEqual(fid.read(), archive_zip.read(arcname))
+
+    def test_reuse(self):
+        """Verify unchanged files are copied from the cache and changed files are compressed again"""
+        cache = zip_cache.ZipCache(self.cache_folder)
+        self.check_archive(self.archive(cache))
+        for file_path, arcname in self.files:
+            self.assertIsNotNone(cache.get(file_path, os.stat(file_path)))
+        # Cached members don't need data descriptors
+        archive_zip = self.archive(cache)
+        self.check_archive(archive_zip)
+        self.assertEqual(0, archive_zip.getinfo("scan0.csv").flag_bits & zip_stream.FLAG_DATA_DESCRIPTOR)
+        # Manifest persists
+        cache = zip_cache.ZipCache(self.cache_folder)
+        self.assertEqual(len(self.files), len(cache.manifest))
+        changed_file = self.files[1][0]
+        with open(changed_file, "ab") as fid:
+            fid.write(b"1,2,3\n")
+        self.assertIsNone(cache.get(changed_file, os.stat(changed_file)))
+        archive_zip = self.archive(cache)
+        self.check_archive(archive_zip)
+        self.assertIsNotNone(cache.get(changed_file, os.stat(changed_file)))
+
+    def test_prune(self):
+        """Verify removing the cached members of removed files"""
+        cache = zip_cache.ZipCache(self.cache_folder)
+        self.archive(cache)
+        cache.prune([file_path for file_path, arcname in self.files[1:]])
+        self.assertFalse(self.files[0][0] in cache.manifest)
+        self.assertFalse(os.path.exists(cache.member_fname(self.files[0][0])))
+        self.assertEqual(len(self.files) - 1, len(zip_cache.ZipCache(self.cache_folder).manifest))
+        cache.clear()
+        self.assertFalse(os.path.exists(self.cache_folder))
+        self.check_archive(self.archive(cache))
+
+    def test_remove(self):
+        """Verify removing the cached member of a file"""
+        cache = zip_cache.ZipCache(self.cache_folder)
+        self.archive(cache)
+        file_path = self.files[0][0]
+        cache.remove(file_path)
+        self.assertFalse(file_path in cache.manifest)
+        self.assertFalse(os.path.exists(cache.member_fname(file_path)))
+        self.assertFalse(file_path in zip_cache.ZipCache(self.cache_folder).manifest)
+        cache.remove(file_path)
+        self.assertEqual(len(self.files) - 1, len(cache.manifest))
+
+    def test_abandoned(self):
+        """Verify partially compressed members aren't cached"""
+        cache = zip_cache.ZipCache(self.cache_folder)
+        stream = zip_stream.ZipStream(cache=cache, chunk_size=1024).stream(self.files)
+        next(stream)
+        next(stream)
+        stream.close()
+        self.assertEqual({}, cache.manifest)
+        self.assertEqual([], os.listdir(self.cache_folder))
+
+if __name__ == "__main__":
+    unittest.main()
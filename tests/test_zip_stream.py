@@ -0,0 +1,80 @@
+"""test_zip_stream.py - tests the zip_stream module
+
+Chris R. Coughlin (TRI/Austin, Inc.)
+"""
+
+import unittest
+import io
+import os
+import os.path
+import random
+import shutil
+import tempfile
+import zipfile
+from models import scan_reader
+from models import zip_stream
+
+class TestZipStream(unittest.TestCase):
+    """Tests generating ZIP archives on the fly"""
+
+    def setUp(self):
+        self.temp_folder = tempfile.mkdtemp()
+        random.seed()
+        self.contents = {'empty.csv':b"",
+                         'text.csv':b"".join(b"%d,%d,%f\n" % (i, i * 2, random.random()) for i in range(20000)),
+                         'random.bin':bytearray(random.randint(0, 255) for i in range(100000))}
+        self.files = []
+        for name, content in sorted(self.contents.items()):
+            file_path = os.path.join(self.temp_folder, name)
+            with open(file_path, "wb") as fid:
+                fid.write(content)
+            self.files.append((file_path, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_folder)
+
+    def check_archive(self, archive):
+        """Verifies the archive contains the test files"""
+        with zipfile.ZipFile(io.BytesIO(archive)) as archive_zip:
+            self.assertIsNone(archive_zip.testzip())
+            self.assertEqual(sorted(self.contents), sorted(archive_zip.namelist()))
+            for name, content in self.contents.items():
+                self.assertEqual(bytes(content), archive_zip.read(name))
+                self.assertEqual(zipfile.ZIP_DEFLATED, archive_zip.getinfo(name).compress_type)
+
+    def test_stream(self):
+        """Verify generating an archive"""
+        stream = zip_stream.ZipStream(chunk_size=4096)
+        chunks = list(stream.stream(self.files))
+        self.assertTrue(len(chunks) > len(self.files))
+        archive = b"".join(chunks)
+        self.assertEqual(len(archive), stream.offset)
+        self.check_archive(archive)
+
+    def test_zip64(self):
+        """Verify generating an archive with ZIP64 records"""
+        archive = b"".join(zip_stream.ZipStream(force_zip64=True).stream(self.files))
+        self.assertTrue(b"PK\x06\x06" in archive)
+        self.check_archive(archive)
+
+    def test_gzip(self):
+        """Verify adding the uncompressed contents of gzip files without recompressing them"""
+        files = [(scan_reader.compress_scan(file_path), arcname) for file_path, arcname in self.files]
+        for force_zip64 in (False, True):
+            stream = zip_stream.ZipStream(force_zip64=force_zip64)
+            self.check_archive(b"".join(stream.stream(files)))
+            self.assertEqual(0, stream.entries[0].flags & zip_stream.FLAG_DATA_DESCRIPTOR)
+        # Archived as they are if the archive name keeps the extension
+        archive = b"".join(zip_stream.ZipStream().stream([(files[1][0], files[1][1] + ".gz")]))
+        with zipfile.ZipFile(io.BytesIO(archive)) as archive_zip:
+            with open(files[1][0], "rb") as fid:
+                self.assertEqual(fid.read(), archive_zip.read(files[1][1] + ".gz"))
+
+    def test_empty(self):
+        """Verify generating an empty archive"""
+        archive = b"".join(zip_stream.ZipStream().stream([]))
+        with zipfile.ZipFile(io.BytesIO(archive)) as archive_zip:
+            self.assertEqual([], archive_zip.namelist())
+
+if __name__ == "__main__":
+    unittest.main()